@@ -0,0 +1,111 @@
+"""
+In-process load generator for the FastAPI app.
+
+Requests go through httpx's ASGI transport straight into the app, so the numbers cover
+middleware, routing and handlers without network or uvicorn overhead. Each route is hit
+by `--concurrency` concurrent clients and reports p50/p95/p99 latency and throughput.
+The app's storage and log directories go to a temporary directory removed afterwards.
+
+    python benchmarks/bench_api_load.py --requests 2000 --concurrency 32
+    python benchmarks/bench_api_load.py --route "GET /" --route "GET /metrics"
+    python benchmarks/bench_api_load.py --route 'POST /sql/script/stream {"query": "SELECT 1"}'
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+from typing import Optional
+
+import httpx
+
+# common puts music_rec/ on sys.path, import it before the app modules
+from common import add_output_args, latency_stats, save_results
+
+DEFAULT_ROUTES = ["GET /", "GET /metrics"]
+
+
+def parse_route(spec: str) -> tuple:
+    """Parse 'METHOD /path [json body]'."""
+    parts = spec.split(" ", 2)
+    method, path = parts[0].upper(), parts[1]
+    body = json.loads(parts[2]) if len(parts) > 2 else None
+    return method, path, body
+
+
+async def load_route(client: httpx.AsyncClient, method: str, path: str, body: Optional[dict],
+                     n_requests: int, concurrency: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        await client.request(method, path, json=body)
+
+    latencies, statuses = [], {}
+    remaining = n_requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            t_0 = time.perf_counter()
+            response = await client.request(method, path, json=body)
+            latencies.append(time.perf_counter() - t_0)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    t_0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - t_0
+    return {"route": f"{method} {path}",
+            "concurrency": concurrency,
+            "throughput_rps": len(latencies) / wall,
+            "statuses": {str(k): v for k, v in statuses.items()},
+            **latency_stats(latencies)}
+
+
+async def run(args) -> list:
+    from server import music_rec
+
+    results = []
+    transport = httpx.ASGITransport(app=music_rec)
+    async with music_rec.router.lifespan_context(music_rec):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                     timeout=args.timeout) as client:
+            for spec in args.route or DEFAULT_ROUTES:
+                method, path, body = parse_route(spec)
+                for concurrency in args.concurrency:
+                    results.append(await load_route(client, method, path, body,
+                                                    args.requests, concurrency, args.warmup))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser("Load test the FastAPI app in-process")
+    parser.add_argument('--route', action='append', default=None,
+                        help=f'"METHOD /path [json body]", repeatable. (default: {DEFAULT_ROUTES})')
+    parser.add_argument('-n', '--requests', type=int, default=1000,
+                        help='requests per route and concurrency level. (default: %(default)s)')
+    parser.add_argument('-c', '--concurrency', type=int, nargs='+', default=[1, 16],
+                        help='concurrent clients. (default: %(default)s)')
+    parser.add_argument('--warmup', type=int, default=20,
+                        help='untimed requests per route. (default: %(default)s)')
+    parser.add_argument('--timeout', type=float, default=30,
+                        help='request timeout in seconds. (default: %(default)s)')
+    add_output_args(parser)
+    args = parser.parse_args()
+
+    # per request client logs would dominate the measurement
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as storage_dir:
+        # read by core.config when run() imports the server, keeps the lifespan out of volumes/
+        os.environ["ROOT_STORAGE_DIR"] = storage_dir
+        results = asyncio.run(run(args))
+    for res in results:
+        print(f"{res['route']:<30} c={res['concurrency']:<4} {res['throughput_rps']:>9.1f} req/s "
+              f"p50={res['p50_ms']:.2f}ms p95={res['p95_ms']:.2f}ms p99={res['p99_ms']:.2f}ms "
+              f"statuses={res['statuses']}")
+    if not args.no_save:
+        save_results("api_load", results, vars(args), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Cold start import profile of the server module.
+
+Imports `server` in fresh interpreters with `-X importtime` and fails (exit status 1) when
+- the median import time exceeds the budget
+- a heavy module that must be imported lazily (langchain, pandas, spotipy, ...) was loaded
+- the import had side effects such as creating the storage directories
+
+    python benchmarks/bench_startup.py --budget 1.0 --runs 5
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+# common puts music_rec/ on sys.path, import it before the app modules
+from common import REPO_DIR, add_output_args, latency_stats, save_results
+
+LAZY_MODULES = ["langchain_openai", "langchain_core", "pandas", "spotipy", "requests", "psycopg_pool"]
+
+CHILD_SCRIPT = """
+import sys, time, json
+sys.path.insert(0, "music_rec")
+t_0 = time.perf_counter()
+import server  # noqa: F401
+elapsed = time.perf_counter() - t_0
+print(json.dumps({"import_s": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+
+def import_once(env: dict) -> tuple:
+    """Import the server in a fresh interpreter. Returns (stats, importtime lines)."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", CHILD_SCRIPT],
+                          cwd=REPO_DIR, env=env, capture_output=True, text=True, check=True)
+    return json.loads(proc.stdout.strip().splitlines()[-1]), proc.stderr.splitlines()
+
+
+def heaviest_imports(importtime_lines: list, top: int) -> list:
+    """
+    Heaviest imports of the server module by cumulative time from -X importtime output.
+    Lines look like "import time:  self_us | cumulative_us | <indent>module", the indent is the depth.
+    """
+    rows = []
+    for line in importtime_lines:
+        parts = line.split("|")
+        if not line.startswith("import time:") or len(parts) != 3 or "cumulative" in parts[1]:
+            continue
+        name = parts[2][1:]
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        if depth == 1:  # imported directly by server
+            rows.append({"module": name.strip(), "cumulative_ms": int(parts[1]) / 1000})
+    return sorted(rows, key=lambda row: row["cumulative_ms"], reverse=True)[:top]
+
+
+def check_startup(runs: int, budget: float) -> tuple:
+    """
+    Import the server `runs` times in fresh interpreters with an empty storage dir.
+    Returns (latency stats, loaded modules, importtime lines of the last run, failures).
+    """
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        storage_dir = os.path.join(tmp_dir, "storage")
+        env = {**os.environ, "ROOT_STORAGE_DIR": storage_dir, "PYTHONDONTWRITEBYTECODE": "1"}
+        samples, modules, importtime_lines = [], [], []
+        for _ in range(runs):
+            stats, importtime_lines = import_once(env)
+            samples.append(stats["import_s"])
+            modules = stats["modules"]
+        if os.path.exists(storage_dir):
+            failures.append(f"importing server created {storage_dir}, move side effects to the lifespan")
+
+    eager = [name for name in LAZY_MODULES if name in modules]
+    if eager:
+        failures.append(f"modules that must be imported lazily were loaded: {', '.join(eager)}")
+    stats = latency_stats(samples)
+    if stats["p50_ms"] / 1000 > budget:
+        failures.append(f"median import time {stats['p50_ms']:.0f}ms exceeds the {budget * 1000:.0f}ms budget")
+    return stats, modules, importtime_lines, failures
+
+
+def main():
+    parser = argparse.ArgumentParser("Profile the server cold start imports")
+    parser.add_argument('--budget', type=float, default=float(os.getenv("STARTUP_IMPORT_BUDGET_SEC", "1.5")),
+                        help='max median import seconds. (default: $STARTUP_IMPORT_BUDGET_SEC or %(default)s)')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='number of fresh interpreter imports. (default: %(default)s)')
+    parser.add_argument('--top', type=int, default=10,
+                        help='number of heaviest imports to print. (default: %(default)s)')
+    add_output_args(parser)
+    args = parser.parse_args()
+
+    stats, modules, importtime_lines, failures = check_startup(args.runs, args.budget)
+    print(f"server import p50={stats['p50_ms']:.0f}ms max={stats['max_ms']:.0f}ms "
+          f"budget={args.budget * 1000:.0f}ms modules={len(modules)}")
+    heaviest = heaviest_imports(importtime_lines, args.top)
+    for row in heaviest:
+        print(f"  {row['module']:<40} {row['cumulative_ms']:>8.1f}ms")
+    if not args.no_save:
+        save_results("startup", [{"name": "server_import", "modules": len(modules), **stats}],
+                     vars(args), args.output)
+    for failure in failures:
+        print("FAIL:", failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Shared helpers of the benchmark scripts: timing, latency statistics and json result files.
+
+Every result file records the git commit so runs of different commits can be
+compared with benchmarks/compare.py.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+from typing import Callable, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+# the app modules import each other relative to music_rec/
+sys.path.insert(0, os.path.join(REPO_DIR, "music_rec"))
+
+
+def git_commit() -> str:
+    """Short sha of HEAD with a -dirty suffix for uncommitted changes, 'unknown' outside git."""
+    try:
+        sha = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                      cwd=REPO_DIR, text=True, stderr=subprocess.DEVNULL).strip()
+        dirty = subprocess.call(["git", "diff", "--quiet", "HEAD"], cwd=REPO_DIR,
+                                stderr=subprocess.DEVNULL)
+        return sha + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Linear interpolated percentile of unsorted samples."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    pos = (len(ordered) - 1) * pct / 100
+    low = int(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+
+def latency_stats(samples: List[float]) -> Dict[str, float]:
+    """Summary of latency samples in seconds, reported in milliseconds."""
+    return {"n": len(samples),
+            "mean_ms": sum(samples) / len(samples) * 1000 if samples else 0.0,
+            "p50_ms": percentile(samples, 50) * 1000,
+            "p95_ms": percentile(samples, 95) * 1000,
+            "p99_ms": percentile(samples, 99) * 1000,
+            "max_ms": max(samples) * 1000 if samples else 0.0}
+
+
+def time_call(func: Callable, repeat: int = 5, number: int = 0, min_time: float = 0.2) -> Dict[str, float]:
+    """
+    Time `func` like timeit: `repeat` rounds of `number` calls each. When number is 0 it is
+    chosen so a round takes at least `min_time` seconds. Reports per call times.
+    """
+    if not number:
+        number = 1
+        while True:
+            t_0 = time.perf_counter()
+            for _ in range(number):
+                func()
+            if time.perf_counter() - t_0 >= min_time or number >= 1_000_000:
+                break
+            number *= 10
+    rounds = []
+    for _ in range(repeat):
+        t_0 = time.perf_counter()
+        for _ in range(number):
+            func()
+        rounds.append((time.perf_counter() - t_0) / number)
+    return {"number": number, "repeat": repeat,
+            "best_us": min(rounds) * 1e6,
+            "median_us": percentile(rounds, 50) * 1e6}
+
+
+def add_output_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('-o', '--output', type=str, default=None,
+                        help='json result file. (default: benchmarks/results/<name>-<commit>.json)')
+    parser.add_argument('--no-save', action='store_true',
+                        help='only print the results. (default: %(default)s)')
+
+
+def save_results(name: str, results: list, config: dict, output: Optional[str] = None) -> str:
+    """Write benchmark results with run metadata to a json file and return its path."""
+    commit = git_commit()
+    report = {"benchmark": name,
+              "commit": commit,
+              "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "config": config,
+              "results": results}
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{name}-{commit}.json")
+    with open(output, "w", encoding="utf-8") as f_ptr:
+        json.dump(report, f_ptr, indent=2)
+    print("Results written to", output)
+    return output
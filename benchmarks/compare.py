@@ -0,0 +1,63 @@
+"""
+Compare two benchmark result files, e.g. of the parent and the current commit.
+
+Results are matched on their non-metric fields. Exits with status 1 when any metric
+regressed by more than `--threshold` percent.
+
+    python benchmarks/compare.py benchmarks/results/data_layer-abc123.json benchmarks/results/data_layer-def456.json
+"""
+import sys
+import json
+import argparse
+
+LOWER_IS_BETTER = {"best_us", "median_us", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "build_s"}
+HIGHER_IS_BETTER = {"throughput_rps", "rows_per_s", "batch_qps", "recall"}
+IGNORED = {"number", "repeat", "n", "max_ms", "statuses"}
+
+
+def result_key(result: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in result.items()
+                        if k not in LOWER_IS_BETTER | HIGHER_IS_BETTER | IGNORED))
+
+
+def load(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f_ptr:
+        return json.load(f_ptr)
+
+
+def main():
+    parser = argparse.ArgumentParser("Compare two benchmark result files")
+    parser.add_argument('baseline', type=str, help='baseline result json')
+    parser.add_argument('candidate', type=str, help='candidate result json')
+    parser.add_argument('-t', '--threshold', type=float, default=10.0,
+                        help='regression threshold in percent. (default: %(default)s)')
+    args = parser.parse_args()
+
+    baseline, candidate = load(args.baseline), load(args.candidate)
+    print(f"{baseline['benchmark']}: {baseline['commit']} -> {candidate['commit']}")
+    base_results = {result_key(res): res for res in baseline["results"]}
+
+    regressions = 0
+    for res in candidate["results"]:
+        key = result_key(res)
+        base = base_results.get(key)
+        if base is None:
+            continue
+        label = " ".join(f"{k}={v}" for k, v in key)
+        for metric in sorted((LOWER_IS_BETTER | HIGHER_IS_BETTER) & res.keys() & base.keys()):
+            old, new = base[metric], res[metric]
+            if not old:
+                continue
+            change = (new - old) / abs(old) * 100
+            worse = change > args.threshold if metric in LOWER_IS_BETTER else change < -args.threshold
+            regressions += worse
+            flag = "REGRESSION" if worse else ""
+            print(f"{label:<60} {metric:>15} {old:>12.3f} -> {new:>12.3f} ({change:+6.1f}%) {flag}")
+
+    if regressions:
+        print(f"{regressions} metric(s) regressed by more than {args.threshold}%")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
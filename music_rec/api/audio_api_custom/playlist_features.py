@@ -0,0 +1,218 @@
+"""
+Columnar playlist track features with a two tier cache
+
+PlaylistFeatures keeps one numpy array per feature instead of a list of dicts or a
+DataFrame, so recommendation code reads the columns it needs without allocating per
+track objects or importing pandas. `to_pandas` converts at the api edge on request.
+
+Cache tiers, both keyed by playlist id and validated against the Spotify playlist
+snapshot_id which changes with every playlist edit:
+1. per process LRU of PlaylistFeatures
+2. optional .npz files in PLAYLIST_CACHE_DIR shared by workers and restarts
+"""
+import os
+import time
+import logging
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from core.config import (PLAYLIST_CACHE_DIR, PLAYLIST_CACHE_MAX_ENTRIES,
+                         PLAYLIST_CACHE_SNAPSHOT_CHECK_SEC)
+from utils.cache import LRUCache
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger("playlist_features")
+
+PLAYLIST_CACHE_REQUESTS = REGISTRY.counter(
+    "playlist_cache_requests_total", "Playlist feature cache lookups", ["tier", "result"])
+
+# column name -> (DataFrame column name, numpy dtype), missing ints are stored as -1
+FEATURE_COLUMNS = {
+    "track_name": ("Track Name", str),
+    "artists": ("Artists", str),
+    "album_name": ("Album Name", str),
+    "album_id": ("Album ID", str),
+    "track_id": ("Track ID", str),
+    "popularity": ("Popularity", np.int16),
+    "release_date": ("Release Date", str),
+    "explicit": ("Explicit", np.int8),
+    "external_url": ("External URLs", str),
+}
+INT_COLUMNS = {name for name, (_, dtype) in FEATURE_COLUMNS.items() if dtype is not str}
+# Spotify ids are 22 base62 characters, longer ids are accepted for other sources
+MAX_PLAYLIST_ID_LEN = 64
+
+
+class PlaylistFeatures:
+    """
+    Track features of one playlist snapshot stored column wise.
+    String columns are fixed width numpy unicode arrays, missing strings are "".
+    checked_at is the time the snapshot_id was last confirmed with Spotify.
+    """
+    __slots__ = ("playlist_id", "snapshot_id", "columns", "checked_at")
+
+    def __init__(self, playlist_id: str, snapshot_id: Optional[str], columns: Dict[str, np.ndarray],
+                 checked_at: Optional[float] = None):
+        self.playlist_id = playlist_id
+        self.snapshot_id = snapshot_id
+        self.columns = columns
+        self.checked_at = time.time() if checked_at is None else checked_at
+
+    def __len__(self) -> int:
+        return len(self.columns["track_id"])
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.columns[column]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(col.nbytes for col in self.columns.values())
+
+    @classmethod
+    def from_tracks(cls, playlist_id: str, snapshot_id: Optional[str], tracks: Iterable[dict]
+                    ) -> "PlaylistFeatures":
+        """Build the columns from Spotify playlist track items."""
+        values: Dict[str, list] = {name: [] for name in FEATURE_COLUMNS}
+        for item in tracks:
+            track = item.get("track") if item else None
+            if not track:
+                continue
+            album = track.get("album") or {}
+            popularity, explicit = track.get("popularity"), track.get("explicit")
+            values["track_name"].append(track.get("name") or "")
+            values["artists"].append(", ".join(artist["name"] for artist in track.get("artists") or []))
+            values["album_name"].append(album.get("name") or "")
+            values["album_id"].append(album.get("id") or "")
+            values["track_id"].append(track.get("id") or "")
+            values["popularity"].append(-1 if popularity is None else popularity)
+            values["release_date"].append(album.get("release_date") or "")
+            values["explicit"].append(-1 if explicit is None else int(explicit))
+            values["external_url"].append((track.get("external_urls") or {}).get("spotify") or "")
+        columns = {name: np.asarray(values[name], dtype=dtype) for name, (_, dtype) in FEATURE_COLUMNS.items()}
+        return cls(playlist_id, snapshot_id, columns)
+
+    def to_pandas(self, columns: Optional[List[str]] = None):
+        """DataFrame with the original get_playlist_data column names, missing values as None."""
+        import pandas as pd
+
+        data = {}
+        for name in columns or FEATURE_COLUMNS:
+            col, label = self.columns[name], FEATURE_COLUMNS[name][0]
+            if name in INT_COLUMNS:
+                values = col.astype(object)
+                values[col < 0] = None
+                data[label] = pd.array(values, dtype="boolean" if name == "explicit" else "Int64")
+            else:
+                data[label] = np.where(col == "", None, col.astype(object))
+        return pd.DataFrame(data)
+
+    def save(self, path: str) -> None:
+        """Write the columns to an .npz file atomically."""
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, _meta=np.asarray([self.playlist_id, self.snapshot_id or "", str(self.checked_at)]),
+                 **self.columns)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "PlaylistFeatures":
+        with np.load(path, allow_pickle=False) as data:
+            playlist_id, snapshot_id, checked_at = data["_meta"].tolist()
+            columns = {name: data[name] for name in FEATURE_COLUMNS}
+        return cls(playlist_id, snapshot_id or None, columns, float(checked_at))
+
+
+class PlaylistFeatureCache:
+    """
+    LRU of PlaylistFeatures with an optional disk tier. Entries younger than
+    `snapshot_check_sec` are served without asking Spotify, older entries are served
+    after a cheap snapshot_id lookup confirmed the playlist did not change.
+    """
+
+    def __init__(self, max_entries: int = PLAYLIST_CACHE_MAX_ENTRIES, cache_dir: Optional[str] = PLAYLIST_CACHE_DIR,
+                 snapshot_check_sec: float = PLAYLIST_CACHE_SNAPSHOT_CHECK_SEC):
+        self.memory = LRUCache(max_entries)
+        self.cache_dir = cache_dir or None
+        self.snapshot_check_sec = snapshot_check_sec
+
+    def _disk_path(self, playlist_id: str) -> Optional[str]:
+        """
+        Cache file of a playlist, None without a disk tier or for ids that are not plain
+        alphanumeric, so request input such as "../x" never leaves the cache dir.
+        """
+        if self.cache_dir is None or not (
+                0 < len(playlist_id) <= MAX_PLAYLIST_ID_LEN and playlist_id.isascii() and playlist_id.isalnum()):
+            return None
+        return os.path.join(self.cache_dir, f"{playlist_id}.npz")
+
+    def _lookup(self, playlist_id: str) -> Optional[PlaylistFeatures]:
+        features = self.memory.get(playlist_id)
+        if features is not None:
+            PLAYLIST_CACHE_REQUESTS.inc(tier="memory", result="hit")
+            return features
+        PLAYLIST_CACHE_REQUESTS.inc(tier="memory", result="miss")
+        path = self._disk_path(playlist_id)
+        if path is None:
+            return None
+        try:
+            features = PlaylistFeatures.load(path)
+        except FileNotFoundError:
+            PLAYLIST_CACHE_REQUESTS.inc(tier="disk", result="miss")
+            return None
+        except (OSError, ValueError, KeyError) as exception:
+            logger.warning("%s: Unreadable playlist cache file for %s", exception, playlist_id)
+            PLAYLIST_CACHE_REQUESTS.inc(tier="disk", result="miss")
+            return None
+        PLAYLIST_CACHE_REQUESTS.inc(tier="disk", result="hit")
+        self.memory.set(playlist_id, features)
+        return features
+
+    def store(self, features: PlaylistFeatures) -> None:
+        self.memory.set(features.playlist_id, features)
+        path = self._disk_path(features.playlist_id)
+        if path is None:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            features.save(path)
+        except OSError as exception:
+            logger.warning("%s: Could not write playlist cache file for %s", exception, features.playlist_id)
+
+    def get(self, playlist_id: str, get_snapshot_id: Callable[[str], str],
+            fetch: Callable[[str, str], PlaylistFeatures]) -> PlaylistFeatures:
+        """
+        Cached features of a playlist.
+        get_snapshot_id(playlist_id) returns the current snapshot id,
+        fetch(playlist_id, snapshot_id) downloads the features on a miss or a stale snapshot.
+        """
+        cached = self._lookup(playlist_id)
+        if cached is not None and time.time() - cached.checked_at < self.snapshot_check_sec:
+            return cached
+        snapshot_id = get_snapshot_id(playlist_id)
+        if cached is not None and cached.snapshot_id == snapshot_id:
+            cached.checked_at = time.time()
+            return cached
+        PLAYLIST_CACHE_REQUESTS.inc(tier="snapshot", result="stale" if cached is not None else "miss")
+        features = fetch(playlist_id, snapshot_id)
+        self.store(features)
+        return features
+
+    def invalidate(self, playlist_id: str) -> None:
+        self.memory.pop(playlist_id)
+        path = self._disk_path(playlist_id)
+        if path is not None:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+_playlist_cache: Optional[PlaylistFeatureCache] = None
+
+
+def get_playlist_cache() -> PlaylistFeatureCache:
+    """Process wide playlist feature cache."""
+    global _playlist_cache
+    if _playlist_cache is None:
+        _playlist_cache = PlaylistFeatureCache()
+    return _playlist_cache
@@ -0,0 +1,247 @@
+"""
+Background job handlers
+
+A handler receives the job payload and a progress callback `progress(fraction, message)`
+and returns a json serializable result dict. Raising an exception fails the attempt and
+the job is retried until it used up its max_attempts.
+
+Handlers whose retries must not repeat committed work read the checkpoint of the previous
+attempt from `progress.checkpoint` and store a new one with
+`progress.save_checkpoint(conn, state)` before committing their own writes on conn.
+
+Register new job types with the @register_job("job_type") decorator.
+"""
+import os
+import re
+import csv
+import glob
+import json
+import logging
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from core.config import FILE_STORAGE_DIR
+from api.pgsql import insert_bulk_data_into_sql
+
+logger = logging.getLogger("job_handlers")
+
+JobHandler = Callable[[Callable, dict, Callable[[float, str], None]], dict]
+JOB_HANDLERS: Dict[str, JobHandler] = {}
+
+IDENTIFIER_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)?$")
+
+
+def register_job(job_type: str) -> Callable:
+    """Register a handler function for a job type."""
+    def decorator(func: JobHandler) -> JobHandler:
+        JOB_HANDLERS[job_type] = func
+        return func
+    return decorator
+
+
+def storage_path(path: str) -> str:
+    """
+    Resolve a payload path relative to FILE_STORAGE_DIR.
+    Raises ValueError for paths outside of it.
+    """
+    root = os.path.realpath(FILE_STORAGE_DIR)
+    full_path = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, full_path]) != root:
+        raise ValueError(f"Path {path} is outside of the file storage directory")
+    return full_path
+
+
+def sql_identifier(name: str) -> str:
+    """Validate a table or column name taken from a job payload."""
+    if not IDENTIFIER_PATTERN.match(name):
+        raise ValueError(f"Invalid SQL identifier {name}")
+    return name
+
+
+def _read_records(path: str) -> Iterator[Tuple[dict, int]]:
+    """Stream (record, bytes read so far) of a .csv, .jsonl or .json list file."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".json":
+        with open(path, "r", encoding="utf-8") as f_ptr:
+            records = json.load(f_ptr)
+        total_bytes = os.path.getsize(path)
+        for i, record in enumerate(records, 1):
+            yield record, total_bytes * i // len(records)
+        return
+    if ext not in {".csv", ".jsonl"}:
+        raise ValueError(f"Unsupported bulk load file type {ext}")
+
+    bytes_read = 0
+    with open(path, "rb") as f_ptr:
+        def lines():
+            nonlocal bytes_read
+            for raw_line in f_ptr:
+                bytes_read += len(raw_line)
+                yield raw_line.decode("utf-8")
+        if ext == ".csv":
+            for record in csv.DictReader(lines()):
+                yield record, bytes_read
+        else:
+            for line in lines():
+                if line.strip():
+                    yield json.loads(line), bytes_read
+
+
+@register_job("bulk_load")
+def bulk_load(postgres_conn, payload: dict, progress: Callable[[float, str], None]) -> dict:
+    """
+    Load a csv/jsonl/json file from the file storage into a table in batches.
+    payload: {"file": "relative/path.csv", "table": "tracks", "batch_size": 5000,
+              "skip_existing_on": ["track_id"]}
+    skip_existing_on is optional and skips records whose key columns already exist.
+    Every batch commits together with a checkpoint of the records read so far, a retry
+    resumes after the last committed batch.
+    """
+    path = storage_path(payload["file"])
+    table = sql_identifier(payload["table"])
+    batch_size = int(payload.get("batch_size", 5000))
+    skip_existing_on = [sql_identifier(col) for col in payload.get("skip_existing_on") or []]
+    total_bytes = max(os.path.getsize(path), 1)
+
+    checkpoint = getattr(progress, "checkpoint", None) or {}
+    n_done, n_rows, n_skipped = checkpoint.get("records", 0), checkpoint.get("rows", 0), checkpoint.get("skipped", 0)
+    if n_done:
+        logger.info("Resuming bulk load of %s after %d committed records", payload["file"], n_done)
+    with postgres_conn() as conn:
+        batch: List[dict] = []
+        for i, (record, bytes_read) in enumerate(_read_records(path)):
+            if i < n_done:
+                continue
+            batch.append(record)
+            if len(batch) >= batch_size:
+                n_done, n_rows, n_skipped = _insert_batch(conn, progress, table, batch, skip_existing_on,
+                                                          n_done, n_rows, n_skipped)
+                batch = []
+                progress(bytes_read / total_bytes, f"{n_rows} rows loaded, {n_skipped} skipped")
+        if batch:
+            n_done, n_rows, n_skipped = _insert_batch(conn, progress, table, batch, skip_existing_on,
+                                                      n_done, n_rows, n_skipped)
+    progress(1.0, f"{n_rows} rows loaded, {n_skipped} skipped")
+    return {"table": table, "rows": n_rows, "skipped": n_skipped, "bytes": total_bytes}
+
+
+def _insert_batch(conn, progress, table: str, batch: List[dict], skip_existing_on: List[str],
+                  n_done: int, n_rows: int, n_skipped: int) -> Tuple[int, int, int]:
+    """Insert a batch and its checkpoint in one transaction on conn. Returns the new totals."""
+    result = insert_bulk_data_into_sql(lambda: nullcontext(conn), table, batch, commit=False,
+                                       skip_existing_on=skip_existing_on or None)
+    if result["status"] != "success":
+        raise RuntimeError(result["message"])
+    n_done, n_rows, n_skipped = (n_done + len(batch), n_rows + result["data"]["inserted"],
+                                 n_skipped + result["data"]["skipped"])
+    save_checkpoint = getattr(progress, "save_checkpoint", None)
+    if save_checkpoint is not None:
+        save_checkpoint(conn, {"records": n_done, "rows": n_rows, "skipped": n_skipped})
+    conn.commit()
+    return n_done, n_rows, n_skipped
+
+
+@register_job("load_playlists")
+def load_playlists(postgres_conn, payload: dict, progress: Callable[[float, str], None]) -> dict:
+    """
+    Load million playlist dataset slice files into the partitioned playlist_tracks table.
+    payload: {"files": "spotify-million/data/mpd.slice.*.json", "create_indexes": true, "workers": 4}
+    Up to `workers` files (default PLAYLIST_TRACKS_LOAD_WORKERS) are read and COPYed in
+    parallel, each on its own pooled connection.
+    """
+    from core.config import PLAYLIST_TRACKS_LOAD_WORKERS
+    from api.playlist_tracks import create_playlist_tracks_indexes, create_playlist_tracks_table, \
+        load_playlist_tracks, playlist_rows
+
+    def load_file(path: str) -> Tuple[int, int]:
+        with open(path, "r", encoding="utf-8") as f_ptr:
+            playlists = json.load(f_ptr)["playlists"]
+        # replace makes retries of a partially loaded file idempotent
+        result = load_playlist_tracks(postgres_conn, playlist_rows(playlists), max_workers=1, replace=True)
+        if result["status"] != "success":
+            raise RuntimeError(f"{os.path.basename(path)}: {result['message']}")
+        return len(playlists), result["data"]["inserted"]
+
+    paths = sorted(glob.glob(storage_path(payload["files"])))
+    if not paths:
+        raise ValueError(f"No files match {payload['files']}")
+    result = create_playlist_tracks_table(postgres_conn)
+    if result["status"] != "success":
+        raise RuntimeError(result["message"])
+
+    n_playlists, n_rows = 0, 0
+    workers = max(int(payload.get("workers", PLAYLIST_TRACKS_LOAD_WORKERS)), 1)
+    with ThreadPoolExecutor(max_workers=min(workers, len(paths))) as executor:
+        futures = [executor.submit(load_file, path) for path in paths]
+        try:
+            for i, future in enumerate(as_completed(futures), 1):
+                file_playlists, file_rows = future.result()
+                n_playlists, n_rows = n_playlists + file_playlists, n_rows + file_rows
+                progress(i / len(paths) * 0.9, f"{i}/{len(paths)} files, {n_rows} rows loaded")
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    if payload.get("create_indexes", True):
+        progress(0.9, "creating indexes")
+        result = create_playlist_tracks_indexes(postgres_conn)
+        if result["status"] != "success":
+            raise RuntimeError(result["message"])
+    return {"files": len(paths), "playlists": n_playlists, "rows": n_rows}
+
+
+@register_job("export_table")
+def export_table(postgres_conn, payload: dict, progress: Callable[[float, str], None]) -> dict:
+    """
+    Export a table or a subset of its columns to a csv file in the file storage with COPY.
+    payload: {"table": "tracks", "columns": ["track_id", "name"], "file": "exports/tracks.csv"}
+    """
+    table = sql_identifier(payload["table"])
+    columns = [sql_identifier(col) for col in payload.get("columns") or []]
+    path = storage_path(payload.get("file") or os.path.join("exports", f"{table}.csv"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    select = f"SELECT {', '.join(columns) if columns else '*'} FROM {table}"
+    n_bytes, n_lines = 0, 0
+    with postgres_conn() as conn:
+        with conn.cursor() as cursor:
+            # planner row estimate, only used for the progress fraction
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+            row = cursor.fetchone()
+            est_rows = max(row[0], 1) if row and row[0] else 1
+            with open(path, "wb") as f_ptr:
+                with cursor.copy(f"COPY ({select}) TO STDOUT WITH (FORMAT CSV, HEADER)") as copy:
+                    for i, data in enumerate(copy, 1):
+                        data = bytes(data)
+                        f_ptr.write(data)
+                        n_bytes += len(data)
+                        n_lines += data.count(b"\n")
+                        if i % 1000 == 0:
+                            progress(min(n_lines / est_rows, 0.99), f"{n_lines} rows exported")
+    progress(1.0, f"{n_lines} rows exported")
+    return {"table": table, "file": os.path.relpath(path, os.path.realpath(FILE_STORAGE_DIR)),
+            "rows": max(n_lines - 1, 0), "bytes": n_bytes}
+
+
+@register_job("publish_embeddings")
+def publish_track_embeddings(postgres_conn, payload: dict, progress: Callable[[float, str], None]) -> dict:
+    """
+    Publish trained track embeddings from the file storage as a new embedding store version.
+    payload: {"ids_file": "embeddings/ids.json", "embeddings_file": "embeddings/embeddings.npy",
+              "version": optional name, letters, digits and . _ - only}
+    """
+    import numpy as np
+    from api.vector_store.embedding_store import VERSION_PATTERN, publish_embeddings
+
+    version = payload.get("version")
+    # the payload comes from the request body, the version becomes a directory name
+    if version is not None and (not isinstance(version, str) or not VERSION_PATTERN.match(version)
+                                or ".." in version):
+        raise ValueError(f"Invalid embedding version name {version!r}")
+    with open(storage_path(payload["ids_file"]), "r", encoding="utf-8") as f_ptr:
+        ids = json.load(f_ptr)
+    embeddings = np.load(storage_path(payload["embeddings_file"]), mmap_mode="r")
+    progress(0.5, f"loaded {len(ids)} embeddings")
+    version = publish_embeddings(ids, embeddings, version=version)
+    return {"version": version, "rows": len(ids), "dim": int(embeddings.shape[1])}
@@ -0,0 +1,269 @@
+"""
+PostgreSQL backed job queue
+
+Jobs are rows of the jobs table. Workers claim the next runnable job with
+SELECT ... FOR UPDATE SKIP LOCKED, so any number of worker processes on any number
+of nodes can poll the same table without handing out a job twice. Workers heartbeat
+their running job from a timer thread and jobs whose worker stopped heartbeating are
+claimed again, or failed once they used up their max_attempts.
+Handlers can save a checkpoint in the transaction of their own writes, so a retry
+resumes after the last committed step.
+"""
+from typing import Optional
+import logging
+import psycopg
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+
+logger = logging.getLogger('job_queue')
+
+JOBS_TABLE = "jobs"
+JOBS_TABLE_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {JOBS_TABLE} (
+    id BIGSERIAL PRIMARY KEY,
+    job_type TEXT NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{{}}',
+    status TEXT NOT NULL DEFAULT 'queued',
+    priority INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    progress REAL NOT NULL DEFAULT 0,
+    progress_message TEXT,
+    result JSONB,
+    error TEXT,
+    checkpoint JSONB,
+    locked_by TEXT,
+    run_after TIMESTAMPTZ NOT NULL DEFAULT now(),
+    heartbeat_at TIMESTAMPTZ,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ
+);
+ALTER TABLE {JOBS_TABLE} ADD COLUMN IF NOT EXISTS checkpoint JSONB;
+CREATE INDEX IF NOT EXISTS {JOBS_TABLE}_runnable_idx
+    ON {JOBS_TABLE} (priority DESC, id) WHERE status IN ('queued', 'running');
+"""
+JOB_COLUMNS = ("id, job_type, payload, status, priority, attempts, max_attempts, progress, "
+               "progress_message, result, error, checkpoint, locked_by, run_after, heartbeat_at, "
+               "created_at, started_at, finished_at")
+
+
+def create_jobs_table(postgres_conn) -> dict:
+    """
+    Create the jobs table and its index if they do not exist.
+    """
+    try:
+        with postgres_conn() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(JOBS_TABLE_SCHEMA)
+                conn.commit()
+                return {"status": "success", "message": "Jobs table ready."}
+    except psycopg.Error as exception:
+        logger.error("%s: Jobs table creation failed ❌", exception)
+        return {"status": "failed", "message": f"Jobs table creation error: {exception}"}
+
+
+def enqueue_job(postgres_conn, job_type: str, payload: dict, priority: int = 0,
+                max_attempts: int = 3) -> dict:
+    """
+    Add a job to the queue.
+    """
+    query = (f"INSERT INTO {JOBS_TABLE} (job_type, payload, priority, max_attempts) "
+             f"VALUES (%s, %s, %s, %s) RETURNING {JOB_COLUMNS}")
+    try:
+        with postgres_conn() as conn:
+            with conn.cursor(row_factory=dict_row) as cursor:
+                cursor.execute(query, (job_type, Jsonb(payload), priority, max_attempts))
+                job = cursor.fetchone()
+                conn.commit()
+                logger.info("Job %s of type %s queued.✅️", job["id"], job_type)
+                return {"status": "success", "message": f"Job {job['id']} queued", "data": job}
+    except psycopg.Error as exception:
+        logger.error("%s: Job submission failed ❌", exception)
+        return {"status": "failed", "message": f"Job submission error: {exception}"}
+
+
+def claim_job(postgres_conn, worker_id: str, job_types: Optional[list] = None,
+              stale_after_sec: float = 300) -> Optional[dict]:
+    """
+    Claim the next runnable job for this worker, None when the queue is empty.
+    Running jobs without a heartbeat for `stale_after_sec` are considered abandoned and reclaimed,
+    abandoned jobs that used up their max_attempts, e.g. because they crash their worker, are failed.
+    """
+    type_filter = "AND job_type = ANY(%(job_types)s)" if job_types else ""
+    fail_abandoned = f"""
+        UPDATE {JOBS_TABLE} SET status = 'failed', finished_at = now(), locked_by = NULL,
+            error = 'Worker ' || locked_by || ' stopped heartbeating on attempt ' || attempts || '/' || max_attempts
+        WHERE status = 'running' AND attempts >= max_attempts
+            AND heartbeat_at < now() - make_interval(secs => %(stale)s)
+        RETURNING id"""
+    query = f"""
+        UPDATE {JOBS_TABLE} SET status = 'running', attempts = attempts + 1, locked_by = %(worker_id)s,
+            started_at = now(), heartbeat_at = now(), error = NULL
+        WHERE id = (
+            SELECT id FROM {JOBS_TABLE}
+            WHERE ((status = 'queued' AND run_after <= now())
+                   OR (status = 'running' AND attempts < max_attempts
+                       AND heartbeat_at < now() - make_interval(secs => %(stale)s)))
+                {type_filter}
+            ORDER BY priority DESC, id
+            FOR UPDATE SKIP LOCKED
+            LIMIT 1)
+        RETURNING {JOB_COLUMNS}"""
+    try:
+        with postgres_conn() as conn:
+            with conn.cursor(row_factory=dict_row) as cursor:
+                cursor.execute(fail_abandoned, {"stale": stale_after_sec})
+                for row in cursor.fetchall():
+                    logger.error("Job %s failed permanently ❌: its worker stopped heartbeating", row["id"])
+                cursor.execute(query, {"worker_id": worker_id, "job_types": job_types, "stale": stale_after_sec})
+                job = cursor.fetchone()
+                conn.commit()
+                return job
+    except psycopg.Error as exception:
+        logger.error("%s: Job claim failed ❌", exception)
+        return None
+
+
+def update_job_progress(postgres_conn, job_id: int, worker_id: str, progress: float,
+                        message: Optional[str] = None) -> bool:
+    """
+    Record the progress of a running job, which is also its heartbeat.
+    Returns False when the job is no longer owned by this worker.
+    """
+    query = (f"UPDATE {JOBS_TABLE} SET progress = %s, progress_message = COALESCE(%s, progress_message), "
+             f"heartbeat_at = now() WHERE id = %s AND locked_by = %s AND status = 'running'")
+    try:
+        with postgres_conn() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(query, (min(max(progress, 0.0), 1.0), message, job_id, worker_id))
+                conn.commit()
+                return cursor.rowcount == 1
+    except psycopg.Error as exception:
+        logger.error("%s: Job %s progress update failed ❌", exception, job_id)
+        return True
+
+
+def heartbeat_job(postgres_conn, job_id: int, worker_id: str) -> bool:
+    """
+    Refresh the heartbeat of a running job.
+    Returns False when the job is no longer owned by this worker.
+    """
+    query = (f"UPDATE {JOBS_TABLE} SET heartbeat_at = now() "
+             f"WHERE id = %s AND locked_by = %s AND status = 'running'")
+    try:
+        with postgres_conn() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(query, (job_id, worker_id))
+                conn.commit()
+                return cursor.rowcount == 1
+    except psycopg.Error as exception:
+        logger.error("%s: Job %s heartbeat failed ❌", exception, job_id)
+        return True
+
+
+def save_job_checkpoint(cursor, job_id: int, worker_id: str, checkpoint: dict) -> bool:
+    """
+    Save the checkpoint of a running job with `cursor` without committing, so it commits
+    together with the work it describes. Returns False when the job is no longer owned by this worker.
+    """
+    cursor.execute(f"UPDATE {JOBS_TABLE} SET checkpoint = %s, heartbeat_at = now() "
+                   f"WHERE id = %s AND locked_by = %s AND status = 'running'",
+                   (Jsonb(checkpoint), job_id, worker_id))
+    return cursor.rowcount == 1
+
+
+def complete_job(postgres_conn, job_id: int, worker_id: str, result: Optional[dict] = None) -> dict:
+    """
+    Mark a running job as succeeded with its result.
+    Fails when the job is no longer owned by this worker, e.g. after it was reclaimed.
+    """
+    query = (f"UPDATE {JOBS_TABLE} SET status = 'succeeded', progress = 1, result = %s, "
+             f"finished_at = now(), locked_by = NULL WHERE id = %s AND locked_by = %s AND status = 'running'")
+    try:
+        with postgres_conn() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(query, (Jsonb(result or {}), job_id, worker_id))
+                conn.commit()
+                if cursor.rowcount != 1:
+                    logger.warning("Job %s finished but is no longer owned by worker %s, result dropped",
+                                   job_id, worker_id)
+                    return {"status": "failed", "message": f"Job {job_id} is no longer owned by worker {worker_id}"}
+                logger.info("Job %s succeeded.✅️", job_id)
+                return {"status": "success", "message": f"Job {job_id} succeeded"}
+    except psycopg.Error as exception:
+        logger.error("%s: Job %s completion failed ❌", exception, job_id)
+        return {"status": "failed", "message": f"Job completion error: {exception}"}
+
+
+def fail_job(postgres_conn, job_id: int, worker_id: str, error: str, retry_base_sec: float = 10) -> dict:
+    """
+    Record a job failure. The job is queued again with exponential backoff
+    until it used up its max_attempts, then it is marked as failed.
+    """
+    query = f"""
+        UPDATE {JOBS_TABLE} SET
+            status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+            run_after = now() + make_interval(secs => %s * power(2, attempts - 1)),
+            finished_at = CASE WHEN attempts < max_attempts THEN NULL ELSE now() END,
+            error = %s, locked_by = NULL
+        WHERE id = %s AND locked_by = %s AND status = 'running'
+        RETURNING status, attempts, max_attempts"""
+    try:
+        with postgres_conn() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(query, (retry_base_sec, error, job_id, worker_id))
+                row = cursor.fetchone()
+                conn.commit()
+                if row is None:
+                    logger.warning("Job %s failed but is no longer owned by worker %s: %s", job_id, worker_id, error)
+                    return {"status": "failed", "message": f"Job {job_id} is no longer owned by worker {worker_id}"}
+                if row[0] == "queued":
+                    logger.warning("Job %s failed on attempt %s/%s, retrying: %s", job_id, row[1], row[2], error)
+                else:
+                    logger.error("Job %s failed permanently ❌: %s", job_id, error)
+                return {"status": "success", "message": f"Job {job_id} failure recorded"}
+    except psycopg.Error as exception:
+        logger.error("%s: Job %s failure update failed ❌", exception, job_id)
+        return {"status": "failed", "message": f"Job failure update error: {exception}"}
+
+
+def get_job(postgres_conn, job_id: int) -> dict:
+    """
+    Query a job by its id.
+    """
+    try:
+        with postgres_conn() as conn:
+            with conn.cursor(row_factory=dict_row) as cursor:
+                cursor.execute(f"SELECT {JOB_COLUMNS} FROM {JOBS_TABLE} WHERE id = %s", (job_id,))
+                job = cursor.fetchone()
+                if job is None:
+                    return {"status": "failed", "message": f"Job with id: {job_id} does not exist"}
+                return {"status": "success", "message": f"Job {job_id} retrieved", "data": job}
+    except psycopg.Error as exception:
+        logger.error("%s: Job retrieval failed ❌", exception)
+        return {"status": "failed", "message": "Job retrieval error"}
+
+
+def list_jobs(postgres_conn, status: Optional[str] = None, job_type: Optional[str] = None,
+              limit: int = 50) -> dict:
+    """
+    Query the most recent jobs, optionally filtered by status and type.
+    """
+    conditions, params = [], []
+    if status:
+        conditions.append("status = %s")
+        params.append(status)
+    if job_type:
+        conditions.append("job_type = %s")
+        params.append(job_type)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f"SELECT {JOB_COLUMNS} FROM {JOBS_TABLE} {where} ORDER BY id DESC LIMIT %s"
+    try:
+        with postgres_conn() as conn:
+            with conn.cursor(row_factory=dict_row) as cursor:
+                cursor.execute(query, (*params, limit))
+                return {"status": "success", "message": "Jobs retrieved", "data": cursor.fetchall()}
+    except psycopg.Error as exception:
+        logger.error("%s: Job listing failed ❌", exception)
+        return {"status": "failed", "message": "Job listing error"}
@@ -1,6 +1,11 @@
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.pydantic_v1 import BaseModel, Field
+import time
+
+from pydantic import BaseModel, Field
+
+from utils.metrics import REGISTRY
+
+LLM_REQUEST_DURATION = REGISTRY.histogram(
+    "llm_request_duration_seconds", "LLM call latency", ["task", "model", "status"])
 
 
 class SQLResponse(BaseModel):
@@ -28,6 +33,10 @@ def text_to_sql(
     """
     assert "model" in llm_config, "Model must be provided (model: ...)"
     assert "temperature" in llm_config, "Temperature must be provided (temperature: ...)"
+    # langchain is slow to import, load it on the first text2sql call instead of server startup
+    from langchain_openai import ChatOpenAI
+    from langchain_core.prompts import ChatPromptTemplate
+
     text2sql_prompt = ChatPromptTemplate.from_messages(
         [
             ("system", text2sql_cfg_obj.sql_prompt_template),
@@ -44,11 +53,35 @@ def text_to_sql(
         table_info=text2sql_cfg_obj.table_info, top_k=top_k) | text2sql_model
 
     # return text2sql_runnable.to_json()['kwargs']['first'].json()
-    sql_query = text2sql_runnable \
-        .with_config({"run_name": "text2sql_runnable"}) \
-        .invoke({"input": question,
-                 "table_name": text2sql_cfg_obj.table_name})
+    t_0 = time.perf_counter()
+    status = "error"
+    try:
+        sql_query = text2sql_runnable \
+            .with_config({"run_name": "text2sql_runnable"}) \
+            .invoke({"input": question,
+                     "table_name": text2sql_cfg_obj.table_name})
+        status = "success"
+    finally:
+        LLM_REQUEST_DURATION.observe(time.perf_counter() - t_0, task="text2sql",
+                                     model=llm_config["model"], status=status)
 
     my_sql_query = sql_query.SQLQuery
     my_sql_query.replace("\"", '')
     return my_sql_query
+
+
+def run_text_to_sql(
+        question: str,
+        text2sql_cfg_obj: object,
+        llm_config: dict,
+        postgres_conn,
+        top_k: int = 5,
+        verbose: bool = True) -> dict:
+    """
+    Convert plain text to sql and run it through the SQL guard, which enforces top_k
+    as a LIMIT, rejects expensive plans and applies a statement timeout.
+    """
+    from api.sql_guard import run_guarded_query
+
+    sql_query = text_to_sql(question, text2sql_cfg_obj, llm_config, top_k=top_k, verbose=verbose)
+    return run_guarded_query(postgres_conn, sql_query, limit=top_k)
@@ -1,10 +1,48 @@
-from typing import List, Tuple
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
 import re
+import time
+import uuid
 import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import psycopg
 
+from utils.common import blank_sql_literals
+from utils.metrics import REGISTRY
+
 logger = logging.getLogger('postgresql_api')
 
+# rows per COPY of the parallel partitioned load
+COPY_CHUNK_ROWS = 10000
+
+DB_QUERIES = REGISTRY.counter(
+    "db_queries_total", "PostgreSQL api calls by operation and result status", ["operation", "status"])
+DB_QUERY_DURATION = REGISTRY.histogram(
+    "db_query_duration_seconds", "PostgreSQL api call duration including connection checkout", ["operation"])
+
+
+def _observe_query(operation: str) -> Callable:
+    """
+    Record the count, result status and duration of a PostgreSQL api call.
+    Dict results report their "status" key, other results count as success.
+    Only decorate public entry points, helpers they delegate to must stay undecorated
+    so one call is counted once.
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            t_0 = time.perf_counter()
+            status = "error"
+            try:
+                result = func(*args, **kwargs)
+                status = result.get("status", "success") if isinstance(result, dict) else "success"
+                return result
+            finally:
+                DB_QUERY_DURATION.observe(time.perf_counter() - t_0, operation=operation)
+                DB_QUERIES.inc(operation=operation, status=status)
+        return wrapper
+    return decorator
+
 
 def sep_query_and_params(query: str) -> Tuple[str, Tuple]:
     """
@@ -35,13 +73,16 @@ def sep_query_and_params(query: str) -> Tuple[str, Tuple]:
 def is_sql_allowed(sql_script: str, restricted_cmds: List = None) -> bool:
     """
     Simple validation to check for restricted commands in SQL script.
+    Commands match as whole words outside of string literals and comments only, so columns such
+    as updated_at and values such as 'Drop It Like It''s Hot' stay allowed.
     """
-    for command in restricted_cmds:
-        if command in sql_script.upper():
-            return False
-    return True
+    if not restricted_cmds:
+        return True
+    pattern = re.compile(r"\b(" + "|".join(map(re.escape, restricted_cmds)) + r")\b", re.IGNORECASE)
+    return pattern.search(blank_sql_literals(sql_script)) is None
 
 
+@_observe_query("run_sql_script")
 def run_sql_script(postgres_conn, sql_script: str, params: tuple = None, commit: bool = True) -> dict:
     """
     Execute an arbitrary SQL script with parameter binding.
@@ -70,35 +111,234 @@ def run_sql_script(postgres_conn, sql_script: str, params: tuple = None, commit:
         return {"status": "failed", "message": f"PostgreSQL script execution error: {exception}"}
 
 
-def insert_bulk_data_into_sql(postgres_conn, tb_name, data_dicts: list, commit: bool = True) -> dict:
+def stream_sql_script(postgres_conn, sql_script: str, params: tuple = None,
+                      batch_size: int = 1000) -> Iterator[dict]:
+    """
+    Run a read only query with a server side cursor and yield its result incrementally:
+    {"columns": [...]} first, then {"rows": [...]} batches of at most batch_size rows
+    and finally {"status": "success", "row_count": n} or {"status": "failed", "message": ...}.
+    Only batch_size rows are held in memory, the connection is released when the
+    generator is exhausted or closed.
+    """
+    disabled_cmds = ['DROP', 'DELETE', 'TRUNCATE', 'ALTER', 'INSERT', 'UPDATE']
+    if not is_sql_allowed(sql_script, disabled_cmds):
+        logger.error("Restricted SQL script detected. Execution aborted. ❌")
+        yield {"status": "failed", "message": "Restricted SQL script detected."}
+        return
+
+    t_0 = time.perf_counter()
+    status, row_count = "error", 0
+    try:
+        with postgres_conn() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SET TRANSACTION READ ONLY")
+            with conn.cursor(name=f"stream_{uuid.uuid4().hex[:12]}") as cursor:
+                cursor.itersize = batch_size
+                cursor.execute(sql_script, params or None)
+                yield {"columns": [col.name for col in cursor.description or []]}
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    row_count += len(rows)
+                    yield {"rows": rows}
+            conn.rollback()
+        status = "success"
+        logger.info("SQL script streamed %d rows. ✅️", row_count)
+        yield {"status": "success", "row_count": row_count}
+    except psycopg.Error as exception:
+        status = "failed"
+        logger.error("%s: SQL script streaming failed ❌", exception)
+        yield {"status": "failed", "message": f"PostgreSQL script execution error: {exception}"}
+    except GeneratorExit:
+        status = "cancelled"
+        raise
+    finally:
+        # generators cannot use _observe_query, record the stream once it ended
+        DB_QUERY_DURATION.observe(time.perf_counter() - t_0, operation="stream_sql_script")
+        DB_QUERIES.inc(operation="stream_sql_script", status=status)
+
+
+def _select_existing_keys(cursor, tb_name: str, key_columns: Sequence[str], keys: Sequence[tuple],
+                          missing: bool = False) -> List[int]:
+    """
+    Stream the candidate keys with COPY into a temp table typed like the key columns of
+    tb_name and find the keys that exist in tb_name, or that are missing with missing=True,
+    with one semi/anti-join. Returns the index of the first occurrence of each such key.
+    Keys are matched with = so the join can use the primary key or unique index of tb_name,
+    keys with a NULL part never exist, like for UNIQUE constraints.
+    The temp table is dropped when the transaction ends.
+    """
+    tmp_name = f"_keys_{uuid.uuid4().hex[:12]}"
+    cols = ', '.join(key_columns)
+    match = ' AND '.join(f"t.{col} = k.{col}" for col in key_columns)
+    cursor.execute(f"CREATE TEMP TABLE {tmp_name} ON COMMIT DROP AS "
+                   f"SELECT 0 AS key_idx, {cols} FROM {tb_name} WITH NO DATA")
+    with cursor.copy(f"COPY {tmp_name} (key_idx, {cols}) FROM STDIN") as copy:
+        for idx, key in enumerate(keys):
+            copy.write_row((idx, *key))
+    # temp tables have no statistics, without them the planner cannot choose between
+    # index probes for few keys and a hash join for many
+    cursor.execute(f"ANALYZE {tmp_name}")
+    cursor.execute(f"SELECT min(k.key_idx) FROM {tmp_name} k "
+                   f"WHERE {'NOT ' if missing else ''}EXISTS (SELECT 1 FROM {tb_name} t WHERE {match}) "
+                   f"GROUP BY {', '.join('k.' + col for col in key_columns)}")
+    return sorted(row[0] for row in cursor.fetchall())
+
+
+@_observe_query("entries_exist_bulk")
+def entries_exist_bulk(postgres_conn, tb_name: str, key_columns: Sequence[str], keys: Iterable[tuple],
+                       missing: bool = False) -> dict:
+    """
+    Check which of many keys exist in a PostgreSQL table in one anti-join instead of
+    one entries_exist round trip per key. Keys are tuples of values of `key_columns`.
+    Returns the existing keys in "data", or the missing keys with missing=True.
+    """
+    keys = list(keys)
+    if not keys:
+        return {"status": "success", "message": "No keys provided", "data": []}
+    try:
+        with postgres_conn() as conn:
+            with conn.cursor() as cursor:
+                found = [keys[idx] for idx in _select_existing_keys(cursor, tb_name, key_columns, keys, missing)]
+                # read only, drops the temp table
+                conn.rollback()
+                logger.info("%d of %d keys %s in PostgreSQL db.✅️", len(found), len(keys),
+                            "missing" if missing else "exist")
+                return {"status": "success",
+                        "message": f"{len(found)} of {len(keys)} keys {'missing' if missing else 'exist'}",
+                        "data": found}
+    except psycopg.Error as exception:
+        logger.error("%s: PostgreSQL bulk key lookup failed ❌", exception)
+        return {"status": "failed", "message": f"PostgreSQL bulk key lookup error: {exception}"}
+
+
+@_observe_query("insert_bulk")
+def insert_bulk_data_into_sql(postgres_conn, tb_name, data_dicts: list, commit: bool = True,
+                              skip_existing_on: Optional[Sequence[str]] = None,
+                              partition_of: Optional[Callable[[dict], str]] = None, max_workers: int = 4) -> dict:
     """
     Insert multiple records into a PostgreSQL table with param binding.
+    With skip_existing_on, records whose values of these columns already exist in the table
+    or earlier in the batch are skipped, checked with one anti-join for the whole batch.
+    With partition_of, records are COPYed into the partitions of tb_name in parallel,
+    see copy_partitioned_data_into_sql.
     """
     if not data_dicts:
         return {"status": "failed", "message": "No data provided"}
+    if partition_of is not None:
+        if skip_existing_on or not commit:
+            return {"status": "failed",
+                    "message": "partition_of cannot be combined with skip_existing_on or commit=False"}
+        return _copy_partitioned(postgres_conn, data_dicts, partition_of, max_workers)
 
     col_names = ', '.join(data_dicts[0].keys())
     placeholders = ', '.join(['%s'] * len(data_dicts[0]))
     query = f"INSERT INTO {tb_name} ({col_names}) VALUES ({placeholders})".replace("'", '')
 
-    values = [tuple(data_dict.values()) for data_dict in data_dicts]
-
     try:
         with postgres_conn() as conn:
             with conn.cursor() as cursor:
+                if skip_existing_on:
+                    batch_keys = [tuple(data_dict[col] for col in skip_existing_on) for data_dict in data_dicts]
+                    new_idx = _select_existing_keys(cursor, tb_name, skip_existing_on, batch_keys, missing=True)
+                    new_dicts = [data_dicts[idx] for idx in new_idx]
+                    logger.info("Skipping %d existing or duplicate records.", len(data_dicts) - len(new_dicts))
+                else:
+                    new_dicts = data_dicts
+                values = [tuple(data_dict.values()) for data_dict in new_dicts]
+                skipped = len(data_dicts) - len(values)
+
                 logger.info("Attempting to bulk insert %d records into PostgreSQL db.", len(values))
-                cursor.executemany(query, values)
+                if values:
+                    cursor.executemany(query, values)
                 if commit:
                     conn.commit()
                     logger.info("%d records bulk inserted into PostgreSQL db.✅️", len(values))
-                    return {"status": "success", "message": "Bulk records inserted into PostgreSQL db"}
+                    return {"status": "success", "message": "Bulk records inserted into PostgreSQL db",
+                            "data": {"inserted": len(values), "skipped": skipped}}
                 logger.info("Bulk record insertion waiting to be committed to PostgreSQL db.🕓")
-                return {"status": "success", "message": "Bulk record insertion waiting to be committed."}
+                return {"status": "success", "message": "Bulk record insertion waiting to be committed.",
+                        "data": {"inserted": len(values), "skipped": skipped}}
     except psycopg.Error as exception:
         logger.error("%s: PostgreSQL bulk record insertion failed ❌", exception)
         return {"status": "failed", "message": f"PostgreSQL bulk record insertion error: {str(exception)}"}
 
 
+@_observe_query("copy_bulk")
+def copy_bulk_data_into_sql(postgres_conn, tb_name, data_dicts: list, commit: bool = True) -> dict:
+    """
+    Insert multiple records into a PostgreSQL table with COPY, which streams all rows
+    in one statement and is much faster than INSERT for large batches.
+    """
+    return _copy_rows(postgres_conn, tb_name, data_dicts, commit)
+
+
+def _copy_rows(postgres_conn, tb_name, data_dicts: list, commit: bool = True) -> dict:
+    """copy_bulk_data_into_sql without the metrics, for the bulk insert helpers."""
+    if not data_dicts:
+        return {"status": "failed", "message": "No data provided"}
+
+    columns = list(data_dicts[0].keys())
+    try:
+        with postgres_conn() as conn:
+            with conn.cursor() as cursor:
+                with cursor.copy(f"COPY {tb_name} ({', '.join(columns)}) FROM STDIN") as copy:
+                    for data_dict in data_dicts:
+                        copy.write_row(tuple(data_dict[col] for col in columns))
+                if commit:
+                    conn.commit()
+                    logger.info("%d records copied into %s.✅️", len(data_dicts), tb_name)
+                    return {"status": "success", "message": f"Bulk records copied into {tb_name}",
+                            "data": {"inserted": len(data_dicts)}}
+                logger.info("Bulk record copy waiting to be committed to PostgreSQL db.🕓")
+                return {"status": "success", "message": "Bulk record copy waiting to be committed.",
+                        "data": {"inserted": len(data_dicts)}}
+    except psycopg.Error as exception:
+        logger.error("%s: PostgreSQL bulk record copy into %s failed ❌", exception, tb_name)
+        return {"status": "failed", "message": f"PostgreSQL bulk record copy error: {str(exception)}"}
+
+
+@_observe_query("copy_partitioned")
+def copy_partitioned_data_into_sql(postgres_conn, data_dicts: list, partition_of: Callable[[dict], str],
+                                   max_workers: int = 4, chunk_rows: int = COPY_CHUNK_ROWS) -> dict:
+    """
+    COPY records straight into the partitions of a partitioned table in parallel.
+    partition_of(record) returns the partition table name. The records of each partition
+    are split into chunks of chunk_rows, every chunk is COPYed on its own pooled connection,
+    so a batch falling into a single partition is still loaded in parallel.
+    Each chunk commits on its own, a failed chunk does not roll back the others.
+    """
+    return _copy_partitioned(postgres_conn, data_dicts, partition_of, max_workers, chunk_rows)
+
+
+def _copy_partitioned(postgres_conn, data_dicts: list, partition_of: Callable[[dict], str],
+                      max_workers: int = 4, chunk_rows: int = COPY_CHUNK_ROWS) -> dict:
+    if not data_dicts:
+        return {"status": "failed", "message": "No data provided"}
+
+    groups = {}
+    for data_dict in data_dicts:
+        groups.setdefault(partition_of(data_dict), []).append(data_dict)
+    chunks = [(partition, rows[start:start + chunk_rows])
+              for partition, rows in groups.items() for start in range(0, len(rows), chunk_rows)]
+    with ThreadPoolExecutor(max_workers=max(min(max_workers, len(chunks)), 1)) as executor:
+        results = list(executor.map(lambda chunk: _copy_rows(postgres_conn, *chunk), chunks))
+
+    failed, inserted = {}, 0
+    for (partition, rows), res in zip(chunks, results):
+        if res["status"] == "success":
+            inserted += len(rows)
+        else:
+            failed[partition] = res["message"]
+    data = {"inserted": inserted, "partitions": len(groups), "chunks": len(chunks), "failed_partitions": failed}
+    if failed:
+        return {"status": "failed", "message": f"Copy into {len(failed)} of {len(groups)} partitions failed",
+                "data": data}
+    return {"status": "success", "message": f"Bulk records copied into {len(groups)} partitions", "data": data}
+
+
+@_observe_query("insert")
 def insert_data_into_sql(postgres_conn, tb_name, data_dict: dict, commit: bool = True) -> dict:
     """
     Insert a record into a PostgreSQL table with param binding.
@@ -123,6 +363,7 @@ def insert_data_into_sql(postgres_conn, tb_name, data_dict: dict, commit: bool =
         return {"status": "failed", "message": "PostgreSQL record insertion error"}
 
 
+@_observe_query("select_by_id")
 def select_data_from_sql_with_id(postgres_conn, tb_name, data_id: int) -> dict:
     """
     Query PostgreSQL db to get the data record using the unique data_id.
@@ -145,6 +386,7 @@ def select_data_from_sql_with_id(postgres_conn, tb_name, data_id: int) -> dict:
         return {"status": "failed", "message": "PostgreSQL record retrieval error"}
 
 
+@_observe_query("select_all")
 def select_all_data_from_sql(postgres_conn, tb_name) -> dict:
     """
     Query PostgreSQL db to get all data.
@@ -166,6 +408,7 @@ def select_all_data_from_sql(postgres_conn, tb_name) -> dict:
         return {"status": "failed", "message": "PostgreSQL record retrieval error"}
 
 
+@_observe_query("delete_by_id")
 def delete_data_from_sql_with_id(postgres_conn, tb_name, data_id: int, commit: bool = True) -> dict:
     """
     Delete a record from PostgreSQL db using the unique data_id.
@@ -193,6 +436,7 @@ def delete_data_from_sql_with_id(postgres_conn, tb_name, data_id: int, commit: b
         return {"status": "failed", "message": "PostgreSQL record deletion error"}
 
 
+@_observe_query("table_exists")
 def table_exists(postgres_conn, tb_name: str) -> bool:
     """Check if table exists in the PostgreSQL database"""
     try:
@@ -206,6 +450,7 @@ def table_exists(postgres_conn, tb_name: str) -> bool:
         return False
 
 
+@_observe_query("entries_exist")
 def entries_exist(postgres_conn, tb_name: str, conditions: dict, logic: str = 'AND') -> bool:
     """
     Check if entries exist in a PostgreSQL table.
@@ -0,0 +1,201 @@
+"""
+Partitioned playlist_tracks fact table of the Spotify million playlist dataset
+
+playlist_tracks holds one row per (playlist, position) and is range partitioned on pid in
+partitions of PLAYLIST_TRACKS_PARTITION_SIZE playlists, created on demand as playlists are
+loaded. Rows are COPYed straight into their partition in parallel and queries filtering on
+pid only scan the matching partitions (partition pruning).
+"""
+from typing import Iterable, List, Optional
+import logging
+import psycopg
+
+from core.config import PLAYLIST_TRACKS_PARTITION_SIZE, PLAYLIST_TRACKS_LOAD_WORKERS
+from api.pgsql import insert_bulk_data_into_sql
+from models.model import LogText2SQLConfig
+
+logger = logging.getLogger('playlist_tracks')
+
+PLAYLIST_TRACKS_TABLE = "playlist_tracks"
+PLAYLIST_TRACKS_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {PLAYLIST_TRACKS_TABLE} (
+    pid INTEGER NOT NULL,
+    pos INTEGER NOT NULL,
+    track_uri TEXT NOT NULL,
+    track_name TEXT,
+    artist_uri TEXT,
+    artist_name TEXT,
+    album_uri TEXT,
+    album_name TEXT,
+    duration_ms INTEGER,
+    PRIMARY KEY (pid, pos)
+) PARTITION BY RANGE (pid)
+"""
+PLAYLIST_TRACKS_COLUMNS = ("pid", "pos", "track_uri", "track_name", "artist_uri", "artist_name",
+                           "album_uri", "album_name", "duration_ms")
+# created on the parent, postgres creates and attaches the matching index of every partition
+PLAYLIST_TRACKS_INDEXES = {
+    f"{PLAYLIST_TRACKS_TABLE}_track_uri_idx": "(track_uri)",
+    f"{PLAYLIST_TRACKS_TABLE}_artist_uri_idx": "(artist_uri)",
+}
+
+
+def partition_bounds(pid: int, partition_size: int = PLAYLIST_TRACKS_PARTITION_SIZE) -> tuple:
+    """Inclusive lower and exclusive upper pid bound of the partition holding pid."""
+    lower = pid // partition_size * partition_size
+    return lower, lower + partition_size
+
+
+def partition_name(pid: int, partition_size: int = PLAYLIST_TRACKS_PARTITION_SIZE) -> str:
+    """Name of the partition holding pid."""
+    return f"{PLAYLIST_TRACKS_TABLE}_p{partition_bounds(pid, partition_size)[0]}"
+
+
+def create_playlist_tracks_table(postgres_conn) -> dict:
+    """
+    Create the partitioned playlist_tracks parent table if it does not exist.
+    """
+    try:
+        with postgres_conn() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(PLAYLIST_TRACKS_SCHEMA)
+                conn.commit()
+                return {"status": "success", "message": f"{PLAYLIST_TRACKS_TABLE} table ready."}
+    except psycopg.Error as exception:
+        logger.error("%s: %s table creation failed ❌", exception, PLAYLIST_TRACKS_TABLE)
+        return {"status": "failed", "message": f"{PLAYLIST_TRACKS_TABLE} table creation error: {exception}"}
+
+
+def ensure_partitions(postgres_conn, pids: Iterable[int],
+                      partition_size: int = PLAYLIST_TRACKS_PARTITION_SIZE) -> dict:
+    """
+    Create the partitions covering pids that do not exist yet. Concurrent loads of
+    playlists in the same new partition are serialized with an advisory lock, otherwise
+    CREATE TABLE IF NOT EXISTS can fail with a duplicate key error in the catalog.
+    """
+    bounds = sorted({partition_bounds(pid, partition_size) for pid in pids})
+    try:
+        with postgres_conn() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"{PLAYLIST_TRACKS_TABLE}_partitions",))
+                for lower, upper in bounds:
+                    cursor.execute(
+                        f"CREATE TABLE IF NOT EXISTS {PLAYLIST_TRACKS_TABLE}_p{lower} "
+                        f"PARTITION OF {PLAYLIST_TRACKS_TABLE} FOR VALUES FROM ({lower}) TO ({upper})")
+                conn.commit()
+                return {"status": "success", "message": f"{len(bounds)} partitions ready.",
+                        "data": [f"{PLAYLIST_TRACKS_TABLE}_p{lower}" for lower, _ in bounds]}
+    except psycopg.Error as exception:
+        logger.error("%s: %s partition creation failed ❌", exception, PLAYLIST_TRACKS_TABLE)
+        return {"status": "failed", "message": f"Partition creation error: {exception}"}
+
+
+def create_playlist_tracks_indexes(postgres_conn) -> dict:
+    """
+    Create the secondary indexes on all partitions. Run after large loads,
+    building an index once is cheaper than maintaining it row by row during COPY.
+    """
+    try:
+        with postgres_conn() as conn:
+            with conn.cursor() as cursor:
+                for index_name, columns in PLAYLIST_TRACKS_INDEXES.items():
+                    cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {PLAYLIST_TRACKS_TABLE} {columns}")
+                cursor.execute(f"ANALYZE {PLAYLIST_TRACKS_TABLE}")
+                conn.commit()
+                return {"status": "success", "message": f"{PLAYLIST_TRACKS_TABLE} indexes ready."}
+    except psycopg.Error as exception:
+        logger.error("%s: %s index creation failed ❌", exception, PLAYLIST_TRACKS_TABLE)
+        return {"status": "failed", "message": f"{PLAYLIST_TRACKS_TABLE} index creation error: {exception}"}
+
+
+def playlist_rows(playlists: Iterable[dict]) -> List[dict]:
+    """Flatten million playlist dataset playlists into playlist_tracks rows."""
+    return [{"pid": playlist["pid"],
+             "pos": track["pos"],
+             "track_uri": track["track_uri"],
+             "track_name": track.get("track_name"),
+             "artist_uri": track.get("artist_uri"),
+             "artist_name": track.get("artist_name"),
+             "album_uri": track.get("album_uri"),
+             "album_name": track.get("album_name"),
+             "duration_ms": track.get("duration_ms")}
+            for playlist in playlists for track in playlist["tracks"]]
+
+
+def delete_playlist_tracks(postgres_conn, pids: List[int]) -> dict:
+    """
+    Delete the tracks of playlists, only the partitions holding them are scanned.
+    """
+    try:
+        with postgres_conn() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {PLAYLIST_TRACKS_TABLE} WHERE pid = ANY(%s)", (list(pids),))
+                conn.commit()
+                return {"status": "success", "message": f"{cursor.rowcount} playlist tracks deleted"}
+    except psycopg.Error as exception:
+        logger.error("%s: Playlist tracks deletion failed ❌", exception)
+        return {"status": "failed", "message": f"Playlist tracks deletion error: {exception}"}
+
+
+def load_playlist_tracks(postgres_conn, rows: List[dict], max_workers: int = PLAYLIST_TRACKS_LOAD_WORKERS,
+                         partition_size: int = PLAYLIST_TRACKS_PARTITION_SIZE, replace: bool = False) -> dict:
+    """
+    Create the missing partitions and COPY the rows into them in parallel.
+    With replace, existing tracks of the loaded playlists are deleted first, which makes
+    reloading a partially loaded file safe.
+    """
+    if not rows:
+        return {"status": "failed", "message": "No data provided"}
+    pids = {row["pid"] for row in rows}
+    result = ensure_partitions(postgres_conn, pids, partition_size)
+    if result["status"] == "success" and replace:
+        result = delete_playlist_tracks(postgres_conn, sorted(pids))
+    if result["status"] != "success":
+        return result
+    return insert_bulk_data_into_sql(postgres_conn, PLAYLIST_TRACKS_TABLE, rows, max_workers=max_workers,
+                                     partition_of=lambda row: partition_name(row["pid"], partition_size))
+
+
+def select_playlist_tracks(postgres_conn, pids: List[int], limit: Optional[int] = None) -> dict:
+    """
+    Query the tracks of playlists ordered by position. Filtering on pid lets postgres
+    prune the scan to the partitions holding these playlists.
+    """
+    query = (f"SELECT {', '.join(PLAYLIST_TRACKS_COLUMNS)} FROM {PLAYLIST_TRACKS_TABLE} "
+             f"WHERE pid = ANY(%s) ORDER BY pid, pos")
+    params = [list(pids)]
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+    try:
+        with postgres_conn() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(query, params)
+                return {"status": "success", "message": "Playlist tracks retrieved", "data": cursor.fetchall()}
+    except psycopg.Error as exception:
+        logger.error("%s: Playlist tracks retrieval failed ❌", exception)
+        return {"status": "failed", "message": "Playlist tracks retrieval error"}
+
+
+class PlaylistTracksText2SQLConfig(LogText2SQLConfig):
+    """
+    text to sql config of the playlist_tracks table, used by the /sql/qa endpoint
+    """
+    table_name = PLAYLIST_TRACKS_TABLE
+    table_schema = PLAYLIST_TRACKS_SCHEMA
+    table_examples = (
+        "Question: Which artists appear in the most playlists?\n"
+        f"SQLQuery: SELECT artist_name, COUNT(DISTINCT pid) AS playlists FROM {PLAYLIST_TRACKS_TABLE} "
+        "GROUP BY artist_name ORDER BY playlists DESC LIMIT 5\n"
+        "Question: List the tracks of playlist 42.\n"
+        f"SQLQuery: SELECT pos, track_name, artist_name FROM {PLAYLIST_TRACKS_TABLE} "
+        "WHERE pid = 42 ORDER BY pos LIMIT 5"
+    )
+    table_info = f"{PLAYLIST_TRACKS_SCHEMA}\n{table_examples}"
+    top_k = 5
+    sql_prompt_template = (
+        "You are a PostgreSQL expert. Given an input question, write one syntactically correct "
+        "read only PostgreSQL query answering it. Unless the question asks for a specific number "
+        "of rows, return at most {top_k} rows with LIMIT. Only use the columns of this table, "
+        "filter on pid where possible so only the matching partitions are scanned:\n{table_info}"
+    )
@@ -0,0 +1,365 @@
+"""
+Stateful "continue this playlist" recommendation sessions
+
+A session is created from seed tracks and keeps two decayed embedding sums: accepted
+tracks pull the next recommendations towards them and skipped tracks push them away.
+Feedback updates the sums in O(dim) instead of recomputing them from the whole history,
+and next tracks are searched in the in-process vector index, so the hot path reads only
+memory-mapped embeddings and never queries the database.
+
+Sessions live in a bounded LRU with an idle ttl that restarts on every access. With
+RECOMMENDATION_SESSION_DIR set, every created or updated session is written through to an
+.npz file. A worker loads sessions it does not hold from these files and reloads a held
+session whose file another worker replaced, so all server workers share the sessions.
+Reads refresh the file mtime, files idle for longer than the ttl are expired sessions:
+they are deleted when loaded and by a periodic sweep of the directory.
+"""
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import deque
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.config import (
+    RECOMMENDATION_SESSION_BACKEND, RECOMMENDATION_SESSION_DECAY, RECOMMENDATION_SESSION_DIR,
+    RECOMMENDATION_SESSION_MAX_ENTRIES, RECOMMENDATION_SESSION_SKIP_WEIGHT, RECOMMENDATION_SESSION_TTL_SEC)
+from api.vector_store.embedding_store import get_embedding_store
+from api.vector_store.vector_index import VectorIndex, get_vector_index
+from utils.cache import LRUCache
+
+logger = logging.getLogger("recommendation_sessions")
+
+# feedback events kept per session to rebuild its vectors for a new embedding version
+MAX_SESSION_EVENTS = 500
+SESSION_ID_LEN = 32
+# seconds between sweeps of the persist dir for expired session files
+SESSION_SWEEP_INTERVAL_SEC = 600
+# share of the ttl after which a read refreshes the mtime of the session file
+SESSION_TOUCH_FRACTION = 0.1
+
+EmbeddingLookup = Callable[[Sequence], Tuple[List, np.ndarray]]
+
+
+class RecommendationSession:
+    """
+    Compact state of one session: the decayed accepted/skipped embedding sums, the seen
+    track ids excluded from recommendations and the events needed to replay them.
+    """
+    __slots__ = ("session_id", "embedding_version", "seed_ids", "events", "seen",
+                 "accepted", "skipped", "created_at", "updated_at", "file_stamp", "lock")
+
+    def __init__(self, session_id: str, seed_ids: List[str], embedding_version: Optional[str],
+                 created_at: Optional[float] = None):
+        self.session_id = session_id
+        self.embedding_version = embedding_version
+        self.seed_ids = seed_ids
+        self.events: deque = deque(maxlen=MAX_SESSION_EVENTS)
+        self.seen = set(seed_ids)
+        self.accepted: Optional[np.ndarray] = None
+        self.skipped: Optional[np.ndarray] = None
+        self.created_at = time.time() if created_at is None else created_at
+        self.updated_at = self.created_at
+        # (inode, mtime) of the persisted file this state was written to or read from
+        self.file_stamp: Optional[tuple] = None
+        self.lock = threading.Lock()
+
+    def reset_vectors(self, dim: int) -> None:
+        self.accepted = np.zeros(dim, dtype=np.float32)
+        self.skipped = np.zeros(dim, dtype=np.float32)
+
+    def apply(self, embedding: Optional[np.ndarray], accepted: bool, decay: float, skip_weight: float) -> None:
+        """Fold one feedback embedding into the decayed sums."""
+        if embedding is None:
+            return
+        if accepted:
+            self.accepted *= decay
+            self.accepted += embedding
+        else:
+            self.skipped *= decay
+            self.skipped += skip_weight * embedding
+
+    def query_vector(self) -> np.ndarray:
+        """Direction of the next recommendations."""
+        query = _unit(self.accepted) - _unit(self.skipped)
+        return query if np.any(query) else self.accepted
+
+    def to_arrays(self) -> dict:
+        """Arrays for np.savez, fixed width strings so loading needs no pickle."""
+        return {"meta": np.asarray([self.session_id, self.embedding_version or "", str(self.created_at),
+                                    str(self.updated_at)]),
+                "seed_ids": np.asarray(self.seed_ids, dtype=str),
+                "event_ids": np.asarray([track_id for track_id, _ in self.events], dtype=str),
+                "event_accepted": np.asarray([ok for _, ok in self.events], dtype=bool),
+                "seen": np.asarray(sorted(self.seen), dtype=str),
+                "accepted": self.accepted, "skipped": self.skipped}
+
+    @classmethod
+    def from_arrays(cls, data) -> "RecommendationSession":
+        meta = data["meta"].tolist()
+        session_id, version, created_at = meta[:3]
+        session = cls(session_id, data["seed_ids"].tolist(), version or None, float(created_at))
+        # files written before updated_at was stored
+        session.updated_at = float(meta[3]) if len(meta) > 3 else session.created_at
+        session.events.extend(zip(data["event_ids"].tolist(), data["event_accepted"].tolist()))
+        session.seen = set(data["seen"].tolist())
+        session.accepted, session.skipped = data["accepted"], data["skipped"]
+        return session
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SessionRecommender:
+    """
+    Creates, updates and serves recommendation sessions.
+    lookup(track_ids) returns (found_ids, embeddings) and index searches the same embeddings,
+    by default the embedding store and the RECOMMENDATION_SESSION_BACKEND vector index.
+    """
+
+    def __init__(self,
+                 lookup: Optional[EmbeddingLookup] = None,
+                 index: Optional[Callable[[], VectorIndex]] = None,
+                 version: Optional[Callable[[], Optional[str]]] = None,
+                 max_entries: int = RECOMMENDATION_SESSION_MAX_ENTRIES,
+                 ttl: float = RECOMMENDATION_SESSION_TTL_SEC,
+                 persist_dir: Optional[str] = RECOMMENDATION_SESSION_DIR,
+                 decay: float = RECOMMENDATION_SESSION_DECAY,
+                 skip_weight: float = RECOMMENDATION_SESSION_SKIP_WEIGHT):
+        if lookup is None or version is None:
+            store = get_embedding_store()
+            lookup = lookup or store.get_many
+            version = version or (lambda: store.version)
+        self.lookup = lookup
+        self.version = version
+        self.index = index or (lambda: get_vector_index(RECOMMENDATION_SESSION_BACKEND))
+        self.sessions = LRUCache(max_entries, default_ttl=ttl or None, sliding=True,
+                                 on_expire=lambda _session_id, session: self._persist_unsaved(session))
+        self.persist_dir = persist_dir or None
+        self.ttl = ttl or None
+        self._last_sweep = time.monotonic()
+        self.decay = decay
+        self.skip_weight = skip_weight
+
+    def _path(self, session_id: str) -> str:
+        return os.path.join(self.persist_dir, f"{session_id}.npz")
+
+    def _store(self, session: RecommendationSession) -> None:
+        evicted = self.sessions.set(session.session_id, session)
+        if evicted is not None:
+            self._persist_unsaved(evicted[1])
+
+    def _file_stamp(self, session_id: str) -> Optional[tuple]:
+        """(inode, mtime) of a persisted session, each write replaces the file with a new inode."""
+        try:
+            stat = os.stat(self._path(session_id))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _persist(self, session: RecommendationSession) -> None:
+        if self.persist_dir is None or session.accepted is None:
+            return
+        try:
+            os.makedirs(self.persist_dir, exist_ok=True)
+            tmp_path = f"{self._path(session.session_id)}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+            with session.lock:
+                np.savez(tmp_path, **session.to_arrays())
+                os.replace(tmp_path, self._path(session.session_id))
+                session.file_stamp = self._file_stamp(session.session_id)
+        except OSError as exception:
+            session.file_stamp = None
+            logger.warning("%s: Could not persist session %s", exception, session.session_id)
+
+    def _persist_unsaved(self, session: RecommendationSession) -> None:
+        """
+        Persist a session dropped from memory if its write through failed. A saved session is
+        not written again, another worker may have replaced its file with a newer state.
+        """
+        if session.file_stamp is None:
+            self._persist(session)
+
+    def _remove_file(self, session_id: str) -> bool:
+        try:
+            os.remove(self._path(session_id))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _load(self, session_id: str) -> Optional[RecommendationSession]:
+        """
+        Persisted session, None if there is none, it is unreadable or it was idle for longer
+        than the ttl, in which case its file is deleted.
+        """
+        try:
+            stamp = self._file_stamp(session_id)
+            with np.load(self._path(session_id), allow_pickle=False) as data:
+                session = RecommendationSession.from_arrays(data)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as exception:
+            logger.warning("%s: Unreadable persisted session %s", exception, session_id)
+            return None
+        # the file mtime is the last read, updated_at the last feedback
+        if self.ttl and stamp and time.time() - max(session.updated_at, stamp[1] / 1e9) > self.ttl:
+            self._remove_file(session_id)
+            logger.info("Session %s expired", session_id)
+            return None
+        session.file_stamp = stamp
+        return session
+
+    def _touch(self, session: RecommendationSession) -> None:
+        """Refresh the mtime of the session file once a share of the ttl passed since the last write."""
+        if not self.ttl or session.file_stamp is None:
+            return
+        if time.time() - session.file_stamp[1] / 1e9 < self.ttl * SESSION_TOUCH_FRACTION:
+            return
+        with session.lock:
+            try:
+                os.utime(self._path(session.session_id))
+            except FileNotFoundError:
+                return
+            session.file_stamp = self._file_stamp(session.session_id)
+
+    def sweep_expired(self) -> int:
+        """Delete the session files idle for longer than the ttl. Returns the number of deleted files."""
+        self._last_sweep = time.monotonic()
+        if self.persist_dir is None or not self.ttl:
+            return 0
+        removed = 0
+        cutoff = time.time() - self.ttl
+        try:
+            entries = list(os.scandir(self.persist_dir))
+        except FileNotFoundError:
+            return 0
+        for entry in entries:
+            # left over .tmp.npz files of crashed writes expire the same way
+            if not entry.name.endswith(".npz"):
+                continue
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        if removed:
+            logger.info("Removed %d expired recommendation session files", removed)
+        return removed
+
+    def _rebuild(self, session: RecommendationSession) -> None:
+        """
+        Recompute the vectors of a session by replaying its seeds, in playlist order so the
+        last seed tracks weigh the most, and then its feedback events.
+        """
+        seed_ids, seed_embeddings = self.lookup(session.seed_ids)
+        if not len(seed_ids):
+            raise LookupError("None of the seed tracks have embeddings")
+        session.reset_vectors(seed_embeddings.shape[1])
+        for embedding in seed_embeddings:
+            session.apply(embedding, True, self.decay, self.skip_weight)
+        found_ids, embeddings = self.lookup([track_id for track_id, _ in session.events])
+        by_id = dict(zip(found_ids, embeddings))
+        for track_id, accepted in session.events:
+            session.apply(by_id.get(track_id), accepted, self.decay, self.skip_weight)
+        session.embedding_version = self.version()
+
+    def create(self, seed_ids: Iterable[str]) -> RecommendationSession:
+        """
+        Start a session from seed tracks. Raises LookupError when no seed track has an embedding.
+        """
+        seed_ids = list(dict.fromkeys(seed_ids))
+        session = RecommendationSession(uuid.uuid4().hex, seed_ids, self.version())
+        self._rebuild(session)
+        self._store(session)
+        self._persist(session)
+        if time.monotonic() - self._last_sweep > SESSION_SWEEP_INTERVAL_SEC:
+            self.sweep_expired()
+        logger.info("Session %s created from %d seed tracks", session.session_id, len(seed_ids))
+        return session
+
+    def get(self, session_id: str) -> Optional[RecommendationSession]:
+        """
+        Active session, None if unknown or expired. With a persist dir the session is read
+        from its file unless the copy in memory is the latest one written to it.
+        """
+        session = self.sessions.get(session_id)
+        if self.persist_dir is None:
+            return session
+        if len(session_id) != SESSION_ID_LEN or not session_id.isalnum():
+            return None
+        if session is not None:
+            stamp = self._file_stamp(session_id)
+            if stamp is None and session.file_stamp is not None:
+                # deleted by another worker
+                self.sessions.pop(session_id)
+                return None
+            if stamp is None or stamp == session.file_stamp:
+                self._touch(session)
+                return session
+        session = self._load(session_id)
+        if session is not None:
+            self._store(session)
+            self._touch(session)
+        return session
+
+    def feedback(self, session: RecommendationSession, track_id: str, accepted: bool) -> None:
+        """Fold an accepted or skipped track into the session."""
+        embedding = self.lookup([track_id])[1]
+        with session.lock:
+            session.events.append((track_id, accepted))
+            session.seen.add(track_id)
+            session.apply(embedding[0] if len(embedding) else None, accepted, self.decay, self.skip_weight)
+            session.updated_at = time.time()
+        self._persist(session)
+
+    def recommend(self, session: RecommendationSession, k: int = 10) -> List[Tuple[str, float]]:
+        """Next k unseen tracks of the session as [(track_id, score), ...]."""
+        with session.lock:
+            if session.embedding_version != self.version():
+                self._rebuild(session)
+            query = session.query_vector()
+            seen = list(session.seen)
+        return self.index().search(query, k=k, exclude=seen)[0]
+
+    def delete(self, session_id: str) -> bool:
+        found = self.sessions.pop(session_id) is not None
+        if self.persist_dir is not None:
+            found = self._remove_file(session_id) or found
+        return found
+
+    def persist_all(self) -> int:
+        """Write the sessions in memory whose write through failed, e.g. on shutdown."""
+        if self.persist_dir is None:
+            return 0
+        # expired sessions are persisted by the on_expire hook
+        self.sessions.expire()
+        sessions = [session for _, session in self.sessions.items() if session.file_stamp is None]
+        for session in sessions:
+            self._persist(session)
+        logger.info("Persisted %d unsaved recommendation sessions", len(sessions))
+        return len(sessions)
+
+
+_recommender: Optional[SessionRecommender] = None
+_recommender_lock = threading.Lock()
+
+
+def get_session_recommender() -> SessionRecommender:
+    """Process wide session recommender over the embedding store."""
+    global _recommender
+    if _recommender is None:
+        with _recommender_lock:
+            if _recommender is None:
+                _recommender = SessionRecommender()
+    return _recommender
+
+
+def close_session_recommender() -> None:
+    """Persist the sessions of this process if the recommender was used."""
+    if _recommender is not None:
+        _recommender.persist_all()
@@ -0,0 +1,127 @@
+"""
+Pre-execution guard for generated SQL
+
+LLM generated queries run against the shared database, so before execution a query is
+- stripped of comments and restricted to a single read only SELECT/WITH statement, string
+  literals are ignored by these checks
+- given a LIMIT when it has none, and an existing LIMIT is capped at max_rows
+- planned with EXPLAIN (FORMAT JSON) and rejected when the estimated cost exceeds max_cost
+- run in a read only transaction with a per query statement_timeout
+"""
+from typing import Optional
+import re
+import json
+import logging
+import psycopg
+
+from core.config import SQL_GUARD_MAX_COST, SQL_GUARD_MAX_ROWS, SQL_GUARD_STATEMENT_TIMEOUT_MS
+from utils.common import blank_sql_literals, strip_sql_comments
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger('sql_guard')
+
+SQL_GUARD_DECISIONS = REGISTRY.counter(
+    "sql_guard_decisions_total", "Generated SQL guard decisions", ["decision"])
+
+# whole words only, so columns such as created_at or last_updated stay allowed
+RESTRICTED_CMDS_PATTERN = re.compile(
+    r"\b(DROP|DELETE|TRUNCATE|ALTER|INSERT|UPDATE|CREATE|GRANT|REVOKE|COPY|CALL|DO)\b", re.IGNORECASE)
+READ_QUERY_PATTERN = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+# a LIMIT clause ending the statement, with an optional OFFSET on either side
+TRAILING_LIMIT_PATTERN = re.compile(
+    r"\bLIMIT\s+(\d+|ALL)(\s+OFFSET\s+\d+)?\s*$|\bOFFSET\s+\d+\s+LIMIT\s+(\d+|ALL)\s*$", re.IGNORECASE)
+
+
+class SQLGuardError(ValueError):
+    """Raised for queries the guard refuses to run."""
+
+
+def normalize_query(sql_query: str) -> str:
+    """
+    Strip comments, surrounding whitespace and trailing semicolons, reject multiple statements
+    and anything but a read only query. Keywords inside string literals are not commands.
+    """
+    sql_query = strip_sql_comments(sql_query).strip().rstrip(";").strip()
+    code = blank_sql_literals(sql_query)
+    if ";" in code:
+        raise SQLGuardError("Only a single SQL statement is allowed.")
+    if not READ_QUERY_PATTERN.match(code) or RESTRICTED_CMDS_PATTERN.search(code):
+        raise SQLGuardError("Only read only SELECT queries are allowed.")
+    return sql_query
+
+
+def apply_limit(sql_query: str, limit: int, max_rows: int) -> str:
+    """
+    Cap a trailing LIMIT (or LIMIT ALL) at max_rows. Any other query, including queries
+    ending in FETCH FIRST ... ROWS ONLY or OFFSET, is wrapped as
+    SELECT * FROM (<query>) LIMIT limit, which is valid whatever the query ends with.
+    """
+    match = TRAILING_LIMIT_PATTERN.search(sql_query)
+    if match is None:
+        return f"SELECT * FROM ({sql_query}) AS _guarded LIMIT {min(limit, max_rows)}"
+    value = match.group(1) or match.group(3)
+    if value.upper() == "ALL" or int(value) > max_rows:
+        start, end = match.span(1) if match.group(1) else match.span(3)
+        return f"{sql_query[:start]}{max_rows}{sql_query[end:]}"
+    return sql_query
+
+
+def explain_query(cursor, sql_query: str, params: Optional[tuple] = None) -> dict:
+    """Planner estimate of a query: {"total_cost": ..., "plan_rows": ..., "node_type": ...}."""
+    cursor.execute(f"EXPLAIN (FORMAT JSON) {sql_query}", params)
+    plan = cursor.fetchone()[0]
+    # the json column may arrive parsed or as text depending on the type adapters
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    root = plan[0]["Plan"]
+    return {"total_cost": root["Total Cost"], "plan_rows": root["Plan Rows"], "node_type": root["Node Type"]}
+
+
+def run_guarded_query(postgres_conn, sql_query: str, params: Optional[tuple] = None, limit: int = 5,
+                      max_rows: int = SQL_GUARD_MAX_ROWS, max_cost: float = SQL_GUARD_MAX_COST,
+                      timeout_ms: int = SQL_GUARD_STATEMENT_TIMEOUT_MS) -> dict:
+    """
+    Run a generated SELECT with the guard. `limit` is injected when the query has no LIMIT,
+    e.g. the top_k of the text2sql prompt. Returns the executed query and plan estimate
+    next to the rows in "data".
+    """
+    try:
+        normalized_query = normalize_query(sql_query)
+    except SQLGuardError as exception:
+        SQL_GUARD_DECISIONS.inc(decision="rejected_statement")
+        logger.warning("%s: Generated SQL rejected ❌: %s", exception, sql_query)
+        return {"status": "failed", "message": str(exception)}
+    guarded_query = apply_limit(normalized_query, limit, max_rows)
+    limited = guarded_query != normalized_query
+
+    try:
+        with postgres_conn() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SET TRANSACTION READ ONLY")
+                # set_config(..., true) only lasts until the end of this transaction
+                cursor.execute("SELECT set_config('statement_timeout', %s, true)", (str(int(timeout_ms)),))
+                estimate = explain_query(cursor, guarded_query, params)
+                if estimate["total_cost"] > max_cost:
+                    conn.rollback()
+                    SQL_GUARD_DECISIONS.inc(decision="rejected_cost")
+                    logger.warning("Generated SQL rejected, estimated cost %.0f exceeds %.0f ❌: %s",
+                                   estimate["total_cost"], max_cost, guarded_query)
+                    return {"status": "failed",
+                            "message": f"Query too expensive: estimated cost {estimate['total_cost']:.0f} "
+                                       f"exceeds {max_cost:.0f}. Add filters on indexed columns.",
+                            "data": {"query": guarded_query, "estimate": estimate}}
+                cursor.execute(guarded_query, params)
+                rows = cursor.fetchall()
+                conn.rollback()
+                SQL_GUARD_DECISIONS.inc(decision="limited" if limited else "allowed")
+                logger.info("Generated SQL returned %d rows. ✅️", len(rows))
+                return {"status": "success", "message": "Generated SQL executed successfully.",
+                        "data": {"query": guarded_query, "estimate": estimate, "rows": rows}}
+    except psycopg.errors.QueryCanceled as exception:
+        SQL_GUARD_DECISIONS.inc(decision="timeout")
+        logger.warning("%s: Generated SQL cancelled after %sms ❌", exception, timeout_ms)
+        return {"status": "failed", "message": f"Query exceeded the {timeout_ms}ms statement timeout."}
+    except psycopg.Error as exception:
+        SQL_GUARD_DECISIONS.inc(decision="error")
+        logger.error("%s: Generated SQL execution failed ❌", exception)
+        return {"status": "failed", "message": f"PostgreSQL script execution error: {exception}"}
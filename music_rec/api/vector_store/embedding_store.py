@@ -0,0 +1,316 @@
+"""
+Memory-mapped track embedding store
+
+On-disk layout under the store directory:
+
+    CURRENT                      name of the active version
+    versions/<version>/
+        embeddings.f32           flat row-major float32 matrix (n_rows x dim)
+        ids.npy                  track ids in row order
+        id_index.npy             track ids sorted for binary search
+        id_rows.npy              row number of each entry in id_index.npy
+        meta.json                {"version", "dim", "count", "dtype", "created_at"}
+
+All arrays are opened read-only with mmap so every worker process shares the
+same physical pages through the OS page cache instead of holding a heap copy.
+A new version is written to a temporary directory, renamed into place and then
+activated by atomically replacing CURRENT, so readers never see a partial write.
+"""
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import logging
+import threading
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.config import (
+    EMBEDDING_STORE_DIR, EMBEDDING_STORE_REFRESH_SEC, EMBEDDING_STORE_KEEP_VERSIONS)
+
+logger = logging.getLogger("embedding_store")
+
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+EMBEDDINGS_FILE = "embeddings.f32"
+IDS_FILE = "ids.npy"
+ID_INDEX_FILE = "id_index.npy"
+ID_ROWS_FILE = "id_rows.npy"
+META_FILE = "meta.json"
+TMP_PREFIX = ".tmp-"
+# staging directories older than this are left over from crashed publishes
+STALE_TMP_SEC = 3600
+# version names are directory names under versions/, no path separators or ..
+VERSION_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+
+
+def _fsync_path(path: str) -> None:
+    """Flush a file or directory entry to disk."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _encode_ids(ids: Iterable) -> np.ndarray:
+    """Encode track ids as a fixed width bytes array that can be memory-mapped."""
+    return np.asarray([str(track_id).encode("utf-8") for track_id in ids], dtype=np.bytes_)
+
+
+def version_dir(store_dir: str, version: str) -> str:
+    """Directory of a version. Raises ValueError for names that could leave the versions dir."""
+    if not VERSION_PATTERN.match(version) or ".." in version:
+        raise ValueError(f"Invalid embedding version name {version!r}")
+    return os.path.join(store_dir, VERSIONS_DIR, version)
+
+
+def read_current_version(store_dir: str) -> Optional[str]:
+    """Return the active version name of the store or None if nothing was published."""
+    try:
+        with open(os.path.join(store_dir, CURRENT_FILE), "r", encoding="utf-8") as f_ptr:
+            return f_ptr.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def publish_embeddings(
+        ids: Sequence,
+        embeddings: np.ndarray,
+        store_dir: str = EMBEDDING_STORE_DIR,
+        version: Optional[str] = None,
+        keep_versions: int = EMBEDDING_STORE_KEEP_VERSIONS) -> str:
+    """
+    Write a new embedding version and atomically make it the active one.
+    Running servers pick the new version up on their next refresh without a restart.
+
+    ids: track ids, one per embedding row. Must be unique.
+    embeddings: (n_rows, dim) matrix, converted to float32.
+    version: name of the version, letters, digits and . _ - only. Defaults to a timestamp.
+    Returns: the published version name (str).
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if embeddings.ndim != 2:
+        raise ValueError(f"embeddings must be a 2D matrix, got shape {embeddings.shape}")
+    row_ids = _encode_ids(ids)
+    if len(row_ids) != embeddings.shape[0]:
+        raise ValueError(f"Got {len(row_ids)} ids for {embeddings.shape[0]} embedding rows")
+    order = np.argsort(row_ids, kind="stable")
+    sorted_ids = row_ids[order]
+    if len(sorted_ids) > 1 and np.any(sorted_ids[1:] == sorted_ids[:-1]):
+        raise ValueError("Embedding ids must be unique")
+
+    if version is None:
+        # fixed width microsecond timestamp first so version names sort by publish time
+        now = time.time()
+        version = (time.strftime("%Y%m%dT%H%M%S", time.localtime(now))
+                   + f".{int(now * 1e6) % 1000000:06d}-{uuid.uuid4().hex[:8]}")
+    final_dir = version_dir(store_dir, version)
+    versions_dir = os.path.join(store_dir, VERSIONS_DIR)
+    os.makedirs(versions_dir, exist_ok=True)
+    if os.path.exists(final_dir):
+        raise FileExistsError(f"Embedding version {version} already exists in {store_dir}")
+    tmp_dir = os.path.join(versions_dir, f"{TMP_PREFIX}{version}")
+    os.makedirs(tmp_dir)
+
+    try:
+        embeddings.tofile(os.path.join(tmp_dir, EMBEDDINGS_FILE))
+        np.save(os.path.join(tmp_dir, IDS_FILE), row_ids)
+        np.save(os.path.join(tmp_dir, ID_INDEX_FILE), sorted_ids)
+        np.save(os.path.join(tmp_dir, ID_ROWS_FILE), order.astype(np.int64))
+        meta = {"version": version,
+                "dim": int(embeddings.shape[1]),
+                "count": int(embeddings.shape[0]),
+                "dtype": "float32",
+                "created_at": time.time()}
+        with open(os.path.join(tmp_dir, META_FILE), "w", encoding="utf-8") as f_ptr:
+            json.dump(meta, f_ptr)
+        for fname in os.listdir(tmp_dir):
+            _fsync_path(os.path.join(tmp_dir, fname))
+        os.rename(tmp_dir, final_dir)
+        _fsync_path(versions_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    # atomic pointer swap, readers either see the old or the new version
+    current_tmp = os.path.join(store_dir, f".{CURRENT_FILE}.tmp-{os.getpid()}")
+    with open(current_tmp, "w", encoding="utf-8") as f_ptr:
+        f_ptr.write(version)
+        f_ptr.flush()
+        os.fsync(f_ptr.fileno())
+    os.replace(current_tmp, os.path.join(store_dir, CURRENT_FILE))
+    _fsync_path(store_dir)
+    logger.info("Published embedding version %s with %d rows of dim %d.✅️",
+                version, meta["count"], meta["dim"])
+
+    if keep_versions:
+        prune_versions(store_dir, keep=keep_versions)
+    return version
+
+
+def prune_versions(store_dir: str = EMBEDDING_STORE_DIR, keep: int = EMBEDDING_STORE_KEEP_VERSIONS) -> List[str]:
+    """
+    Remove all but the newest `keep` versions, newest by version name, and the staging
+    directories of crashed publishes. The active version is never removed.
+    Processes still mapping a removed version keep reading it until they refresh.
+    Returns: list of removed version names.
+    """
+    versions_dir = os.path.join(store_dir, VERSIONS_DIR)
+    if not os.path.isdir(versions_dir):
+        return []
+    current = read_current_version(store_dir)
+    names = os.listdir(versions_dir)
+    now = time.time()
+    for name in names:
+        tmp_dir = os.path.join(versions_dir, name)
+        # younger staging directories may belong to a publish still in progress
+        if name.startswith(TMP_PREFIX) and now - os.path.getmtime(tmp_dir) > STALE_TMP_SEC:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            logger.info("Removed stale embedding staging directory %s", name)
+    versions = sorted((name for name in names if not name.startswith(".")), reverse=True)
+    removed = []
+    for name in versions[max(keep, 1):]:
+        if name == current:
+            continue
+        shutil.rmtree(os.path.join(versions_dir, name), ignore_errors=True)
+        removed.append(name)
+    if removed:
+        logger.info("Pruned embedding versions: %s", ", ".join(removed))
+    return removed
+
+
+class EmbeddingSnapshot:
+    """Read-only memory-mapped view of a single embedding version."""
+
+    __slots__ = ("version", "dim", "matrix", "ids", "_id_index", "_id_rows")
+
+    def __init__(self, version_dir: str):
+        with open(os.path.join(version_dir, META_FILE), "r", encoding="utf-8") as f_ptr:
+            meta = json.load(f_ptr)
+        self.version: str = meta["version"]
+        self.dim: int = meta["dim"]
+        count = meta["count"]
+        if count:
+            self.matrix = np.memmap(os.path.join(version_dir, EMBEDDINGS_FILE),
+                                    dtype=np.float32, mode="r", shape=(count, self.dim))
+        else:
+            self.matrix = np.empty((0, self.dim), dtype=np.float32)
+        self.ids: np.ndarray = np.load(os.path.join(version_dir, IDS_FILE), mmap_mode="r")
+        self._id_index: np.ndarray = np.load(os.path.join(version_dir, ID_INDEX_FILE), mmap_mode="r")
+        self._id_rows: np.ndarray = np.load(os.path.join(version_dir, ID_ROWS_FILE), mmap_mode="r")
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    def rows_of(self, track_ids: Iterable) -> np.ndarray:
+        """Return the row number of each track id, -1 for unknown ids."""
+        keys = _encode_ids(track_ids)
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        if not len(keys) or not len(self._id_index):
+            return rows
+        pos = np.searchsorted(self._id_index, keys)
+        pos_clipped = np.minimum(pos, len(self._id_index) - 1)
+        found = self._id_index[pos_clipped] == keys
+        rows[found] = self._id_rows[pos_clipped[found]]
+        return rows
+
+
+class MmapEmbeddingStore:
+    """
+    Process-local handle on the shared embedding store.
+    Picks up newly published versions at most every `refresh_interval` seconds.
+    Callers that need a consistent view across several calls should use `snapshot()`.
+    """
+
+    def __init__(self,
+                 store_dir: str = EMBEDDING_STORE_DIR,
+                 refresh_interval: float = EMBEDDING_STORE_REFRESH_SEC):
+        self.store_dir = store_dir
+        self.refresh_interval = refresh_interval
+        self._snapshot: Optional[EmbeddingSnapshot] = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self.refresh(force=True)
+
+    @property
+    def version(self) -> Optional[str]:
+        """Active version name, None if no version is loaded."""
+        snap = self._snapshot
+        return snap.version if snap else None
+
+    @property
+    def dim(self) -> Optional[int]:
+        """Embedding dimension, None if no version is loaded."""
+        snap = self._snapshot
+        return snap.dim if snap else None
+
+    def __len__(self) -> int:
+        snap = self._snapshot
+        return len(snap) if snap else 0
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Switch to the version named in CURRENT if it changed.
+        Returns: True if a new version was loaded.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_check < self.refresh_interval:
+            return False
+        with self._lock:
+            self._last_check = now
+            version = read_current_version(self.store_dir)
+            if version is None or (self._snapshot and self._snapshot.version == version):
+                return False
+            try:
+                snapshot = EmbeddingSnapshot(version_dir(self.store_dir, version))
+            except (OSError, ValueError, KeyError) as exception:
+                logger.error("%s: Failed to load embedding version %s ❌", exception, version)
+                return False
+            # readers holding the old snapshot keep a valid mapping until they drop it
+            self._snapshot = snapshot
+        logger.info("Loaded embedding version %s with %d rows.✅️", snapshot.version, len(snapshot))
+        return True
+
+    def snapshot(self) -> Optional[EmbeddingSnapshot]:
+        """Return the active snapshot, refreshing it first if the check interval elapsed."""
+        self.refresh()
+        return self._snapshot
+
+    def get(self, track_id) -> Optional[np.ndarray]:
+        """Return the embedding of a single track or None if unknown."""
+        snap = self.snapshot()
+        if snap is None:
+            return None
+        row = snap.rows_of([track_id])[0]
+        return None if row < 0 else snap.matrix[row]
+
+    def get_many(self, track_ids: Sequence) -> Tuple[List, np.ndarray]:
+        """
+        Return the known track ids and their embeddings as a (n_found, dim) matrix.
+        Unknown ids are dropped. The returned matrix is a copy.
+        """
+        snap = self.snapshot()
+        if snap is None:
+            return [], np.empty((0, 0), dtype=np.float32)
+        rows = snap.rows_of(track_ids)
+        found = rows >= 0
+        found_ids = [track_id for track_id, ok in zip(track_ids, found) if ok]
+        return found_ids, np.asarray(snap.matrix[rows[found]])
+
+
+_default_store: Optional[MmapEmbeddingStore] = None
+_default_store_lock = threading.Lock()
+
+
+def get_embedding_store() -> MmapEmbeddingStore:
+    """Return the process wide embedding store at EMBEDDING_STORE_DIR."""
+    global _default_store
+    if _default_store is None:
+        with _default_store_lock:
+            if _default_store is None:
+                _default_store = MmapEmbeddingStore()
+    return _default_store
@@ -0,0 +1,312 @@
+"""
+Track embedding similarity search
+
+Backends sharing the VectorIndex interface:
+- PgVectorIndex: similarity search inside PostgreSQL with the pgvector extension
+- BruteForceIndex: exact in-process search with batched matrix multiplication
+- IVFIndex: approximate in-process search with a k-means coarse quantizer
+
+The in-process backends read the memory-mapped embedding store so small deployments,
+CI and benchmarks can run without a database.
+"""
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.config import (
+    VECTOR_INDEX_BACKEND, VECTOR_INDEX_IVF_LISTS, VECTOR_INDEX_IVF_PROBES,
+    PGVECTOR_TABLE, PGVECTOR_ID_COLUMN, PGVECTOR_EMBEDDING_COLUMN)
+from api.vector_store.embedding_store import EmbeddingSnapshot, get_embedding_store
+
+logger = logging.getLogger("vector_index")
+
+SUPPORTED_METRICS = {"cosine", "ip"}
+SearchResult = List[List[Tuple[str, float]]]
+
+
+def _as_query_matrix(queries: np.ndarray) -> np.ndarray:
+    queries = np.asarray(queries, dtype=np.float32)
+    return queries[None, :] if queries.ndim == 1 else queries
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Return the column indices of the k highest scores of each row, best first."""
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    if k < scores.shape[1]:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        part = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1)
+
+
+class VectorIndex(ABC):
+    """
+    Nearest neighbour search over track embeddings.
+    Higher scores are more similar for every metric.
+    """
+    metric: str = "cosine"
+
+    @abstractmethod
+    def search(self, queries: np.ndarray, k: int = 10, exclude: Optional[Iterable] = None) -> SearchResult:
+        """
+        Return the k most similar tracks of each query as [(track_id, score), ...] lists.
+        queries: (dim,) vector or (n_queries, dim) matrix.
+        exclude: track ids never returned, e.g. the seed tracks.
+        """
+
+    def __len__(self) -> int:
+        return 0
+
+
+class _InProcessIndex(VectorIndex):
+    """Shared state of the in-process backends built over an (ids, matrix) pair."""
+
+    def __init__(self,
+                 ids: Sequence,
+                 matrix: np.ndarray,
+                 metric: str = "cosine",
+                 rows_of: Optional[Callable[[Iterable], np.ndarray]] = None):
+        if metric not in SUPPORTED_METRICS:
+            raise ValueError(f"Unsupported metric {metric}. Use one of {SUPPORTED_METRICS}")
+        self.metric = metric
+        self.ids = ids
+        self.matrix = matrix
+        if rows_of is None:
+            id_to_row = {track_id: row for row, track_id in enumerate(ids)}
+            rows_of = lambda track_ids: np.asarray(  # noqa: E731
+                [id_to_row.get(track_id, -1) for track_id in track_ids], dtype=np.int64)
+        self._rows_of = rows_of
+        # scale scores by the inverse norms instead of normalising a copy of the matrix
+        # so a memory-mapped matrix stays shared
+        if metric == "cosine" and len(matrix):
+            norms = np.linalg.norm(matrix, axis=1).astype(np.float32)
+            norms[norms == 0] = 1.0
+            self._inv_norms = 1.0 / norms
+        else:
+            self._inv_norms = None
+
+    @classmethod
+    def from_snapshot(cls, snapshot: EmbeddingSnapshot, **kwargs) -> "_InProcessIndex":
+        """Build the index over a memory-mapped embedding store version."""
+        return cls(snapshot.ids, snapshot.matrix, rows_of=snapshot.rows_of, **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.matrix)
+
+    def _track_id(self, row: int) -> str:
+        track_id = self.ids[row]
+        return track_id.decode("utf-8") if isinstance(track_id, bytes) else track_id
+
+    def _prepare_queries(self, queries: np.ndarray) -> np.ndarray:
+        queries = _as_query_matrix(queries)
+        return _normalize(queries) if self.metric == "cosine" else queries
+
+    def _exclude_rows(self, exclude: Optional[Iterable]) -> np.ndarray:
+        if not exclude:
+            return np.empty(0, dtype=np.int64)
+        rows = self._rows_of(list(exclude))
+        return rows[rows >= 0]
+
+    def _score_rows(self, queries: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Score queries against all rows or against the given subset of rows."""
+        if rows is None:
+            scores = queries @ self.matrix.T
+            if self._inv_norms is not None:
+                scores *= self._inv_norms
+            return scores
+        scores = queries @ self.matrix[rows].T
+        if self._inv_norms is not None:
+            scores *= self._inv_norms[rows]
+        return scores
+
+
+class BruteForceIndex(_InProcessIndex):
+    """
+    Exact search. Queries are scored in batches with one matrix multiplication
+    each and the top k are selected with argpartition.
+    """
+
+    def __init__(self, ids: Sequence, matrix: np.ndarray, metric: str = "cosine",
+                 rows_of: Optional[Callable[[Iterable], np.ndarray]] = None,
+                 max_batch_bytes: int = 256 * 1024 * 1024):
+        super().__init__(ids, matrix, metric=metric, rows_of=rows_of)
+        # bound the (batch x n_rows) float32 score matrix
+        self.batch_size = max(1, max_batch_bytes // max(4 * len(matrix), 1))
+
+    def search(self, queries: np.ndarray, k: int = 10, exclude: Optional[Iterable] = None) -> SearchResult:
+        queries = self._prepare_queries(queries)
+        if not len(self.matrix):
+            return [[] for _ in range(len(queries))]
+        exclude_rows = self._exclude_rows(exclude)
+        results = []
+        for start in range(0, len(queries), self.batch_size):
+            scores = self._score_rows(queries[start:start + self.batch_size])
+            if len(exclude_rows):
+                scores[:, exclude_rows] = -np.inf
+            top = _top_k(scores, k)
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            for rows, row_scores in zip(top, top_scores):
+                results.append([(self._track_id(row), float(score))
+                                for row, score in zip(rows, row_scores) if np.isfinite(score)])
+        return results
+
+
+class IVFIndex(_InProcessIndex):
+    """
+    Approximate search with an inverted file index. Rows are clustered with k-means
+    and a query only scores the rows of its `n_probe` closest clusters.
+    """
+
+    def __init__(self, ids: Sequence, matrix: np.ndarray, metric: str = "cosine",
+                 rows_of: Optional[Callable[[Iterable], np.ndarray]] = None,
+                 n_lists: int = 0, n_probe: int = 8, n_iter: int = 20,
+                 train_size: int = 0, seed: int = 42):
+        super().__init__(ids, matrix, metric=metric, rows_of=rows_of)
+        n_rows = len(matrix)
+        self.n_lists = min(n_lists or max(1, int(np.sqrt(n_rows))), max(n_rows, 1))
+        self.n_probe = max(1, min(n_probe, self.n_lists))
+        self.centroids = np.empty((0, matrix.shape[1]), dtype=np.float32)
+        self.list_rows = np.empty(0, dtype=np.int64)
+        self.list_offsets = np.zeros(1, dtype=np.int64)
+        if n_rows:
+            # k-means needs at least one sample per list to pick the initial centroids
+            self._train(n_iter, max(train_size or max(self.n_lists * 64, 10000), self.n_lists), seed)
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self.centroids.T, axis=1)
+
+    def _train(self, n_iter: int, train_size: int, seed: int) -> None:
+        """Spherical k-means on a sample, then assign every row to its closest centroid."""
+        rng = np.random.default_rng(seed)
+        n_rows = len(self.matrix)
+        sample_rows = np.sort(rng.choice(n_rows, size=min(train_size, n_rows), replace=False))
+        sample = _normalize(np.asarray(self.matrix[sample_rows], dtype=np.float32))
+        self.centroids = sample[rng.choice(len(sample), size=self.n_lists, replace=False)].copy()
+        for _ in range(n_iter):
+            assign = self._assign(sample)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=self.n_lists)
+            empty = counts == 0
+            if empty.any():  # reseed empty clusters with random sample points
+                sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            self.centroids = _normalize(sums)
+
+        assign = np.empty(n_rows, dtype=np.int64)
+        chunk = 65536
+        for start in range(0, n_rows, chunk):
+            block = _normalize(np.asarray(self.matrix[start:start + chunk], dtype=np.float32))
+            assign[start:start + chunk] = self._assign(block)
+        self.list_rows = np.argsort(assign, kind="stable")
+        self.list_offsets = np.concatenate(
+            ([0], np.cumsum(np.bincount(assign, minlength=self.n_lists)))).astype(np.int64)
+        logger.info("Trained IVF index with %d lists over %d rows.✅️", self.n_lists, n_rows)
+
+    def search(self, queries: np.ndarray, k: int = 10, exclude: Optional[Iterable] = None) -> SearchResult:
+        queries = self._prepare_queries(queries)
+        if not len(self.matrix):
+            return [[] for _ in range(len(queries))]
+        exclude_rows = self._exclude_rows(exclude)
+        probes = _top_k(_normalize(queries) @ self.centroids.T, self.n_probe)
+        results = []
+        for query, lists in zip(queries, probes):
+            rows = np.concatenate([self.list_rows[self.list_offsets[i]:self.list_offsets[i + 1]]
+                                   for i in lists])
+            if len(exclude_rows):
+                rows = rows[~np.isin(rows, exclude_rows)]
+            if not len(rows):
+                results.append([])
+                continue
+            rows = np.sort(rows)  # sequential reads over the memory-mapped matrix
+            scores = self._score_rows(query[None, :], rows)
+            top = _top_k(scores, k)[0]
+            results.append([(self._track_id(rows[i]), float(scores[0, i])) for i in top])
+        return results
+
+
+class PgVectorIndex(VectorIndex):
+    """Similarity search in PostgreSQL using the pgvector distance operators."""
+
+    def __init__(self, postgres_conn, tb_name: str = PGVECTOR_TABLE,
+                 id_col: str = PGVECTOR_ID_COLUMN, vector_col: str = PGVECTOR_EMBEDDING_COLUMN,
+                 metric: str = "cosine"):
+        if metric not in SUPPORTED_METRICS:
+            raise ValueError(f"Unsupported metric {metric}. Use one of {SUPPORTED_METRICS}")
+        self.postgres_conn = postgres_conn
+        self.tb_name = tb_name
+        self.id_col = id_col
+        self.vector_col = vector_col
+        self.metric = metric
+
+    def search(self, queries: np.ndarray, k: int = 10, exclude: Optional[Iterable] = None) -> SearchResult:
+        import psycopg
+
+        # <=> is the cosine distance and <#> the negative inner product
+        if self.metric == "cosine":
+            distance, score = "<=>", f"1 - ({self.vector_col} <=> %(q)s::vector)"
+        else:
+            distance, score = "<#>", f"-({self.vector_col} <#> %(q)s::vector)"
+        where = f"WHERE NOT ({self.id_col} = ANY(%(exclude)s))" if exclude else ""
+        query = (f"SELECT {self.id_col}, {score} FROM {self.tb_name} {where} "
+                 f"ORDER BY {self.vector_col} {distance} %(q)s::vector LIMIT %(k)s")
+        exclude = list(exclude) if exclude else None
+
+        results = []
+        try:
+            with self.postgres_conn() as conn:
+                with conn.cursor() as cursor:
+                    for vector in _as_query_matrix(queries):
+                        params = {"q": "[" + ",".join(map(str, vector.tolist())) + "]",
+                                  "k": k, "exclude": exclude}
+                        cursor.execute(query, params)
+                        results.append([(track_id, float(sim)) for track_id, sim in cursor.fetchall()])
+        except psycopg.Error as exception:
+            logger.error("%s: pgvector similarity search failed ❌", exception)
+            return [[] for _ in range(len(_as_query_matrix(queries)))]
+        return results
+
+
+_index_cache: Dict[Tuple[str, str], VectorIndex] = {}
+_index_cache_lock = threading.Lock()
+
+
+def get_vector_index(backend: str = VECTOR_INDEX_BACKEND) -> VectorIndex:
+    """
+    Return the vector index for the configured backend (pgvector, bruteforce or ivf).
+    In-process indexes are rebuilt when a new embedding store version is published.
+    """
+    if backend == "pgvector":
+        from core.setup import postgres_conn
+        return PgVectorIndex(postgres_conn)
+    if backend not in {"bruteforce", "ivf"}:
+        raise ValueError(f"Unsupported vector index backend {backend}")
+
+    snapshot = get_embedding_store().snapshot()
+    if snapshot is None:
+        raise RuntimeError("No embedding version was published to the embedding store")
+    key = (backend, snapshot.version)
+    with _index_cache_lock:
+        index = _index_cache.get(key)
+        if index is None:
+            if backend == "ivf":
+                index = IVFIndex.from_snapshot(
+                    snapshot, n_lists=VECTOR_INDEX_IVF_LISTS, n_probe=VECTOR_INDEX_IVF_PROBES)
+            else:
+                index = BruteForceIndex.from_snapshot(snapshot)
+            # keep only the index of the active version
+            _index_cache.clear()
+            _index_cache[key] = index
+    return index
@@ -2,8 +2,9 @@
 Load configurations and constants 
 """
 import os
+import json
 from logging.config import dictConfig
-from models.logging import LogConfig
+from models.logging import LogConfig, start_queue_logging
 from dotenv import load_dotenv
 
 # load environment variables from .env file
@@ -17,24 +18,36 @@ VERSION: str = "0.0.1"
 
 # server settings
 FASTAPI_SERVER_PORT = int(os.getenv("FASTAPI_SERVER_PORT", default="8080"))
+# default number of --prod server workers, 0 uses the cpu count
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", default="0"))
+# seconds a worker keeps serving after SIGTERM while /readyz reports it as draining
+SHUTDOWN_DRAIN_DELAY_SEC = float(os.getenv("SHUTDOWN_DRAIN_DELAY_SEC", default="5"))
+# seconds in-flight requests get to finish once a worker stopped accepting connections
+GRACEFUL_SHUTDOWN_TIMEOUT_SEC = float(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT_SEC", default="30"))
+# comma separated modules imported by the --prod parent process so the workers share them copy-on-write
+PREFORK_PRELOAD_MODULES = [name for name in os.getenv(
+    "PREFORK_PRELOAD_MODULES",
+    default="core.setup,api.pgsql,api.sql_guard,api.jobs,api.recommendation_sessions").split(",") if name]
+# seconds /readyz waits for a database connection
+READINESS_DB_TIMEOUT_SEC = float(os.getenv("READINESS_DB_TIMEOUT_SEC", default="2"))
+# seconds the streamlit frontend reuses the result of an identical request
+FRONTEND_CACHE_TTL_SEC = float(os.getenv("FRONTEND_CACHE_TTL_SEC", default="300"))
+
+# response cache conf
+RESPONSE_CACHE_ENABLED: bool = os.getenv("RESPONSE_CACHE_ENABLED", default="True") != "False"
+# json mapping of "METHOD /path/prefix" to ttl seconds, e.g. {"GET /openapi.json": 300, "GET /static": 3600}
+RESPONSE_CACHE_ROUTE_TTLS: dict = json.loads(os.getenv("RESPONSE_CACHE_ROUTE_TTLS", default="{}"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", default="1024"))
+RESPONSE_CACHE_MAX_BODY_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BODY_BYTES", default="1048576"))
+# optional redis url for a response cache shared by all workers, e.g. redis://localhost:6379/0
+RESPONSE_CACHE_REDIS_URL = os.getenv("RESPONSE_CACHE_REDIS_URL")
 
 # save directories
 ROOT_STORAGE_DIR = os.getenv("ROOT_STORAGE_DIR", default="volumes/music_analysis")
 FILE_STORAGE_DIR = os.getenv("FILE_STORAGE_DIR", default=os.path.join(ROOT_STORAGE_DIR, "files"))
 VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", default=os.path.join(ROOT_STORAGE_DIR, "vector_store"))
 LOG_STORAGE_DIR = os.getenv("LOG_STORAGE_DIR", default=os.path.join(ROOT_STORAGE_DIR, "logs"))
-
-os.makedirs(ROOT_STORAGE_DIR, exist_ok=True)
-os.makedirs(FILE_STORAGE_DIR, exist_ok=True)
-os.makedirs(LOG_STORAGE_DIR, exist_ok=True)
-
-# logging conf
-log_cfg = LogConfig()
-# override info & error log paths
-log_cfg.handlers["info_rotating_file_handler"]["filename"] = os.path.join(LOG_STORAGE_DIR, "info.log")
-log_cfg.handlers["warning_file_handler"]["filename"] = os.path.join(LOG_STORAGE_DIR, "error.log")
-log_cfg.handlers["error_file_handler"]["filename"] = os.path.join(LOG_STORAGE_DIR, "error.log")
-dictConfig(log_cfg.model_dump())
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR", default=os.path.join(VECTOR_STORE_DIR, "track_embeddings"))
 
 # mysql conf
 POSTGRES_HOST = os.getenv("POSTRES_HOST", default="0.0.0.0")
@@ -42,7 +55,87 @@ POSTGRES_PORT = int(os.getenv("POSTGRES_PORT", default="5432"))
 POSTGRES_USER = os.getenv("POSTGRES_USER", default="user")
 POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD", default="pass")
 POSTGRES_DATABASE = os.getenv("POSTGRES_DATABASE", default="default")
+POSTGRES_POOL_MIN_SIZE = int(os.getenv("POSTGRES_POOL_MIN_SIZE", default="1"))
+POSTGRES_POOL_MAX_SIZE = int(os.getenv("POSTGRES_POOL_MAX_SIZE", default="10"))
+# generated SQL guard, see api/sql_guard.py
+# max planner cost estimate (EXPLAIN total cost) of a generated query
+SQL_GUARD_MAX_COST = float(os.getenv("SQL_GUARD_MAX_COST", default="500000"))
+# max rows returned by a generated query, larger or missing LIMITs are rewritten
+SQL_GUARD_MAX_ROWS = int(os.getenv("SQL_GUARD_MAX_ROWS", default="1000"))
+SQL_GUARD_STATEMENT_TIMEOUT_MS = int(os.getenv("SQL_GUARD_STATEMENT_TIMEOUT_MS", default="5000"))
+# playlists per playlist_tracks range partition
+PLAYLIST_TRACKS_PARTITION_SIZE = int(os.getenv("PLAYLIST_TRACKS_PARTITION_SIZE", default="100000"))
+# parallel COPY connections when loading playlist_tracks, at most POSTGRES_POOL_MAX_SIZE are used
+PLAYLIST_TRACKS_LOAD_WORKERS = int(os.getenv("PLAYLIST_TRACKS_LOAD_WORKERS", default="4"))
+
+# embedding store conf
+# seconds between checks of the embedding store CURRENT pointer for newly published versions
+EMBEDDING_STORE_REFRESH_SEC = float(os.getenv("EMBEDDING_STORE_REFRESH_SEC", default="5"))
+# number of published embedding versions kept on disk after a new publish
+EMBEDDING_STORE_KEEP_VERSIONS = int(os.getenv("EMBEDDING_STORE_KEEP_VERSIONS", default="2"))
+
+# vector index conf
+# one of pgvector, bruteforce (exact in-process search) or ivf (approximate in-process search)
+VECTOR_INDEX_BACKEND = os.getenv("VECTOR_INDEX_BACKEND", default="pgvector")
+# number of ivf clusters, 0 uses sqrt(number of tracks)
+VECTOR_INDEX_IVF_LISTS = int(os.getenv("VECTOR_INDEX_IVF_LISTS", default="0"))
+# number of ivf clusters scanned per query
+VECTOR_INDEX_IVF_PROBES = int(os.getenv("VECTOR_INDEX_IVF_PROBES", default="8"))
+PGVECTOR_TABLE = os.getenv("PGVECTOR_TABLE", default="track_embeddings")
+PGVECTOR_ID_COLUMN = os.getenv("PGVECTOR_ID_COLUMN", default="track_id")
+PGVECTOR_EMBEDDING_COLUMN = os.getenv("PGVECTOR_EMBEDDING_COLUMN", default="embedding")
+
+# playlist feature cache conf
+PLAYLIST_CACHE_MAX_ENTRIES = int(os.getenv("PLAYLIST_CACHE_MAX_ENTRIES", default="256"))
+# seconds a cached playlist is served before its snapshot_id is checked with Spotify again
+PLAYLIST_CACHE_SNAPSHOT_CHECK_SEC = float(os.getenv("PLAYLIST_CACHE_SNAPSHOT_CHECK_SEC", default="60"))
+# disk tier shared by workers, set to an empty string to only cache in memory
+PLAYLIST_CACHE_DIR = os.getenv("PLAYLIST_CACHE_DIR", default=os.path.join(ROOT_STORAGE_DIR, "playlist_cache"))
+
+# recommendation session conf
+# in-process vector index backend of the session hot path, bruteforce or ivf
+RECOMMENDATION_SESSION_BACKEND = os.getenv("RECOMMENDATION_SESSION_BACKEND", default="ivf")
+RECOMMENDATION_SESSION_MAX_ENTRIES = int(os.getenv("RECOMMENDATION_SESSION_MAX_ENTRIES", default="10000"))
+# seconds an idle session is kept in memory and in RECOMMENDATION_SESSION_DIR, 0 keeps sessions until deleted
+RECOMMENDATION_SESSION_TTL_SEC = float(os.getenv("RECOMMENDATION_SESSION_TTL_SEC", default="3600"))
+# sessions are written through to and shared by all workers here, set to an empty string to keep
+# sessions in the memory of one worker only, which requires a single server worker
+RECOMMENDATION_SESSION_DIR = os.getenv("RECOMMENDATION_SESSION_DIR",
+                                       default=os.path.join(ROOT_STORAGE_DIR, "recommendation_sessions"))
+# weight of older feedback per new feedback, lower values follow the latest tracks more closely
+RECOMMENDATION_SESSION_DECAY = float(os.getenv("RECOMMENDATION_SESSION_DECAY", default="0.9"))
+RECOMMENDATION_SESSION_SKIP_WEIGHT = float(os.getenv("RECOMMENDATION_SESSION_SKIP_WEIGHT", default="0.5"))
 
 # Spotify API conf
 SPOTIPY_CLIENT_ID = os.getenv("SPOTIPY_CLIENT_ID")
 SPOTIPY_CLIENT_SECRET = os.getenv("SPOTIPY_CLIENT_SECRET")
+
+
+def init_storage_dirs() -> None:
+    """Create the storage directories. Called on server startup, not at import."""
+    for directory in (ROOT_STORAGE_DIR, FILE_STORAGE_DIR, LOG_STORAGE_DIR):
+        os.makedirs(directory, exist_ok=True)
+
+
+_logging_configured = False
+
+
+def setup_logging() -> None:
+    """Apply the logging conf once per process. Called on server startup, not at import."""
+    global _logging_configured
+    if _logging_configured:
+        return
+    os.makedirs(LOG_STORAGE_DIR, exist_ok=True)
+    log_cfg = LogConfig()
+    # override info & error log paths
+    log_cfg.handlers["info_rotating_file_handler"]["filename"] = os.path.join(LOG_STORAGE_DIR, "info.log")
+    log_cfg.handlers["warning_file_handler"]["filename"] = os.path.join(LOG_STORAGE_DIR, "error.log")
+    log_cfg.handlers["error_file_handler"]["filename"] = os.path.join(LOG_STORAGE_DIR, "error.log")
+    if log_cfg.JSON_LOGS:
+        for handler_name, handler in log_cfg.handlers.items():
+            if handler_name != "critical_mail_handler":
+                handler["formatter"] = "json"
+    dictConfig(log_cfg.model_dump())
+    if log_cfg.ASYNC_LOGGING:
+        start_queue_logging()
+    _logging_configured = True
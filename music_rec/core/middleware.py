@@ -0,0 +1,252 @@
+"""
+ASGI middlewares
+"""
+import json
+import time
+import base64
+import asyncio
+import hashlib
+import logging
+from urllib.parse import parse_qsl, urlencode
+from typing import Dict, List, Optional, Tuple
+
+from starlette.datastructures import Headers
+
+from utils.cache import LRUCache
+
+logger = logging.getLogger("response_cache")
+
+# never cached whatever the route rules say: probes and metrics must reflect the worker's
+# current state and session recommendations change with every feedback
+BYPASS_PATH_PREFIXES = ("/healthz", "/readyz", "/metrics", "/sessions")
+
+
+def make_cache_key(method: str, path: str, query_string: bytes, body: bytes) -> str:
+    """Cache key from the method, path, order independent query and the body hash."""
+    query = urlencode(sorted(parse_qsl(query_string.decode("latin-1"), keep_blank_values=True)))
+    body_md5 = hashlib.md5(body).hexdigest() if body else ""
+    return hashlib.sha256(f"{method}\n{path}\n{query}\n{body_md5}".encode()).hexdigest()
+
+
+class CachedResponse:
+    """Buffered response stored in the cache."""
+
+    __slots__ = ("status", "headers", "body", "etag", "created_at")
+
+    def __init__(self, status: int, headers: List[Tuple[bytes, bytes]], body: bytes,
+                 etag: str, created_at: Optional[float] = None):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.etag = etag
+        self.created_at = created_at or time.time()
+
+    def dumps(self) -> bytes:
+        """Serialize for a shared cache backend."""
+        return json.dumps({
+            "status": self.status,
+            "headers": [[k.decode("latin-1"), v.decode("latin-1")] for k, v in self.headers],
+            "body": base64.b64encode(self.body).decode(),
+            "etag": self.etag,
+            "created_at": self.created_at,
+        }).encode()
+
+    @classmethod
+    def loads(cls, data: bytes) -> "CachedResponse":
+        """Deserialize from a shared cache backend."""
+        obj = json.loads(data)
+        return cls(obj["status"],
+                   [(k.encode("latin-1"), v.encode("latin-1")) for k, v in obj["headers"]],
+                   base64.b64decode(obj["body"]), obj["etag"], obj["created_at"])
+
+
+class RedisResponseCache:
+    """Optional cache tier shared by all workers and nodes. Requires the redis package."""
+
+    def __init__(self, url: str, prefix: str = "music_rec:response_cache:"):
+        import redis.asyncio as aioredis
+        self.client = aioredis.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        try:
+            data = await self.client.get(self.prefix + key)
+        except Exception as exception:
+            logger.warning("%s: shared response cache read failed", exception)
+            return None
+        return CachedResponse.loads(data) if data else None
+
+    async def set(self, key: str, entry: CachedResponse, ttl: float) -> None:
+        try:
+            await self.client.set(self.prefix + key, entry.dumps(), ex=max(int(ttl), 1))
+        except Exception as exception:
+            logger.warning("%s: shared response cache write failed", exception)
+
+
+class ResponseCacheMiddleware:
+    """
+    Cache successful responses of idempotent routes.
+
+    - route_ttls maps "METHOD /path/prefix" to a ttl in seconds. The longest matching prefix wins
+      and a ttl of 0 disables caching. Only GET routes should be listed unless the POST endpoint
+      is a pure lookup such as a recommendation query. Paths starting with one of
+      bypass_prefixes are never cached.
+    - Keys are built from the method, path, query and body hash.
+    - Responses carry an ETag and a matching If-None-Match gets a 304.
+    - Concurrent identical misses are coalesced so only one request computes the response.
+    - A request with `Cache-Control: no-store` bypasses the cache, `no-cache` forces a refresh.
+    """
+
+    def __init__(self, app, route_ttls: Dict[str, float], max_entries: int = 1024,
+                 max_body_bytes: int = 1024 * 1024, redis_url: Optional[str] = None,
+                 bypass_prefixes: Tuple[str, ...] = BYPASS_PATH_PREFIXES):
+        self.app = app
+        self.bypass_prefixes = bypass_prefixes
+        # longest prefixes first so the most specific route rule wins
+        self.route_ttls = sorted(
+            ((rule.split(" ", 1)[0].upper(), rule.split(" ", 1)[1], float(ttl))
+             for rule, ttl in route_ttls.items()),
+            key=lambda rule: len(rule[1]), reverse=True)
+        self.local = LRUCache(max_entries=max_entries)
+        self.max_body_bytes = max_body_bytes
+        self.shared = None
+        if redis_url:
+            try:
+                self.shared = RedisResponseCache(redis_url)
+            except ImportError:
+                logger.warning("redis is not installed, using the per worker response cache only")
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def route_ttl(self, method: str, path: str) -> float:
+        """Ttl of the most specific matching route rule, 0 when the route is not cached."""
+        if path.startswith(self.bypass_prefixes):
+            return 0.0
+        for rule_method, prefix, ttl in self.route_ttls:
+            if rule_method == method and path.startswith(prefix):
+                return ttl
+        return 0.0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        ttl = self.route_ttl(scope["method"], scope["path"])
+        req_headers = Headers(scope=scope)
+        cache_control = req_headers.get("cache-control", "")
+        if not ttl or "no-store" in cache_control:
+            return await self.app(scope, receive, send)
+
+        body = await self._read_body(receive)
+        key = make_cache_key(scope["method"], scope["path"], scope.get("query_string", b""), body)
+        if_none_match = req_headers.get("if-none-match")
+
+        if "no-cache" not in cache_control:
+            entry = await self._lookup(key, ttl)
+            if entry is None and key in self._inflight:
+                entry = await asyncio.shield(self._inflight[key])
+            if entry is not None:
+                return await self._send_cached(send, entry, if_none_match, hit=True)
+
+        # this request computes the response, identical requests wait for it
+        future = asyncio.get_running_loop().create_future()
+        self._inflight.setdefault(key, future)
+        entry = None
+        try:
+            entry = await self._compute(scope, self._replay(body, receive), send, if_none_match)
+            if entry is not None:
+                self.local.set(key, entry, ttl=ttl)
+                if self.shared is not None:
+                    await self.shared.set(key, entry, ttl)
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            # waiters compute the response themselves when it was not cacheable
+            future.set_result(entry)
+
+    async def _lookup(self, key: str, ttl: float) -> Optional[CachedResponse]:
+        entry = self.local.get(key)
+        if entry is None and self.shared is not None:
+            entry = await self.shared.get(key)
+            if entry is not None:
+                remaining = ttl - (time.time() - entry.created_at)
+                if remaining > 0:
+                    self.local.set(key, entry, ttl=remaining)
+        return entry
+
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        return b"".join(chunks)
+
+    @staticmethod
+    def _replay(body: bytes, receive):
+        sent = False
+
+        async def replay_receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+        return replay_receive
+
+    async def _compute(self, scope, receive, send, if_none_match: Optional[str]) -> Optional[CachedResponse]:
+        """
+        Run the app and buffer its response. Cacheable responses are returned after
+        being sent, large or unsuccessful ones are streamed through and not cached.
+        """
+        start_message = None
+        chunks: List[bytes] = []
+        size = 0
+        passthrough = False
+
+        async def capture_send(message):
+            nonlocal start_message, size, passthrough
+            if passthrough:
+                return await send(message)
+            if message["type"] == "http.response.start":
+                start_message = message
+                passthrough = message["status"] != 200
+                if passthrough:
+                    await send(message)
+                return
+            if message["type"] != "http.response.body":
+                return await send(message)
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            if size > self.max_body_bytes:
+                passthrough = True
+                await send(start_message)
+                await send({"type": "http.response.body", "body": b"".join(chunks),
+                            "more_body": message.get("more_body", False)})
+                chunks.clear()
+
+        await self.app(scope, receive, capture_send)
+        if passthrough or start_message is None:
+            return None
+
+        body = b"".join(chunks)
+        headers = [(k, v) for k, v in start_message.get("headers", [])
+                   if k.lower() not in (b"set-cookie", b"etag", b"content-length")]
+        entry = CachedResponse(200, headers, body, f'"{hashlib.md5(body).hexdigest()}"')
+        await self._send_cached(send, entry, if_none_match, hit=False)
+        return entry
+
+    @staticmethod
+    async def _send_cached(send, entry: CachedResponse, if_none_match: Optional[str], hit: bool) -> None:
+        cache_headers = [(b"etag", entry.etag.encode()),
+                         (b"x-cache", b"HIT" if hit else b"MISS"),
+                         (b"age", str(int(time.time() - entry.created_at)).encode())]
+        if if_none_match and entry.etag in [tag.strip() for tag in if_none_match.split(",")]:
+            await send({"type": "http.response.start", "status": 304, "headers": cache_headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        headers = entry.headers + cache_headers + [(b"content-length", str(len(entry.body)).encode())]
+        await send({"type": "http.response.start", "status": entry.status, "headers": headers})
+        await send({"type": "http.response.body", "body": entry.body})
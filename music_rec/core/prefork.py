@@ -0,0 +1,191 @@
+"""
+Pre-fork multi worker launcher
+
+`python music_rec/server.py --prod -w 4` runs the app in a parent process that
+1. imports the modules in PREFORK_PRELOAD_MODULES and loads the active embedding store
+   version and its in-process vector index
+2. freezes the garbage collector so collections in the workers do not write to, and
+   thereby copy, the preloaded objects
+3. binds the listening socket and forks the workers, which share the preloaded pages
+   copy-on-write instead of each building their own copy
+
+Nothing opened before the fork may hold threads or connections: the database pool,
+Spotify client and caches are still created lazily in each worker. Recommendation
+sessions are shared by the workers through RECOMMENDATION_SESSION_DIR.
+
+The parent restarts workers that die and forwards SIGTERM/SIGINT to them. A worker
+receiving SIGTERM reports not ready on /readyz and keeps serving for
+SHUTDOWN_DRAIN_DELAY_SEC so load balancers stop routing to it, then stops accepting
+connections, waits up to GRACEFUL_SHUTDOWN_TIMEOUT_SEC for in-flight requests and runs
+the lifespan shutdown which closes the database pool. A second signal skips the delay.
+"""
+import gc
+import os
+import time
+import signal
+import logging
+import importlib
+from typing import Dict, Optional, Sequence
+
+import uvicorn
+
+from core.config import (GRACEFUL_SHUTDOWN_TIMEOUT_SEC, PREFORK_PRELOAD_MODULES, RECOMMENDATION_SESSION_BACKEND,
+                         RECOMMENDATION_SESSION_DIR, SHUTDOWN_DRAIN_DELAY_SEC)
+from models.logging import LogConfig, start_queue_logging, stop_queue_logging
+
+logger = logging.getLogger("prefork")
+
+# seconds before a dead worker is restarted, avoids a fork loop when workers crash at startup
+RESPAWN_DELAY_SEC = 1.0
+# extra seconds the parent waits for draining workers before killing them
+KILL_GRACE_SEC = 5.0
+
+_draining = False
+
+
+def is_draining() -> bool:
+    """True once this worker received a shutdown signal."""
+    return _draining
+
+
+def preload_shared_state(modules: Sequence[str] = PREFORK_PRELOAD_MODULES,
+                         vector_backend: str = RECOMMENDATION_SESSION_BACKEND) -> dict:
+    """
+    Import modules and load the embedding store and its in-process vector index into this
+    process. Modules that are not installed are skipped. Returns what was loaded.
+    """
+    loaded = {"modules": [], "embedding_version": None, "vector_index": None}
+    for name in modules:
+        try:
+            importlib.import_module(name)
+            loaded["modules"].append(name)
+        except ImportError as exception:
+            logger.warning("%s: Could not preload module %s", exception, name)
+
+    from api.vector_store.embedding_store import get_embedding_store
+    from api.vector_store.vector_index import get_vector_index
+
+    store = get_embedding_store()
+    loaded["embedding_version"] = store.version
+    if store.version is not None and vector_backend in {"bruteforce", "ivf"}:
+        get_vector_index(vector_backend)
+        loaded["vector_index"] = vector_backend
+    return loaded
+
+
+class DrainingServer(uvicorn.Server):
+    """
+    uvicorn server that keeps serving for `drain_delay` seconds after the first shutdown
+    signal while is_draining() is True, then shuts down gracefully.
+    """
+
+    def __init__(self, config: uvicorn.Config, drain_delay: float = SHUTDOWN_DRAIN_DELAY_SEC):
+        super().__init__(config)
+        self.drain_delay = drain_delay
+        self.drain_deadline: Optional[float] = None
+
+    def handle_exit(self, sig, frame) -> None:
+        global _draining
+        _draining = True
+        if self.drain_deadline is None and self.drain_delay > 0:
+            self.drain_deadline = time.monotonic() + self.drain_delay
+            logger.info("Worker %s draining for %.1fs before shutdown", os.getpid(), self.drain_delay)
+            return
+        super().handle_exit(sig, frame)
+
+    async def on_tick(self, counter: int) -> bool:
+        if self.drain_deadline is not None and time.monotonic() >= self.drain_deadline:
+            self.should_exit = True
+        return await super().on_tick(counter)
+
+
+def _run_worker(config: uvicorn.Config, sock) -> None:
+    """Body of a forked worker, never returns."""
+    # restored by uvicorn after serving, ignoring them lets the worker exit normally
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    exit_code = 0
+    try:
+        if LogConfig().ASYNC_LOGGING:
+            start_queue_logging()
+        DrainingServer(config).run(sockets=[sock])
+    except BaseException:
+        logger.exception("Worker %s crashed ❌", os.getpid())
+        exit_code = 1
+    finally:
+        stop_queue_logging()
+        os._exit(exit_code)
+
+
+def serve(app, host: str, port: int, workers: int = 1, preload: bool = True) -> None:
+    """
+    Serve app with `workers` pre-forked processes sharing the preloaded state.
+    With a single worker the app is served in this process with the same drain logic.
+    Several workers need RECOMMENDATION_SESSION_DIR, through which they share the sessions.
+    """
+    if workers > 1 and not RECOMMENDATION_SESSION_DIR:
+        raise ValueError("Several workers need RECOMMENDATION_SESSION_DIR to share recommendation sessions, "
+                         "set it or run a single worker")
+    config = uvicorn.Config(app, host=host, port=port, timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_TIMEOUT_SEC)
+    if preload:
+        t_0 = time.perf_counter()
+        loaded = preload_shared_state()
+        logger.info("Preloaded %d modules, embedding version %s and %s vector index in %.2fs",
+                    len(loaded["modules"]), loaded["embedding_version"], loaded["vector_index"],
+                    time.perf_counter() - t_0)
+    if workers <= 1:
+        DrainingServer(config).run()
+        return
+
+    sock = config.bind_socket()
+    # the queue listener thread would not survive the fork, workers start their own
+    stop_queue_logging()
+    gc.collect()
+    gc.freeze()
+
+    children: Dict[int, int] = {}
+    stopping_since: Optional[float] = None
+
+    def spawn(index: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(config, sock)
+        children[pid] = index
+
+    def stop(signum, _frame):
+        nonlocal stopping_since
+        if stopping_since is None:
+            stopping_since = time.monotonic()
+        logger.info("Received signal %s, stopping %d workers", signum, len(children))
+        for pid in list(children):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for index in range(workers):
+        spawn(index)
+    logger.info("Started %d workers on %s:%s", workers, host, port)
+
+    kill_after = SHUTDOWN_DRAIN_DELAY_SEC + GRACEFUL_SHUTDOWN_TIMEOUT_SEC + KILL_GRACE_SEC
+    while children:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            if stopping_since is not None and time.monotonic() - stopping_since > kill_after:
+                logger.error("Killing %d workers still running after %.0fs ❌", len(children), kill_after)
+                for child in list(children):
+                    os.kill(child, signal.SIGKILL)
+                stopping_since = time.monotonic()
+            time.sleep(0.2)
+            continue
+        index = children.pop(pid, None)
+        if index is None or stopping_since is not None:
+            continue
+        logger.warning("Worker %s exited with status %s, restarting", pid, os.waitstatus_to_exitcode(status))
+        time.sleep(RESPAWN_DELAY_SEC)
+        if stopping_since is None:
+            spawn(index)
+    sock.close()
+    logger.info("All workers stopped")
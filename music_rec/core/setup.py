@@ -1,15 +1,15 @@
 """
 Setup connections
 """
-import base64
-
-import requests
+import threading
 import psycopg
+from psycopg_pool import ConnectionPool
 from core.config import (
     POSTGRES_HOST, POSTGRES_PORT, POSTGRES_USER,
     POSTGRES_PASSWORD, POSTGRES_DATABASE,
-    SPOTIPY_CLIENT_ID, SPOTIPY_CLIENT_SECRET)
+    POSTGRES_POOL_MIN_SIZE, POSTGRES_POOL_MAX_SIZE)
 from contextlib import contextmanager
+from utils.metrics import REGISTRY
 
 
 ######## set up postgres connection #########
@@ -25,34 +25,68 @@ def get_postgres_connection() -> psycopg.Connection:
     )
 
 
+_postgres_pool = None
+# sync endpoints run on threadpool threads, concurrent first requests must build one pool
+_postgres_pool_lock = threading.Lock()
+
+
+def get_postgres_pool() -> ConnectionPool:
+    """Return the process wide psycopg3 connection pool, created on first use."""
+    global _postgres_pool
+    if _postgres_pool is None:
+        with _postgres_pool_lock:
+            if _postgres_pool is None:
+                _postgres_pool = ConnectionPool(
+                    kwargs={"host": POSTGRES_HOST,
+                            "port": POSTGRES_PORT,
+                            "user": POSTGRES_USER,
+                            "password": POSTGRES_PASSWORD,
+                            "dbname": POSTGRES_DATABASE},
+                    min_size=POSTGRES_POOL_MIN_SIZE,
+                    max_size=POSTGRES_POOL_MAX_SIZE,
+                    name="music_rec",
+                    open=True)
+    return _postgres_pool
+
+
 @contextmanager
 def postgres_conn() -> callable:
-    """Yield psycopg3 connection object."""
-    conn = get_postgres_connection()
+    """Yield psycopg3 connection object from the connection pool."""
+    pool = get_postgres_pool()
+    conn = pool.getconn()
     try:
         yield conn
     finally:
-        conn.close()
-
-
-######## set up spotify api access token #########
-
-# Use Base64 to encode the client ID and client secret
-credentials = f"{SPOTIPY_CLIENT_ID}:{SPOTIPY_CLIENT_SECRET}"
-credentials_base64 = base64.b64encode(credentials.encode())
-
-# Make a request for the access token
-TOKEN_URL = 'https://accounts.spotify.com/api/token'
-headers = {
-    'Authorization': f'Basic {credentials_base64.decode()}'
-}
-data = {
-    'grant_type': 'client_credentials'
-}
-response = requests.post(TOKEN_URL, data=data, headers=headers, timeout=100)
-
-if response.status_code == 200:
-    spot_access_token = response.json()['access_token']
-    print("Spotify API Access token successfully obtained.")
-else:
-    print("Spotify API Access token not obtained.")
+        # uncommitted work is discarded like when closing a dedicated connection
+        if conn.info.transaction_status in (psycopg.pq.TransactionStatus.INTRANS,
+                                            psycopg.pq.TransactionStatus.INERROR):
+            conn.rollback()
+        pool.putconn(conn)
+
+
+DB_POOL_STATS = REGISTRY.gauge(
+    "db_pool_connections", "PostgreSQL connection pool statistics", ["stat"])
+
+
+def _collect_pool_stats() -> None:
+    if _postgres_pool is None:
+        return
+    stats = _postgres_pool.get_stats()
+    size, available = stats.get("pool_size", 0), stats.get("pool_available", 0)
+    DB_POOL_STATS.set(size, stat="size")
+    DB_POOL_STATS.set(available, stat="available")
+    DB_POOL_STATS.set(size - available, stat="in_use")
+    DB_POOL_STATS.set(stats.get("requests_waiting", 0), stat="requests_waiting")
+    DB_POOL_STATS.set(POSTGRES_POOL_MAX_SIZE, stat="max_size")
+
+
+REGISTRY.add_collector(_collect_pool_stats)
+
+
+def close_postgres_pool() -> None:
+    """Close the connection pool if it was created. Called on server shutdown."""
+    global _postgres_pool
+    with _postgres_pool_lock:
+        if _postgres_pool is not None:
+            _postgres_pool.close()
+            _postgres_pool = None
@@ -11,8 +11,94 @@ DEBUG    10
 NOTSET    0
 """
 import os
+import json
+import queue
+import atexit
+import logging
+import itertools
+from logging.handlers import QueueHandler, QueueListener
+from typing import List, Sequence, Tuple
+
 from pydantic import BaseModel
 
+# attributes of every LogRecord, anything else was passed with extra={...}
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JSONFormatter(logging.Formatter):
+    """Format records as one json object per line for log shippers."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        log = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S%z"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+            "module": record.module,
+            "lineno": record.lineno,
+        }
+        log.update({k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS})
+        if record.exc_info:
+            log["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(log, default=str)
+
+
+class InfoSamplingFilter(logging.Filter):
+    """
+    Keep roughly `rate` of the INFO records, e.g. rate=0.1 keeps every 10th.
+    Records of other levels always pass.
+    """
+
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.every = 0 if rate <= 0 else max(1, round(1 / min(rate, 1.0)))
+        self._counter = itertools.count()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno != logging.INFO or self.every == 1:
+            return True
+        return self.every != 0 and next(self._counter) % self.every == 0
+
+
+# (logger, queue handler, listener) of every logger moved behind a queue
+_queue_listeners: List[Tuple[logging.Logger, QueueHandler, QueueListener]] = []
+
+
+def start_queue_logging(logger_names: Sequence[str] = ("", "music_analysis")) -> List[QueueListener]:
+    """
+    Move the handlers of the given loggers behind a QueueHandler so logging calls only
+    enqueue records and a background QueueListener thread does the file and SMTP I/O.
+    Must be called after dictConfig. Returns the started listeners.
+    """
+    for name in logger_names:
+        logger = logging.getLogger(name)
+        handlers = [h for h in logger.handlers if not isinstance(h, QueueHandler)]
+        if not handlers:
+            continue
+        log_queue = queue.SimpleQueue()
+        listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        queue_handler = QueueHandler(log_queue)
+        for handler in handlers:
+            logger.removeHandler(handler)
+        logger.addHandler(queue_handler)
+        listener.start()
+        _queue_listeners.append((logger, queue_handler, listener))
+    return [listener for _, _, listener in _queue_listeners]
+
+
+def stop_queue_logging() -> None:
+    """Flush queued records, stop the listener threads and reattach the handlers to their loggers."""
+    while _queue_listeners:
+        logger, queue_handler, listener = _queue_listeners.pop()
+        logger.removeHandler(queue_handler)
+        listener.stop()
+        for handler in listener.handlers:
+            logger.addHandler(handler)
+
+
+atexit.register(stop_queue_logging)
+
 
 class LogConfig(BaseModel):
     """Logging configuration to be set for the server"""
@@ -22,6 +108,12 @@ class LogConfig(BaseModel):
 
     # Fetch debug level from environment variable or default to 'DEBUG' if not set
     DEBUG_LEVEL: str = os.getenv('DEBUG_LEVEL', 'DEBUG')
+    # handlers run on a background thread, log calls only enqueue records
+    ASYNC_LOGGING: bool = os.getenv('LOG_ASYNC', 'True') != 'False'
+    # json lines instead of plain text for all handlers except the mail handler
+    JSON_LOGS: bool = os.getenv('LOG_JSON', 'False') == 'True'
+    # fraction of INFO records kept for the high volume loggers listed in loggers below
+    INFO_SAMPLE_RATE: float = float(os.getenv('LOG_INFO_SAMPLE_RATE', '1.0'))
 
     # Logging config
     version: int = 1
@@ -37,6 +129,15 @@ class LogConfig(BaseModel):
             "fmt": '%(levelprefix)s | %(asctime)s | %(name)s | %(process)d::%(module)s|%(lineno)s:: %(message)s',
             "datefmt": "%Y-%m-%d %H:%M:%S",
         },
+        'json': {
+            "()": "models.logging.JSONFormatter",
+        },
+    }
+    filters: dict = {
+        'info_sampling': {
+            "()": "models.logging.InfoSamplingFilter",
+            "rate": INFO_SAMPLE_RATE,
+        },
     }
     handlers: dict = {
         'debug_console_handler': {
@@ -88,4 +189,7 @@ class LogConfig(BaseModel):
             'propagate': False,
             'handlers': ['debug_console_handler', 'info_rotating_file_handler', 'error_file_handler'],
         },
+        'postgresql_api': {  # per query success messages
+            'filters': ['info_sampling'],
+        },
     }
@@ -4,7 +4,7 @@ API data models
 from enum import Enum
 from pydantic import BaseModel
 from abc import ABC, abstractmethod
-from typing import List, Any, Optional
+from typing import List, Any, Optional, Dict
 
 
 class SQLQueryParams(BaseModel):
@@ -15,6 +15,53 @@ class SQLQueryParams(BaseModel):
     params: Optional[List[Any]] = None
 
 
+class JobStatus(Enum):
+    """
+    Background job states
+    """
+    QUEUED: str = "queued"
+    RUNNING: str = "running"
+    SUCCEEDED: str = "succeeded"
+    FAILED: str = "failed"
+
+
+class JobSubmission(BaseModel):
+    """
+    Background job type, its payload and scheduling options
+    """
+    job_type: str
+    payload: Dict[str, Any] = {}
+    priority: int = 0
+    max_attempts: int = 3
+
+
+class SessionSeedSource(Enum):
+    """
+    Where the seed tracks of a recommendation session come from
+    """
+    TRACKS: str = "tracks"
+    SPOTIFY: str = "spotify"
+    INGESTED: str = "ingested"
+
+
+class SessionCreate(BaseModel):
+    """
+    Seed of a recommendation session: track_ids for the tracks source,
+    playlist_id for a Spotify playlist or an ingested million playlist dataset pid
+    """
+    source: SessionSeedSource = SessionSeedSource.TRACKS
+    track_ids: Optional[List[str]] = None
+    playlist_id: Optional[str] = None
+
+
+class SessionFeedback(BaseModel):
+    """
+    A track the listener accepted or skipped
+    """
+    track_id: str
+    accepted: bool = True
+
+
 class LLMModel(Enum):
     """
     LLM Model Types
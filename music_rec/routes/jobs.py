@@ -0,0 +1,75 @@
+"""
+Background jobs api endpoints
+
+Long running work (bulk loads, exports, embedding publishing) is queued in the jobs table
+and run by `music_rec/worker.py` processes. Submit a job and poll its status and progress.
+"""
+
+import logging
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, status
+
+from models.model import JobStatus, JobSubmission
+
+
+router = APIRouter()
+logger = logging.getLogger("jobs_route")
+
+_jobs_table_ready = False
+
+
+def _ensure_jobs_table(postgres_conn) -> None:
+    """Create the jobs table on the first submission of this worker."""
+    global _jobs_table_ready
+    if _jobs_table_ready:
+        return
+    from api.jobs import create_jobs_table
+    result = create_jobs_table(postgres_conn)
+    if result["status"] != "success":
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=result["message"])
+    _jobs_table_ready = True
+
+
+@router.post("", status_code=status.HTTP_202_ACCEPTED)
+def submit_job(job: JobSubmission):
+    """Queue a background job. Poll GET /jobs/{job_id} for its progress and result."""
+    # the job modules pull in the database pool, keep them out of the server import
+    from core.setup import postgres_conn
+    from api.jobs import enqueue_job
+    from api.job_handlers import JOB_HANDLERS
+
+    if job.job_type not in JOB_HANDLERS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Unknown job type {job.job_type}, expected one of {sorted(JOB_HANDLERS)}")
+    _ensure_jobs_table(postgres_conn)
+    result = enqueue_job(postgres_conn, job.job_type, job.payload, job.priority, job.max_attempts)
+    if result["status"] != "success":
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=result["message"])
+    return result
+
+
+@router.get("/{job_id}")
+def job_status(job_id: int):
+    """Status, progress, result or error of a job."""
+    from core.setup import postgres_conn
+    from api.jobs import get_job
+
+    result = get_job(postgres_conn, job_id)
+    if result["status"] != "success":
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=result["message"])
+    return result
+
+
+@router.get("")
+def job_list(job_status: Optional[JobStatus] = Query(None, alias="status"),
+             job_type: Optional[str] = None,
+             limit: int = Query(50, ge=1, le=500)):
+    """Most recent jobs, optionally filtered by status and type."""
+    from core.setup import postgres_conn
+    from api.jobs import list_jobs
+
+    result = list_jobs(postgres_conn, job_status.value if job_status else None, job_type, limit)
+    if result["status"] != "success":
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=result["message"])
+    return result
@@ -0,0 +1,107 @@
+"""
+Recommendation session api endpoints
+
+Create a session from seed tracks, then alternate between asking for the next tracks and
+sending feedback on them. Every update is written through to RECOMMENDATION_SESSION_DIR,
+so any worker can serve any session. Without it sessions stay in the memory of the worker
+that created them and the server must run a single worker.
+"""
+
+import logging
+
+from fastapi import APIRouter, HTTPException, Query, status
+
+from models.model import SessionCreate, SessionFeedback, SessionSeedSource
+
+
+router = APIRouter()
+logger = logging.getLogger("sessions_route")
+
+
+def _seed_track_ids(seed: SessionCreate) -> list:
+    """Resolve the seed of a session to track ids of the embedding store."""
+    if seed.source == SessionSeedSource.TRACKS:
+        if not seed.track_ids:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="track_ids are required")
+        return seed.track_ids
+    if not seed.playlist_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="playlist_id is required")
+    if seed.source == SessionSeedSource.SPOTIFY:
+        from api.audio_api_custom.reference_recom import get_playlist_data
+        # embeddings are keyed by track uri like the million playlist dataset
+        features = get_playlist_data(seed.playlist_id, as_frame=False)
+        return [f"spotify:track:{track_id}" for track_id in features["track_id"].tolist() if track_id]
+
+    from core.setup import postgres_conn
+    from api.playlist_tracks import select_playlist_tracks
+    if not seed.playlist_id.isdigit():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="playlist_id must be a pid")
+    result = select_playlist_tracks(postgres_conn, [int(seed.playlist_id)])
+    if result["status"] != "success":
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=result["message"])
+    # rows are (pid, pos, track_uri, ...)
+    return [row[2] for row in result["data"]]
+
+
+def _get_session(recommender, session_id: str):
+    session = recommender.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"Session {session_id} does not exist or expired")
+    return session
+
+
+def _recommendations(recommender, session, k: int) -> dict:
+    try:
+        tracks = recommender.recommend(session, k=k)
+    except (LookupError, RuntimeError) as exception:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(exception))
+    return {"status": "success", "message": f"{len(tracks)} tracks recommended",
+            "data": {"session_id": session.session_id,
+                     "tracks": [{"track_id": track_id, "score": score} for track_id, score in tracks]}}
+
+
+@router.post("", status_code=status.HTTP_201_CREATED)
+def create_session(seed: SessionCreate, k: int = Query(10, ge=1, le=100)):
+    """Create a session from seed tracks and return its first recommendations."""
+    from api.recommendation_sessions import get_session_recommender
+
+    recommender = get_session_recommender()
+    track_ids = _seed_track_ids(seed)
+    try:
+        session = recommender.create(track_ids)
+    except (LookupError, RuntimeError) as exception:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(exception))
+    return _recommendations(recommender, session, k)
+
+
+@router.get("/{session_id}/next")
+def next_tracks(session_id: str, k: int = Query(10, ge=1, le=100)):
+    """Next k unseen tracks of the session."""
+    from api.recommendation_sessions import get_session_recommender
+
+    recommender = get_session_recommender()
+    return _recommendations(recommender, _get_session(recommender, session_id), k)
+
+
+@router.post("/{session_id}/feedback")
+def session_feedback(session_id: str, feedback: SessionFeedback, k: int = Query(10, ge=0, le=100)):
+    """Record an accepted or skipped track and return the updated next k tracks, none with k=0."""
+    from api.recommendation_sessions import get_session_recommender
+
+    recommender = get_session_recommender()
+    session = _get_session(recommender, session_id)
+    recommender.feedback(session, feedback.track_id, feedback.accepted)
+    if k == 0:
+        return {"status": "success", "message": "Feedback recorded", "data": {"session_id": session_id}}
+    return _recommendations(recommender, session, k)
+
+
+@router.delete("/{session_id}")
+def delete_session(session_id: str):
+    """End a session."""
+    from api.recommendation_sessions import get_session_recommender
+
+    if not get_session_recommender().delete(session_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Session {session_id} does not exist")
+    return {"status": "success", "message": f"Session {session_id} deleted"}
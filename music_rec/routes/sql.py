@@ -2,10 +2,55 @@
 SQL Question Answer api endpoint
 """
 
+import json
 import logging
 
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+
+from models.model import LLMModel, SQLQueryParams
 
 
 router = APIRouter()
 logger = logging.getLogger("sql_qa_route")
+
+
+@router.post("/qa")
+def sql_question_answer(question: SQLQueryParams, model: LLMModel = LLMModel.GPT_4o_Mini,
+                        top_k: int = Query(5, ge=1, le=1000)):
+    """
+    Answer a plain text question about the playlist_tracks table: the LLM writes the SQL,
+    which is run through the SQL guard (read only, LIMIT, cost, row and timeout checks).
+    """
+    # langchain and the database pool are loaded on the first question, not at server import
+    from core.setup import postgres_conn
+    from api.langchain_custom.text2sql import run_text_to_sql
+    from api.playlist_tracks import PlaylistTracksText2SQLConfig
+
+    try:
+        result = run_text_to_sql(question.query, PlaylistTracksText2SQLConfig(),
+                                 {"model": model.value, "temperature": 0}, postgres_conn, top_k=top_k)
+    except Exception as exception:
+        logger.error("%s: Text to SQL failed ❌", exception)
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail=f"Text to SQL error: {exception}") from exception
+    if result["status"] != "success":
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=result)
+    return result
+
+
+@router.post("/script/stream")
+def stream_sql_script(sql_query: SQLQueryParams, batch_size: int = Query(1000, ge=1, le=10000)):
+    """
+    Run a read only SQL query and stream its result as newline delimited json:
+    a {"columns": [...]} line, {"rows": [...]} lines of at most batch_size rows
+    and a final {"status": ..., "row_count": n} or {"status": "failed", "message": ...} line.
+    """
+    # pgsql pulls in the database pool, keep it out of the server import
+    from core.setup import postgres_conn
+    from api.pgsql import stream_sql_script as stream_rows
+
+    chunks = stream_rows(postgres_conn, sql_query.query, tuple(sql_query.params or ()), batch_size)
+    # dates and decimals are sent as strings
+    lines = (json.dumps(chunk, default=str) + "\n" for chunk in chunks)
+    return StreamingResponse(lines, media_type="application/x-ndjson")
@@ -2,35 +2,63 @@
 Main fastapi server file
 
 This file contains the main FastAPI server setup. It:
-- Creates the FastAPI music_rec
-- Adds middleware (CORS, timing)
+- Creates the FastAPI music_rec with a lifespan running the startup side effects
+- Adds middleware (CORS, response cache, timing)
 - Mounts static files
 - Includes API routers
-- Defines an OpenAPI schema
-- Starts a Uvicorn server
+- Defines an OpenAPI schema and the /healthz liveness and /readyz readiness probes
+- Starts a Uvicorn server, or pre-forked workers sharing preloaded state with --prod
 
 Args:
     cfg (module): Configuration variables
     upsert (module): Upsert API router
     sql (module): SQL qa API router
+    jobs (module): Background jobs API router
+    sessions (module): Recommendation sessions API router
 
 Returns:
     music_rec (FastAPI): The FastAPI application object
 """
 import os
+import sys
 import time
 import argparse
 import logging
+from contextlib import asynccontextmanager
 
 import uvicorn
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response, status
 from fastapi.openapi.utils import get_openapi
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 
 import core.config as cfg
-from routes import upsert, sql
+from core.middleware import ResponseCacheMiddleware
+from core.prefork import is_draining, serve
+from models.logging import stop_queue_logging
+from routes import upsert, sql, jobs, sessions
+from utils.metrics import REGISTRY
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Runs the startup side effects in the worker and releases resources on shutdown.
+
+    Importing the server module stays free of file system, logging and network side effects
+    so cold starts and --reload cycles stay fast.
+    """
+    cfg.setup_logging()
+    cfg.init_storage_dirs()
+    app.state.ready = True
+    yield
+    app.state.ready = False
+    from core.setup import close_postgres_pool
+    close_postgres_pool()
+    # persist the recommendation sessions if this worker served any
+    if "api.recommendation_sessions" in sys.modules:
+        sys.modules["api.recommendation_sessions"].close_session_recommender()
+    stop_queue_logging()
 
 
 def get_application():
@@ -42,8 +70,18 @@ def get_application():
     music_rec = FastAPI(title=cfg.PROJECT_NAME,
                   description=cfg.PROJECT_DESCRIPTION,
                   debug=cfg.DEBUG,
-                  version=cfg.VERSION)
+                  version=cfg.VERSION,
+                  lifespan=lifespan)
     music_rec.mount("/static", StaticFiles(directory="./music_rec/static"), name="static")
+    if cfg.RESPONSE_CACHE_ENABLED and cfg.RESPONSE_CACHE_ROUTE_TTLS:
+        # added before CORS so cached responses never hold origin specific headers
+        music_rec.add_middleware(
+            ResponseCacheMiddleware,
+            route_ttls=cfg.RESPONSE_CACHE_ROUTE_TTLS,
+            max_entries=cfg.RESPONSE_CACHE_MAX_ENTRIES,
+            max_body_bytes=cfg.RESPONSE_CACHE_MAX_BODY_BYTES,
+            redis_url=cfg.RESPONSE_CACHE_REDIS_URL,
+        )
     music_rec.add_middleware(
         CORSMiddleware,
         allow_origins=["*"],
@@ -76,10 +114,18 @@ def custom_openapi():
 # logging
 logger = logging.getLogger("music_analysis_server")
 
+# metrics
+REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ["method", "route", "status"])
+REQUESTS_IN_PROGRESS = REGISTRY.gauge(
+    "http_requests_in_progress", "HTTP requests being processed", ["method"])
+
 # Routing
 music_rec = get_application()
 music_rec.include_router(upsert.router, prefix="/upsert", tags=["upsert"])
 music_rec.include_router(sql.router, prefix="/sql", tags=["sql"])
+music_rec.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
+music_rec.include_router(sessions.router, prefix="/sessions", tags=["sessions"])
 music_rec.openapi = custom_openapi
 
 
@@ -93,8 +139,18 @@ async def add_process_time_header(request: Request, call_next):
         call_next (coroutine): The next middleware or endpoint.
     """
     start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
+    REQUESTS_IN_PROGRESS.inc(method=request.method)
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        process_time = time.time() - start_time
+        REQUESTS_IN_PROGRESS.dec(method=request.method)
+        # label with the route template instead of the raw path to bound cardinality
+        route = request.scope.get("route")
+        REQUEST_DURATION.observe(process_time, method=request.method,
+                                 route=getattr(route, "path", "unmatched"), status=str(status))
     response.headers["X-Process-Time"] = str(process_time)
     return response
 
@@ -105,6 +161,41 @@ async def index():
     return {"Welcome to the Log Analysis service": "Please visit /docs for list of apis"}
 
 
+@music_rec.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Returns the metrics of this worker in the Prometheus text format."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@music_rec.get("/healthz")
+async def healthz():
+    """Liveness probe, answers as long as the worker's event loop runs."""
+    return {"status": "success", "message": "alive", "data": {"pid": os.getpid()}}
+
+
+@music_rec.get("/readyz")
+def readyz(response: Response):
+    """Readiness probe, 503 while the worker starts, drains for shutdown or cannot reach the database."""
+    import psycopg
+    from core.setup import get_postgres_pool
+    from api.vector_store.embedding_store import get_embedding_store
+
+    checks = {"started": getattr(music_rec.state, "ready", False), "draining": is_draining(),
+              "database": False, "embedding_version": get_embedding_store().version}
+    if checks["started"] and not checks["draining"]:
+        try:
+            with get_postgres_pool().connection(timeout=cfg.READINESS_DB_TIMEOUT_SEC) as conn:
+                conn.execute("SELECT 1")
+            checks["database"] = True
+        except psycopg.Error as exception:
+            logger.warning("%s: Readiness check could not reach the database", exception)
+    ready = checks["started"] and not checks["draining"] and checks["database"]
+    if not ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {"status": "success" if ready else "failed", "message": "ready" if ready else "not ready",
+            "data": checks}
+
+
 @music_rec.get('/favicon.ico')
 async def favicon():
     """Returns the favicon.ico file."""
@@ -120,13 +211,25 @@ if __name__ == '__main__':
                         help='host ip address. (default: %(default)s)')
     parser.add_argument('-p', '--port', type=int, default=cfg.FASTAPI_SERVER_PORT,
                         help='uvicorn port number. Overrides .env (default: %(default)s)')
-    parser.add_argument('-w', '--workers', type=int, default=1,
-                        help="number of uvicorn workers. (default: %(default)s)")
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help="number of uvicorn workers. (default: WEB_CONCURRENCY or the cpu count "
+                             "with --prod, else 1)")
     parser.add_argument('-r', '--reload', action='store_true',
                         help="reload based on reload dir. (default: %(default)s)")
+    parser.add_argument('--prod', action='store_true',
+                        help="pre-fork the workers after preloading shared read only data and drain "
+                             "them on SIGTERM. (default: %(default)s)")
+    parser.add_argument('--no-preload', dest="preload", action='store_false',
+                        help="with --prod, fork the workers without preloading. (default: preload)")
     args = parser.parse_args()
-    args.reload = False if args.workers > 1 else args.reload
+    if args.workers is None:
+        args.workers = cfg.WEB_CONCURRENCY or ((os.cpu_count() or 1) if args.prod else 1)
+    args.reload = False if args.workers > 1 or args.prod else args.reload
 
+    cfg.setup_logging()
     logger.info("Uvicorn server running on %s:%s with %s workers", args.host_ip, args.port, args.workers)
-    uvicorn.run("server:music_rec", host=args.host_ip, port=args.port,
-                workers=args.workers, reload=args.reload, reload_dirs=['music_rec'])
+    if args.prod:
+        serve(music_rec, args.host_ip, args.port, workers=args.workers, preload=args.preload)
+    else:
+        uvicorn.run("server:music_rec", host=args.host_ip, port=args.port,
+                    workers=args.workers, reload=args.reload, reload_dirs=['music_rec'])
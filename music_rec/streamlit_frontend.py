@@ -1,12 +1,22 @@
+import json
+import time
+
 import requests
+import pandas as pd
 import streamlit as st
+from requests.adapters import HTTPAdapter
 
 import core.config as cfg
 from models.model import LLMModel
+from utils.cache import LRUCache
 from utils.common import parse_num_str
 
 # Base URL for the API
 API_URL = f"http://127.0.0.1:{cfg.FASTAPI_SERVER_PORT}"
+# (connect, read) timeouts, the read timeout applies between streamed chunks
+API_TIMEOUT = (5, 120)
+# seconds between table redraws while a result streams in
+RENDER_INTERVAL_SEC = 0.5
 
 # Configuring the sidebar with options
 st.sidebar.title("Log Analyzer Services")
@@ -19,14 +29,96 @@ option = st.sidebar.radio("Choose a service:", (
 ))
 
 
+@st.cache_resource
+def get_session():
+    """
+    requests.Session shared by all reruns and browser sessions of this streamlit server,
+    keeps connections to the API alive instead of opening one per request.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+@st.cache_resource
+def get_stream_cache():
+    """Completed streamed results by request, shared by reruns."""
+    return LRUCache(max_entries=64, default_ttl=cfg.FRONTEND_CACHE_TTL_SEC)
+
+
 def post_api(endpoint, param_dict):
     """
     Helper function to post data to the API
     """
-    response = requests.post(f"{API_URL}/{endpoint}", timeout=120, **param_dict)
+    response = get_session().post(f"{API_URL}/{endpoint}", timeout=API_TIMEOUT, **param_dict)
+    return response.json()
+
+
+@st.cache_data(ttl=cfg.FRONTEND_CACHE_TTL_SEC, show_spinner=False)
+def _cached_post_json(endpoint, request_json):
+    """Successful json responses only, st.cache_data does not cache raised errors."""
+    response = get_session().post(f"{API_URL}/{endpoint}", timeout=API_TIMEOUT, json=request_json)
+    response.raise_for_status()
     return response.json()
 
 
+def cached_post_api(endpoint, request_json):
+    """
+    post_api for idempotent json requests, identical requests within the ttl
+    are answered from the cache without calling the API. Error responses are
+    returned but not cached, so a transient failure is retried on the next call.
+    """
+    try:
+        return _cached_post_json(endpoint, request_json)
+    except requests.HTTPError as exception:
+        return exception.response.json()
+
+
+def stream_api(endpoint, request_json):
+    """
+    Post to a newline delimited json endpoint and yield each json line as it arrives
+    """
+    with get_session().post(f"{API_URL}/{endpoint}", json=request_json,
+                            timeout=API_TIMEOUT, stream=True) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line)
+
+
+def render_sql_stream(endpoint, request_json):
+    """
+    Render a streamed SQL result progressively, the table is redrawn at most every
+    RENDER_INTERVAL_SEC while rows arrive. Completed results are cached.
+    """
+    cache_key = (endpoint, json.dumps(request_json, sort_keys=True))
+    cached = get_stream_cache().get(cache_key)
+    if cached is not None:
+        st.caption(f"{cached['status']['row_count']} rows (cached)")
+        st.dataframe(pd.DataFrame(cached["rows"], columns=cached["columns"] or None))
+        return
+
+    status_text, table = st.empty(), st.empty()
+    columns, rows, last_render = [], [], 0.0
+    for chunk in stream_api(endpoint, request_json):
+        if "columns" in chunk:
+            columns = chunk["columns"]
+        elif "rows" in chunk:
+            rows.extend(chunk["rows"])
+            if time.monotonic() - last_render > RENDER_INTERVAL_SEC:
+                status_text.caption(f"{len(rows)} rows received...")
+                table.dataframe(pd.DataFrame(rows, columns=columns or None))
+                last_render = time.monotonic()
+        elif chunk.get("status") == "success":
+            status_text.caption(f"{chunk['row_count']} rows")
+            table.dataframe(pd.DataFrame(rows, columns=columns or None))
+            get_stream_cache().set(cache_key, {"columns": columns, "rows": rows, "status": chunk})
+        else:
+            status_text.error(chunk.get("message", chunk))
+
+
 # Mapping option to functionality
 if option == "Question Answering":
     model = st.selectbox("Select model:", [model.value for model in LLMModel])
@@ -34,26 +126,24 @@ if option == "Question Answering":
 
     request_data = {"query": query}
     if st.button("Get Answer"):
-        result = post_api(f"qa?model={model}", {"json": request_data})
+        result = cached_post_api(f"qa?model={model}", request_data)
         st.write(result)
 
 elif option == "SQL Query Answer":
-    log_type = st.selectbox("Select log type:", [ftype.value for ftype in LogFileType])
     model = st.selectbox("Select model:", [model.value for model in LLMModel])
     query = st.text_input("Enter SQL-related plaintext query (E.g. Give the latest 5 records):")
     if st.button("Get SQL Answer"):
-        result = post_api(f"sql/qa?log_type={log_type}&model={model}", {"json": {"query": query}})
+        result = cached_post_api(f"sql/qa?model={model}", {"query": query})
         st.write(result)
 
 elif option == "Run SQL Script":
     sql_query = st.text_area("Enter SQL script with params replaced with %s:")
     sql_params = st.text_area("Enter SQL parameters (comma-separated):")
-    sql_params = [parse_num_str(param) for param in sql_params.split(',')]
+    sql_params = [parse_num_str(param) for param in sql_params.split(',') if param.strip()]
 
     request_data = {"query": sql_query, "params": sql_params}
     if st.button("Execute SQL Script"):
-        result = post_api("sql/script", {"json": request_data})
-        st.write(result)
+        render_sql_stream("sql/script/stream", request_data)
 
 elif option == "Upsert Logs":
     log_type = st.selectbox("Select log file type:", [ftype.value for ftype in LogFileType])
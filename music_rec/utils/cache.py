@@ -0,0 +1,121 @@
+"""
+In-memory caches
+"""
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional, Tuple
+
+
+class LRUCache:
+    """
+    Thread-safe least recently used cache with optional per entry time to live.
+    Entries past their ttl are dropped lazily on access, on set from the least recently
+    used end and by expire(). With sliding, every get restarts the ttl of the entry, so
+    the ttl is an idle timeout. on_expire(key, value) is called for every dropped expired
+    entry, outside the cache lock.
+    """
+
+    def __init__(self, max_entries: int = 1024, default_ttl: Optional[float] = None, sliding: bool = False,
+                 on_expire: Optional[Callable[[Hashable, Any], None]] = None):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.sliding = sliding
+        self.on_expire = on_expire
+        # key -> (value, expires_at, ttl)
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _count=False) is not None
+
+    def get(self, key: Hashable, default: Any = None, _count: bool = True) -> Any:
+        """Return the cached value and mark it as most recently used."""
+        expired = None
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires_at, ttl = item
+                now = time.monotonic()
+                if expires_at is None or expires_at > now:
+                    self._data.move_to_end(key)
+                    if self.sliding and ttl:
+                        self._data[key] = (value, now + ttl, ttl)
+                    if _count:
+                        self.hits += 1
+                    return value
+                del self._data[key]
+                expired = (key, value)
+            if _count:
+                self.misses += 1
+        if expired is not None:
+            self._expired([expired])
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> Optional[tuple]:
+        """
+        Cache a value, evicting the least recently used entry when full.
+        Returns: the evicted (key, value) pair or None.
+        """
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        evicted = None
+        with self._lock:
+            self._data[key] = (value, expires_at, ttl or None)
+            self._data.move_to_end(key)
+            expired = self._pop_expired(time.monotonic(), lru_only=True)
+            if len(self._data) > self.max_entries:
+                old_key, (old_value, _, _) = self._data.popitem(last=False)
+                evicted = (old_key, old_value)
+        self._expired(expired)
+        return evicted
+
+    def expire(self) -> int:
+        """Drop all expired entries. Returns: the number of dropped entries."""
+        with self._lock:
+            expired = self._pop_expired(time.monotonic())
+        self._expired(expired)
+        return len(expired)
+
+    def _pop_expired(self, now: float, lru_only: bool = False) -> List[Tuple[Hashable, Any]]:
+        """
+        Remove expired entries, with lru_only only the expired run at the least recently used
+        end, which is all of them when every entry has the same sliding ttl. Caller holds the lock.
+        """
+        expired = []
+        for key, (value, expires_at, _) in self._data.items():
+            if expires_at is not None and expires_at <= now:
+                expired.append((key, value))
+            elif lru_only:
+                break
+        for key, _ in expired:
+            del self._data[key]
+        return expired
+
+    def _expired(self, expired: List[Tuple[Hashable, Any]]) -> None:
+        if self.on_expire is not None:
+            for key, value in expired:
+                self.on_expire(key, value)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove and return a cached value."""
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[0]
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        """Snapshot of the unexpired (key, value) pairs, least recently used first."""
+        now = time.monotonic()
+        with self._lock:
+            return [(key, value) for key, (value, expires_at, _) in self._data.items()
+                    if expires_at is None or expires_at > now]
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._lock:
+            self._data.clear()
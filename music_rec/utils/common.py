@@ -2,28 +2,41 @@
 Common utils
 """
 import os
+import re
 import time
 import hashlib
 import logging
 import functools
-from typing import Callable, Union
+from typing import Callable, Optional, Union
+
+from utils.metrics import FUNCTION_DURATION
 
 logger = logging.getLogger("timeit_decorator")
 
 
-def timeit_decorator(func: Callable) -> Callable:
+def timeit_decorator(func: Optional[Callable] = None, *, name: Optional[str] = None) -> Callable:
     """
-    Decorator that prints the runtime of the function in seconds.
+    Decorator that logs the runtime of the function in seconds and records it
+    in the function_duration_seconds histogram under `name` (default: function name).
+    Can be used as @timeit_decorator or @timeit_decorator(name="stage_name").
     """
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        t_0 = time.time()
-        result = func(*args, **kwargs)
-        t_1 = time.time()
-        call_time_msg = f"function {func.__name__} call time {t_1 - t_0:.3f}s"
-        logger.info(call_time_msg)
-        return result
-    return wrapper
+    def decorator(func: Callable) -> Callable:
+        stage = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            t_0 = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                call_time = time.perf_counter() - t_0
+                FUNCTION_DURATION.observe(call_time, function=stage)
+                logger.info("function %s call time %.3fs", stage, call_time)
+        return wrapper
+
+    if func is not None:
+        return decorator(func)
+    return decorator
 
 
 def remove_file(path: str) -> None:
@@ -84,3 +97,23 @@ def parse_num_str(string: str):
         except ValueError:
             continue
     return v
+
+
+# string literals ('' escapes a quote) and comments, whichever starts first wins so
+# a -- inside a string is not a comment and a quote inside a comment is not a string
+SQL_LITERAL_OR_COMMENT_PATTERN = re.compile(r"'(?:[^']|'')*'|--[^\n]*|/\*.*?\*/", re.DOTALL)
+
+
+def strip_sql_comments(sql: str) -> str:
+    """Replace the -- and /* */ comments of a SQL string with a space, string literals are kept."""
+    return SQL_LITERAL_OR_COMMENT_PATTERN.sub(
+        lambda match: match.group(0) if match.group(0).startswith("'") else " ", sql)
+
+
+def blank_sql_literals(sql: str) -> str:
+    """
+    Replace string literals with '' and comments with a space, so keyword and statement
+    checks only see SQL code, e.g. WHERE track_name = 'Call Me Maybe' holds no CALL.
+    """
+    return SQL_LITERAL_OR_COMMENT_PATTERN.sub(
+        lambda match: "''" if match.group(0).startswith("'") else " ", sql)
@@ -0,0 +1,183 @@
+"""
+Background job worker
+
+Runs worker processes that claim jobs from the PostgreSQL jobs table with
+SELECT ... FOR UPDATE SKIP LOCKED and execute them with the handlers registered in
+`api/job_handlers.py`. Workers on any number of nodes can share the same queue.
+
+    python music_rec/worker.py -w 4
+    python music_rec/worker.py --job-types bulk_load export_table
+
+SIGTERM and SIGINT stop the workers after their current job. While a job runs a
+heartbeat thread keeps its heartbeat fresh, independent of how often the handler
+reports progress.
+"""
+import os
+import time
+import signal
+import socket
+import logging
+import argparse
+import threading
+import traceback
+import multiprocessing as mp
+
+import core.config as cfg
+
+logger = logging.getLogger("job_worker")
+
+PROGRESS_INTERVAL_SEC = 1.0
+
+
+class ProgressReporter:
+    """
+    Progress callback handed to the job handlers. Writes are throttled to one per
+    PROGRESS_INTERVAL_SEC. `checkpoint` is the checkpoint saved by the previous attempt
+    and `save_checkpoint` stores a new one in the transaction of the handler's writes.
+    """
+
+    def __init__(self, postgres_conn, job_id: int, worker_id: str, checkpoint: dict = None):
+        self.postgres_conn = postgres_conn
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.checkpoint = checkpoint or {}
+        self.last_update = 0.0
+        # set by the heartbeat thread when the job was reclaimed by another worker
+        self.lost = False
+
+    def _check_owner(self, owned: bool) -> None:
+        if not owned or self.lost:
+            self.lost = True
+            raise RuntimeError(f"Job {self.job_id} is no longer owned by worker {self.worker_id}")
+
+    def __call__(self, fraction: float, message: str = None) -> None:
+        from api.jobs import update_job_progress
+
+        self._check_owner(True)
+        now = time.monotonic()
+        if now - self.last_update < PROGRESS_INTERVAL_SEC and fraction < 1.0:
+            return
+        self.last_update = now
+        self._check_owner(update_job_progress(self.postgres_conn, self.job_id, self.worker_id, fraction, message))
+
+    def save_checkpoint(self, conn, checkpoint: dict) -> None:
+        """Save a checkpoint with conn, committed by the handler together with its work."""
+        from api.jobs import save_job_checkpoint
+
+        with conn.cursor() as cursor:
+            self._check_owner(save_job_checkpoint(cursor, self.job_id, self.worker_id, checkpoint))
+        self.checkpoint = checkpoint
+
+
+class Heartbeat(threading.Thread):
+    """Refreshes the heartbeat of a running job every `interval` seconds until stopped."""
+
+    def __init__(self, reporter: ProgressReporter, interval: float):
+        super().__init__(name=f"heartbeat-{reporter.job_id}", daemon=True)
+        self.reporter = reporter
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        from api.jobs import heartbeat_job
+
+        while not self.stopped.wait(self.interval):
+            if not heartbeat_job(self.reporter.postgres_conn, self.reporter.job_id, self.reporter.worker_id):
+                logger.warning("Job %s was reclaimed from worker %s", self.reporter.job_id, self.reporter.worker_id)
+                self.reporter.lost = True
+                return
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.join()
+
+
+def run_job(postgres_conn, job: dict, worker_id: str, heartbeat_interval: float = 60) -> None:
+    """Run one claimed job with a heartbeat thread and record its result or failure."""
+    from api.jobs import complete_job, fail_job
+    from api.job_handlers import JOB_HANDLERS
+
+    handler = JOB_HANDLERS.get(job["job_type"])
+    logger.info("Worker %s running job %s (%s) attempt %s/%s", worker_id, job["id"],
+                job["job_type"], job["attempts"], job["max_attempts"])
+    reporter = ProgressReporter(postgres_conn, job["id"], worker_id, job.get("checkpoint"))
+    heartbeat = Heartbeat(reporter, heartbeat_interval)
+    heartbeat.start()
+    try:
+        if handler is None:
+            raise ValueError(f"No handler registered for job type {job['job_type']}")
+        result = handler(postgres_conn, job["payload"], reporter)
+    except Exception as exception:
+        logger.debug(traceback.format_exc())
+        fail_job(postgres_conn, job["id"], worker_id, f"{type(exception).__name__}: {exception}")
+        return
+    finally:
+        heartbeat.stop()
+    complete_job(postgres_conn, job["id"], worker_id, result)
+
+
+def worker_loop(index: int, job_types: list, poll_interval: float, stale_after: float) -> None:
+    """Claim and run jobs until SIGTERM or SIGINT."""
+    cfg.setup_logging()
+    cfg.init_storage_dirs()
+    from core.setup import postgres_conn, close_postgres_pool
+    from api.jobs import create_jobs_table, claim_job
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+    # several heartbeats per stale period so one slow update does not get the job reclaimed
+    heartbeat_interval = max(stale_after / 3, 1.0)
+    stopping = False
+
+    def stop(signum, _frame):
+        nonlocal stopping
+        stopping = True
+        logger.info("Worker %s received signal %s, stopping after the current job", worker_id, signum)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    create_jobs_table(postgres_conn)
+    logger.info("Worker %s polling for jobs", worker_id)
+    try:
+        while not stopping:
+            job = claim_job(postgres_conn, worker_id, job_types, stale_after)
+            if job is None:
+                time.sleep(poll_interval)
+                continue
+            run_job(postgres_conn, job, worker_id, heartbeat_interval)
+    finally:
+        close_postgres_pool()
+        logger.info("Worker %s stopped", worker_id)
+
+
+def main():
+    parser = argparse.ArgumentParser("Run background job workers")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help="number of worker processes. (default: %(default)s)")
+    parser.add_argument('--job-types', type=str, nargs='+', default=None,
+                        help="only run these job types. (default: all)")
+    parser.add_argument('--poll-interval', type=float, default=1.0,
+                        help="seconds to wait when the queue is empty. (default: %(default)s)")
+    parser.add_argument('--stale-after', type=float, default=300,
+                        help="seconds without heartbeat before a running job is reclaimed. (default: %(default)s)")
+    args = parser.parse_args()
+
+    if args.workers == 1:
+        worker_loop(0, args.job_types, args.poll_interval, args.stale_after)
+        return
+
+    ctx = mp.get_context("spawn")
+    processes = [ctx.Process(target=worker_loop, name=f"job-worker-{i}",
+                             args=(i, args.job_types, args.poll_interval, args.stale_after))
+                 for i in range(args.workers)]
+    for proc in processes:
+        proc.start()
+    # the children get the signals of the process group and finish their current job
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, _frame: [proc.terminate() for proc in processes])
+    for proc in processes:
+        proc.join()
+
+
+if __name__ == "__main__":
+    main()
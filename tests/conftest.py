@@ -0,0 +1,17 @@
+"""
+Shared pytest setup
+
+The app modules import each other relative to music_rec/ and the tests reuse the
+PostgreSQL stub and startup profile of benchmarks/, so both go on sys.path. Every test
+session gets its own storage dir so tests never write to volumes/.
+"""
+import os
+import sys
+import tempfile
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TESTS_DIR)
+
+sys.path.insert(0, os.path.join(REPO_DIR, "music_rec"))
+sys.path.insert(0, os.path.join(REPO_DIR, "benchmarks"))
+os.environ.setdefault("ROOT_STORAGE_DIR", tempfile.mkdtemp(prefix="music_rec_tests_"))
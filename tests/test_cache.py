@@ -0,0 +1,53 @@
+"""
+utils.cache.LRUCache ttl and eviction
+"""
+import time
+
+from utils.cache import LRUCache
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    assert cache.set("a", 1) is None
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    assert cache.set("c", 3) == ("b", 2)
+    assert cache.get("b") is None
+    assert [key for key, _ in cache.items()] == ["a", "c"]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_entries_expire_after_ttl():
+    cache = LRUCache(default_ttl=0.05)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=10)
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert "a" not in cache and "b" in cache
+    assert cache.pop("b") == 2 and len(cache) == 0
+
+
+def test_sliding_ttl_restarts_on_get():
+    cache = LRUCache(default_ttl=0.15, sliding=True)
+    cache.set("a", 1)
+    for _ in range(4):
+        time.sleep(0.05)
+        assert cache.get("a") == 1
+    time.sleep(0.2)
+    assert cache.get("a") is None
+
+
+def test_on_expire_is_called_for_dropped_entries():
+    expired = []
+    cache = LRUCache(default_ttl=0.05, on_expire=lambda key, value: expired.append((key, value)))
+    cache.set("a", 1)
+    cache.set("b", 2)
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    cache.set("c", 3)
+    assert expired == [("a", 1), ("b", 2)]
+    assert len(cache) == 1
+    time.sleep(0.1)
+    assert cache.expire() == 1
+    assert expired[-1] == ("c", 3)
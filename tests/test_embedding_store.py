@@ -0,0 +1,81 @@
+"""
+api.vector_store.embedding_store publishing and pruning
+"""
+import os
+import time
+
+import numpy as np
+import pytest
+
+from api.vector_store.embedding_store import (
+    STALE_TMP_SEC, TMP_PREFIX, VERSIONS_DIR, MmapEmbeddingStore, prune_versions,
+    publish_embeddings, read_current_version)
+
+
+def test_publish_makes_version_current_and_readable(tmp_path):
+    embeddings = np.arange(12, dtype=np.float32).reshape(4, 3)
+    version = publish_embeddings(["d", "a", "c", "b"], embeddings, store_dir=str(tmp_path), keep_versions=0)
+    assert read_current_version(str(tmp_path)) == version
+    store = MmapEmbeddingStore(str(tmp_path))
+    assert store.version == version and store.dim == 3 and len(store) == 4
+    np.testing.assert_array_equal(store.get("c"), embeddings[2])
+    assert store.get("missing") is None
+    found, vectors = store.get_many(["b", "missing", "d"])
+    assert list(found) == ["b", "d"]
+    np.testing.assert_array_equal(vectors, embeddings[[3, 0]])
+
+
+def test_publish_rejects_bad_input(tmp_path):
+    with pytest.raises(ValueError):
+        publish_embeddings(["a", "a"], np.zeros((2, 3)), store_dir=str(tmp_path))
+    with pytest.raises(ValueError):
+        publish_embeddings(["a"], np.zeros((2, 3)), store_dir=str(tmp_path))
+    assert read_current_version(str(tmp_path)) is None
+
+
+def test_store_refresh_picks_up_new_version(tmp_path):
+    publish_embeddings(["a"], np.ones((1, 2)), store_dir=str(tmp_path), keep_versions=0)
+    store = MmapEmbeddingStore(str(tmp_path), refresh_interval=0)
+    version = publish_embeddings(["a"], np.full((1, 2), 2.0), store_dir=str(tmp_path), keep_versions=0)
+    np.testing.assert_array_equal(store.get("a"), [2.0, 2.0])
+    assert store.version == version
+
+
+def test_prune_keeps_newest_versions_and_sweeps_stale_staging(tmp_path):
+    store_dir = str(tmp_path)
+    versions = [publish_embeddings(["a"], np.ones((1, 2)), store_dir=store_dir, keep_versions=0)
+                for _ in range(4)]
+    assert versions == sorted(versions) and len(set(versions)) == 4
+    versions_dir = os.path.join(store_dir, VERSIONS_DIR)
+    stale = os.path.join(versions_dir, f"{TMP_PREFIX}stale")
+    fresh = os.path.join(versions_dir, f"{TMP_PREFIX}fresh")
+    os.makedirs(stale)
+    os.makedirs(fresh)
+    old = time.time() - STALE_TMP_SEC - 10
+    os.utime(stale, (old, old))
+
+    assert sorted(prune_versions(store_dir, keep=2)) == versions[:2]
+    assert sorted(os.listdir(versions_dir)) == [f"{TMP_PREFIX}fresh"] + versions[2:]
+
+
+def test_prune_never_removes_current_version(tmp_path):
+    store_dir = str(tmp_path)
+    versions = [publish_embeddings(["a"], np.ones((1, 2)), store_dir=store_dir, version=name, keep_versions=0)
+                for name in ("v2", "v1")]
+    assert read_current_version(store_dir) == "v1"
+    assert prune_versions(store_dir, keep=1) == []
+    assert sorted(os.listdir(os.path.join(store_dir, VERSIONS_DIR))) == sorted(versions)
+
+
+@pytest.mark.parametrize("version", ["../../escaped", "a/b", "..", ".hidden", "v1..v2", ""])
+def test_publish_rejects_unsafe_version_names(tmp_path, version):
+    store_dir = tmp_path / "store"
+    with pytest.raises(ValueError):
+        publish_embeddings(["a"], np.ones((1, 2)), store_dir=str(store_dir), version=version)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_refresh_ignores_unsafe_current_version(tmp_path):
+    (tmp_path / "CURRENT").write_text("../outside")
+    store = MmapEmbeddingStore(str(tmp_path))
+    assert store.version is None
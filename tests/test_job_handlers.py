@@ -0,0 +1,13 @@
+"""
+api.job_handlers payload validation
+"""
+import pytest
+
+from api.job_handlers import publish_track_embeddings
+
+
+@pytest.mark.parametrize("version", ["../../escaped", "a/b", "v1..v2", 3])
+def test_publish_embeddings_rejects_unsafe_versions(version):
+    payload = {"ids_file": "ids.json", "embeddings_file": "embeddings.npy", "version": version}
+    with pytest.raises(ValueError, match="Invalid embedding version"):
+        publish_track_embeddings(None, payload, lambda *_: None)
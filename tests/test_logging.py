@@ -0,0 +1,48 @@
+"""
+models.logging JSONFormatter and InfoSamplingFilter
+"""
+import sys
+import json
+import logging
+
+from models.logging import InfoSamplingFilter, JSONFormatter
+
+
+def _record(level: int = logging.INFO, msg: str = "hello %s", args: tuple = ("world",), **extra):
+    record = logging.LogRecord("test", level, __file__, 10, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter_renders_message_and_extras():
+    line = JSONFormatter().format(_record(job_id=7))
+    log = json.loads(line)
+    assert log["message"] == "hello world"
+    assert log["level"] == "INFO"
+    assert log["logger"] == "test"
+    assert log["job_id"] == 7
+    assert "args" not in log and "msg" not in log
+
+
+def test_json_formatter_includes_exception():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = logging.LogRecord("test", logging.ERROR, __file__, 10, "failed", (), None)
+        record.exc_info = sys.exc_info()
+    log = json.loads(JSONFormatter().format(record))
+    assert "ValueError: boom" in log["exc_info"]
+
+
+def test_info_sampling_filter_keeps_every_nth_info():
+    sampler = InfoSamplingFilter(rate=0.25)
+    kept = [sampler.filter(_record()) for _ in range(8)]
+    assert kept == [True, False, False, False, True, False, False, False]
+
+
+def test_info_sampling_filter_passes_other_levels():
+    sampler = InfoSamplingFilter(rate=0)
+    assert not sampler.filter(_record())
+    assert sampler.filter(_record(logging.WARNING))
+    assert sampler.filter(_record(logging.DEBUG))
+    assert all(InfoSamplingFilter(rate=1).filter(_record()) for _ in range(3))
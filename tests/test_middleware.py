@@ -0,0 +1,114 @@
+"""
+core.middleware.ResponseCacheMiddleware hits, misses, ETags and bypasses
+"""
+import pytest
+from fastapi import FastAPI, Response
+from fastapi.testclient import TestClient
+
+from core.middleware import ResponseCacheMiddleware, make_cache_key
+
+
+@pytest.fixture
+def app_calls():
+    calls = []
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    def get_item(item_id: int, q: str = ""):
+        calls.append(item_id)
+        return {"item_id": item_id, "q": q, "call": len(calls)}
+
+    @app.get("/items/{item_id}/missing")
+    def missing(item_id: int, response: Response):
+        calls.append(item_id)
+        response.status_code = 404
+        return {"detail": "not found"}
+
+    @app.post("/search")
+    def search(body: dict):
+        calls.append(body)
+        return {"call": len(calls)}
+
+    @app.get("/uncached")
+    def uncached():
+        calls.append(None)
+        return {"call": len(calls)}
+
+    app.add_middleware(ResponseCacheMiddleware, route_ttls={"GET /items": 60, "POST /search": 60})
+    return TestClient(app), calls
+
+
+def test_miss_then_hit(app_calls):
+    client, calls = app_calls
+    first = client.get("/items/1?q=a&x=1")
+    second = client.get("/items/1?x=1&q=a")
+    assert first.headers["x-cache"] == "MISS"
+    assert second.headers["x-cache"] == "HIT"
+    assert first.json() == second.json()
+    assert first.headers["etag"] == second.headers["etag"]
+    assert len(calls) == 1
+    assert client.get("/items/2").headers["x-cache"] == "MISS"
+    assert len(calls) == 2
+
+
+def test_if_none_match_gets_304(app_calls):
+    client, _ = app_calls
+    etag = client.get("/items/1").headers["etag"]
+    response = client.get("/items/1", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert client.get("/items/1", headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_post_body_is_part_of_the_key(app_calls):
+    client, calls = app_calls
+    assert client.post("/search", json={"a": 1}).headers["x-cache"] == "MISS"
+    assert client.post("/search", json={"a": 1}).headers["x-cache"] == "HIT"
+    assert client.post("/search", json={"a": 2}).headers["x-cache"] == "MISS"
+    assert len(calls) == 2
+
+
+def test_cache_control_and_uncacheable_responses(app_calls):
+    client, calls = app_calls
+    client.get("/items/1")
+    assert client.get("/items/1", headers={"Cache-Control": "no-cache"}).headers["x-cache"] == "MISS"
+    assert "x-cache" not in client.get("/items/1", headers={"Cache-Control": "no-store"}).headers
+    assert len(calls) == 3
+    for _ in range(2):
+        response = client.get("/items/1/missing")
+        assert response.status_code == 404
+        assert "x-cache" not in response.headers
+    assert "x-cache" not in client.get("/uncached").headers
+    assert len(calls) == 6
+
+
+def test_cache_key_ignores_query_order():
+    assert make_cache_key("GET", "/a", b"x=1&y=2", b"") == make_cache_key("GET", "/a", b"y=2&x=1", b"")
+    assert make_cache_key("POST", "/a", b"", b"{}") != make_cache_key("POST", "/a", b"", b"[]")
+
+
+def test_probe_metrics_and_session_routes_are_never_cached():
+    calls = []
+    app = FastAPI()
+
+    @app.get("/readyz")
+    def readyz():
+        calls.append("readyz")
+        return {"call": len(calls)}
+
+    @app.get("/sessions/{session_id}/next")
+    def next_tracks(session_id: str):
+        calls.append(session_id)
+        return {"call": len(calls)}
+
+    @app.get("/")
+    def root():
+        return {}
+
+    app.add_middleware(ResponseCacheMiddleware, route_ttls={"GET /": 60})
+    client = TestClient(app)
+    for path in ("/readyz", "/readyz", "/sessions/s1/next", "/sessions/s1/next"):
+        assert "x-cache" not in client.get(path).headers
+    assert len(calls) == 4
+    client.get("/")
+    assert client.get("/").headers["x-cache"] == "HIT"
@@ -0,0 +1,31 @@
+"""
+api.pgsql script validation
+"""
+import pytest
+
+from api.pgsql import is_sql_allowed
+
+RESTRICTED = ["DROP", "DELETE", "TRUNCATE", "ALTER"]
+
+
+@pytest.mark.parametrize("script", [
+    "SELECT updated_at, deleted_at FROM t",
+    "SELECT * FROM t WHERE track_name = 'Drop It Like It''s Hot'",
+    "SELECT * FROM t -- never DROP anything\nWHERE x = 1",
+    "SELECT /* delete later */ * FROM t",
+])
+def test_allows_keywords_in_names_literals_and_comments(script):
+    assert is_sql_allowed(script, RESTRICTED)
+
+
+@pytest.mark.parametrize("script", [
+    "DROP TABLE t",
+    "SELECT 'it''s'; delete FROM t",
+    "SELECT '--'; DROP TABLE t",
+])
+def test_rejects_restricted_commands(script):
+    assert not is_sql_allowed(script, RESTRICTED)
+
+
+def test_no_restricted_commands_allows_everything():
+    assert is_sql_allowed("DROP TABLE t", [])
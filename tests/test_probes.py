@@ -0,0 +1,66 @@
+"""
+/healthz liveness and /readyz readiness probes, with the database pool replaced by the PostgreSQL stub
+"""
+from contextlib import contextmanager
+
+import psycopg
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+from pg_stub import StubConnection
+
+
+class StubPool:
+    """psycopg_pool.ConnectionPool stand-in, raises `error` instead of connecting when set."""
+
+    def __init__(self, error: Exception = None):
+        self.error = error
+
+    @contextmanager
+    def connection(self, timeout=None):
+        if self.error is not None:
+            raise self.error
+        yield StubConnection()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr("core.setup.get_postgres_pool", lambda: StubPool())
+    monkeypatch.setattr(server.music_rec.state, "ready", True, raising=False)
+    return TestClient(server.music_rec)
+
+
+def test_healthz(client):
+    response = client.get("/healthz")
+    assert response.status_code == 200
+    assert response.json()["message"] == "alive"
+
+
+def test_readyz_ready(client):
+    response = client.get("/readyz")
+    assert response.status_code == 200
+    assert response.json()["data"]["database"] is True
+
+
+def test_readyz_not_started(client, monkeypatch):
+    monkeypatch.setattr(server.music_rec.state, "ready", False)
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    assert response.json()["data"]["started"] is False
+
+
+def test_readyz_draining(client, monkeypatch):
+    monkeypatch.setattr(server, "is_draining", lambda: True)
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    assert response.json()["data"]["draining"] is True
+    assert client.get("/healthz").status_code == 200
+
+
+def test_readyz_database_unreachable(client, monkeypatch):
+    monkeypatch.setattr("core.setup.get_postgres_pool",
+                        lambda: StubPool(psycopg.OperationalError("connection refused")))
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    assert response.json()["data"]["database"] is False
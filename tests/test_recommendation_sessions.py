@@ -0,0 +1,123 @@
+"""
+api.recommendation_sessions feedback math, recommendations and persistence
+"""
+import time
+
+import numpy as np
+import pytest
+
+from api.recommendation_sessions import SessionRecommender
+from api.vector_store.vector_index import BruteForceIndex
+
+IDS = [f"t{i}" for i in range(6)]
+EMBEDDINGS = np.eye(6, dtype=np.float32)
+
+
+def _lookup(track_ids):
+    found = [track_id for track_id in track_ids if track_id in IDS]
+    return found, EMBEDDINGS[[IDS.index(track_id) for track_id in found]].reshape(len(found), 6)
+
+
+def _recommender(persist_dir=None, version=lambda: "v1", **kwargs) -> SessionRecommender:
+    index = BruteForceIndex(IDS, EMBEDDINGS)
+    return SessionRecommender(lookup=_lookup, index=lambda: index, version=version,
+                              persist_dir=persist_dir, decay=0.5, skip_weight=0.25, **kwargs)
+
+
+def test_seeds_are_decayed_in_playlist_order():
+    session = _recommender().create(["t0", "t1", "unknown"])
+    np.testing.assert_allclose(session.accepted, [0.5, 1, 0, 0, 0, 0])
+    np.testing.assert_allclose(session.skipped, np.zeros(6))
+
+
+def test_feedback_updates_decayed_sums():
+    recommender = _recommender()
+    session = recommender.create(["t0"])
+    recommender.feedback(session, "t2", accepted=True)
+    recommender.feedback(session, "t3", accepted=False)
+    recommender.feedback(session, "t4", accepted=False)
+    np.testing.assert_allclose(session.accepted, [0.5, 0, 1, 0, 0, 0])
+    np.testing.assert_allclose(session.skipped, [0, 0, 0, 0.125, 0.25, 0])
+    assert session.seen == {"t0", "t2", "t3", "t4"}
+    query = session.query_vector()
+    assert query[2] > query[0] > 0 > query[3] > query[4]
+
+
+def test_recommend_excludes_seen_tracks():
+    recommender = _recommender()
+    session = recommender.create(["t0"])
+    recommender.feedback(session, "t1", accepted=True)
+    recommended = [track_id for track_id, _ in recommender.recommend(session, k=3)]
+    assert not {"t0", "t1"} & set(recommended)
+    assert len(recommended) == 3
+
+
+def test_create_without_known_seeds_fails():
+    with pytest.raises(LookupError):
+        _recommender().create(["unknown"])
+
+
+def test_new_embedding_version_replays_session():
+    versions = ["v1"]
+    recommender = _recommender(version=lambda: versions[0])
+    session = recommender.create(["t0"])
+    recommender.feedback(session, "t1", accepted=True)
+    expected = session.accepted.copy()
+    session.accepted[:] = 0
+    versions[0] = "v2"
+    recommender.recommend(session)
+    assert session.embedding_version == "v2"
+    np.testing.assert_allclose(session.accepted, expected)
+
+
+def test_sessions_are_shared_through_the_persist_dir(tmp_path):
+    worker_a, worker_b = _recommender(str(tmp_path)), _recommender(str(tmp_path))
+    session = worker_a.create(["t0"])
+    shared = worker_b.get(session.session_id)
+    worker_b.feedback(shared, "t2", accepted=True)
+    reloaded = worker_a.get(session.session_id)
+    assert list(reloaded.events) == [("t2", True)]
+    np.testing.assert_allclose(reloaded.accepted, shared.accepted)
+    assert worker_b.delete(session.session_id)
+    assert worker_a.get(session.session_id) is None
+
+
+def test_evicted_session_is_loaded_back(tmp_path):
+    recommender = _recommender(str(tmp_path), max_entries=1)
+    session = recommender.create(["t0"])
+    recommender.feedback(session, "t1", accepted=False)
+    recommender.create(["t2"])
+    restored = recommender.get(session.session_id)
+    assert restored is not session
+    np.testing.assert_allclose(restored.skipped, session.skipped)
+    assert restored.updated_at == session.updated_at
+    assert recommender.get("not-a-session-id") is None
+
+
+def test_idle_session_expires_and_its_file_is_deleted(tmp_path):
+    recommender = _recommender(str(tmp_path), ttl=0.05)
+    session = recommender.create(["t0"])
+    recommender.feedback(session, "t1", accepted=True)
+    time.sleep(0.1)
+    assert recommender.get(session.session_id) is None
+    assert _recommender(str(tmp_path), ttl=0.05).get(session.session_id) is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_reads_keep_a_session_alive_for_all_workers(tmp_path):
+    recommender = _recommender(str(tmp_path), ttl=0.3)
+    session = recommender.create(["t0"])
+    for _ in range(6):
+        time.sleep(0.1)
+        assert recommender.get(session.session_id) is not None
+    assert _recommender(str(tmp_path), ttl=0.3).get(session.session_id) is not None
+
+
+def test_sweep_deletes_expired_session_files(tmp_path):
+    recommender = _recommender(str(tmp_path), ttl=0.05)
+    recommender.create(["t0"])
+    recommender.create(["t1"])
+    assert recommender.sweep_expired() == 0
+    time.sleep(0.1)
+    assert recommender.sweep_expired() == 2
+    assert list(tmp_path.iterdir()) == []
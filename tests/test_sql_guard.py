@@ -0,0 +1,99 @@
+"""
+api.sql_guard statement checks, LIMIT injection and plan checks, against the PostgreSQL stub
+"""
+import json
+
+import pytest
+
+from api.sql_guard import SQLGuardError, apply_limit, normalize_query, run_guarded_query
+from pg_stub import stub_postgres_conn
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("SELECT * FROM t", "SELECT * FROM (SELECT * FROM t) AS _guarded LIMIT 5"),
+    ("SELECT * FROM t ORDER BY x FETCH FIRST 50 ROWS ONLY",
+     "SELECT * FROM (SELECT * FROM t ORDER BY x FETCH FIRST 50 ROWS ONLY) AS _guarded LIMIT 5"),
+    ("SELECT * FROM t OFFSET 10 FETCH NEXT 3 ROWS ONLY",
+     "SELECT * FROM (SELECT * FROM t OFFSET 10 FETCH NEXT 3 ROWS ONLY) AS _guarded LIMIT 5"),
+    ("SELECT * FROM t LIMIT 20", "SELECT * FROM t LIMIT 20"),
+    ("SELECT * FROM t LIMIT 5000 OFFSET 10", "SELECT * FROM t LIMIT 100 OFFSET 10"),
+    ("SELECT * FROM t OFFSET 10 LIMIT ALL", "SELECT * FROM t OFFSET 10 LIMIT 100"),
+    ("SELECT * FROM (SELECT * FROM t LIMIT 3) s",
+     "SELECT * FROM (SELECT * FROM (SELECT * FROM t LIMIT 3) s) AS _guarded LIMIT 5"),
+])
+def test_apply_limit(query, expected):
+    assert apply_limit(query, limit=5, max_rows=100) == expected
+
+
+@pytest.mark.parametrize("query", [
+    "DELETE FROM t",
+    "SELECT 1; DROP TABLE t",
+    "WITH d AS (DELETE FROM t RETURNING *) SELECT * FROM d",
+    "UPDATE t SET x = 1",
+])
+def test_normalize_rejects_writes_and_multiple_statements(query):
+    with pytest.raises(SQLGuardError):
+        normalize_query(query)
+
+
+def test_normalize_allows_columns_containing_keywords():
+    assert normalize_query("SELECT created_at, last_updated FROM t;") == "SELECT created_at, last_updated FROM t"
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT * FROM t WHERE track_name = 'Call Me Maybe'",
+    "SELECT * FROM t WHERE track_name ILIKE '%do it%'",
+    "SELECT * FROM t WHERE track_name = 'Stop; Drop It'",
+    "SELECT * FROM t WHERE artist_name = 'Guns N'' Roses -- Live'",
+])
+def test_normalize_ignores_keywords_in_string_literals(query):
+    assert normalize_query(query) == query
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("SELECT * FROM t -- top rows", "SELECT * FROM (SELECT * FROM t) AS _guarded LIMIT 5"),
+    ("SELECT * FROM t /* all */ LIMIT 3; -- done", "SELECT * FROM t   LIMIT 3"),
+    ("SELECT * FROM t\n-- DROP TABLE t\nWHERE x = '--'",
+     "SELECT * FROM (SELECT * FROM t\n \nWHERE x = '--') AS _guarded LIMIT 5"),
+])
+def test_comments_are_stripped_before_limit_injection(query, expected):
+    assert apply_limit(normalize_query(query), limit=5, max_rows=100) == expected
+
+
+def test_comments_cannot_hide_a_second_statement():
+    with pytest.raises(SQLGuardError):
+        normalize_query("SELECT 1 /* ; */; DROP TABLE t")
+
+
+def _plan(cost: float, rows: int) -> list:
+    return [([{"Plan": {"Total Cost": cost, "Plan Rows": rows, "Node Type": "Limit"}}],)]
+
+
+def test_run_guarded_query_returns_rows_of_limited_query():
+    postgres_conn = stub_postgres_conn(rows=_plan(10.0, 5))
+    result = run_guarded_query(postgres_conn, "SELECT * FROM t", limit=5, max_rows=100, max_cost=100.0)
+    assert result["status"] == "success"
+    assert result["data"]["query"] == "SELECT * FROM (SELECT * FROM t) AS _guarded LIMIT 5"
+    assert result["data"]["estimate"] == {"total_cost": 10.0, "plan_rows": 5, "node_type": "Limit"}
+
+
+def test_run_guarded_query_accepts_plan_as_text():
+    postgres_conn = stub_postgres_conn(rows=[(json.dumps(_plan(10.0, 5)[0][0]),)])
+    result = run_guarded_query(postgres_conn, "SELECT 1", max_cost=100.0)
+    assert result["status"] == "success"
+
+
+def test_run_guarded_query_rejects_expensive_plans():
+    postgres_conn = stub_postgres_conn(rows=_plan(1000.0, 50))
+    result = run_guarded_query(postgres_conn, "SELECT * FROM t LIMIT 50", max_rows=100, max_cost=100.0)
+    assert result["status"] == "failed"
+    assert "too expensive" in result["message"]
+    # SET TRANSACTION, statement_timeout and EXPLAIN, the query itself never ran
+    assert postgres_conn.conn.statements == 3
+
+
+def test_run_guarded_query_rejects_without_touching_the_database():
+    postgres_conn = stub_postgres_conn()
+    result = run_guarded_query(postgres_conn, "DROP TABLE t")
+    assert result["status"] == "failed"
+    assert postgres_conn.conn.statements == 0
@@ -0,0 +1,12 @@
+"""
+Cold start budget of the server import, see benchmarks/bench_startup.py
+"""
+import os
+
+from bench_startup import check_startup
+
+
+def test_server_import_within_budget():
+    budget = float(os.getenv("STARTUP_IMPORT_BUDGET_SEC", "1.5"))
+    stats, _, _, failures = check_startup(runs=3, budget=budget)
+    assert not failures, f"{failures} (p50={stats['p50_ms']:.0f}ms)"
@@ -0,0 +1,40 @@
+"""
+api.vector_store.vector_index exact and approximate search
+"""
+import numpy as np
+
+from api.vector_store.vector_index import BruteForceIndex, IVFIndex
+
+
+def _clustered(n_clusters: int = 20, per_cluster: int = 100, dim: int = 16, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim))
+    matrix = np.repeat(centers, per_cluster, axis=0) + 0.1 * rng.normal(size=(n_clusters * per_cluster, dim))
+    return [f"t{i}" for i in range(len(matrix))], matrix.astype(np.float32)
+
+
+def test_bruteforce_returns_exact_neighbours_best_first():
+    ids, matrix = _clustered()
+    index = BruteForceIndex(ids, matrix)
+    result = index.search(matrix[5], k=5)[0]
+    assert result[0][0] == "t5"
+    assert np.isclose(result[0][1], 1.0, atol=1e-5)
+    assert [score for _, score in result] == sorted((score for _, score in result), reverse=True)
+    assert "t5" not in [track_id for track_id, _ in index.search(matrix[5], k=5, exclude=["t5"])[0]]
+
+
+def test_ivf_recall_against_bruteforce():
+    ids, matrix = _clustered()
+    queries = matrix[::97] + 0.05
+    exact = BruteForceIndex(ids, matrix).search(queries, k=10)
+    approx = IVFIndex(ids, matrix, n_lists=20, n_probe=4).search(queries, k=10)
+    hits = sum(len({t for t, _ in e} & {t for t, _ in a}) for e, a in zip(exact, approx))
+    assert hits / (10 * len(queries)) >= 0.9
+
+
+def test_ivf_probing_all_lists_is_exact():
+    ids, matrix = _clustered(n_clusters=5, per_cluster=40)
+    queries = matrix[::13]
+    exact = BruteForceIndex(ids, matrix).search(queries, k=5, exclude=["t0"])
+    approx = IVFIndex(ids, matrix, n_lists=8, n_probe=8).search(queries, k=5, exclude=["t0"])
+    assert [[t for t, _ in r] for r in approx] == [[t for t, _ in r] for r in exact]